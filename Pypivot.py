@@ -1,446 +1,4808 @@
+import bz2
+import csv
+import glob
+import gzip
+import hashlib
+import heapq
+import io
+import json
+import lzma
+import math
+import mmap
+import multiprocessing
+import operator
+import os
+import pickle
+import random
+import re
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+import unicodedata
+from array import array
+from collections import Counter, OrderedDict
+from contextlib import contextmanager
+from datetime import date
+from functools import reduce
+from itertools import chain, combinations, compress, count, islice, repeat, zip_longest
+from statistics import NormalDist
+
+try:
+    import numpy
+except ImportError:  # NumPy 是可选依赖；没有时使用纯 Python 的聚合路径
+    numpy = None
+
 # Step 1: Loading Data from CSV File
 # 第一步，加载数据，由于数据不能使用pandas，openxl等库，只能用这种方式-利用csv文件加载。
+# 标准库的 csv 模块可以使用：它按 RFC-4180 处理引号（字段内的逗号、双引号转义），
+# 并且解析在 C 中完成，比手写的 split(",") 更快也更正确。
+
+# 每批返回的行数；峰值内存只与批大小有关，与文件大小无关。
+DEFAULT_BATCH_SIZE = 10000
+# 读文件时使用的缓冲区大小（字节）。
+READ_BUFFER_SIZE = 1 << 20
+
+
+# 按扩展名识别的压缩格式及其打开函数
+COMPRESSION_CODECS = {".gz": gzip.open, ".bz2": bz2.open, ".xz": lzma.open}
+
+
+def _codec(file_path):
+    """返回文件的解压打开函数；不是压缩文件时返回 None。"""
+    return COMPRESSION_CODECS.get(os.path.splitext(file_path)[1].lower())
+
+
+def _open_csv(file_path):
+    """
+    以带缓冲的方式打开 CSV 文件，返回 (文件对象, csv 读取器)。压缩文件（.gz/.bz2/.xz）边读边解压。
+
+    newline='' 是 csv 模块的要求，这样引号内的换行才能被正确识别。
+    """
+    codec = _codec(file_path)
+    if codec is None:
+        file = open(file_path, "r", newline="", buffering=READ_BUFFER_SIZE)
+    else:
+        file = io.TextIOWrapper(io.BufferedReader(codec(file_path, "rb"), READ_BUFFER_SIZE), newline="")
+    return file, csv.reader(file)
+
+
+def expand_paths(file_path):
+    """
+    把输入展开为文件路径列表。
+
+    参数:
+        file_path (str 或 list of str): 文件路径、glob 模式（如 "Data/2024-01-*.csv.gz"），或它们的列表。
+
+    返回:
+        paths (list of str): 文件路径；每个 glob 模式的匹配结果按文件名排序。
+    """
+    patterns = [file_path] if isinstance(file_path, (str, os.PathLike)) else list(file_path)
+    paths = []
+    for pattern in map(os.fspath, patterns):
+        if any(ch in pattern for ch in "*?["):
+            # 跳过 load_table_snapshot 在数据文件旁边生成的快照
+            matches = sorted(path for path in glob.glob(pattern) if not path.endswith(SNAPSHOT_SUFFIX))
+            if not matches:
+                raise FileNotFoundError(f"没有匹配的文件: {pattern}")
+            paths.extend(matches)
+        else:
+            paths.append(pattern)
+    if not paths:
+        raise FileNotFoundError("没有输入文件")
+    return paths
+
+
+def _input_size(file_path):
+    """输入文件（磁盘上，压缩文件按压缩后）的总字节数。"""
+    return sum(os.path.getsize(path) for path in expand_paths(file_path))
+
+
+def read_header(file_path):
+    """
+    只读取 CSV 文件的第一行（列名）。
+
+    参数:
+        file_path (str 或 list of str): 文件的路径；有多个文件时读取第一个文件。
+
+    返回:
+        columns (list of str): 列名列表。
+    """
+    file, reader = _open_csv(expand_paths(file_path)[0])
+    with file:
+        return [col.strip() for col in next(reader, [])]
+
+
+# 行过滤条件支持的运算符
+FILTER_OPERATORS = {
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda cell, values: cell in values,
+    "not in": lambda cell, values: cell not in values,
+}
+
+_FILTER_PATTERN = re.compile(r"^\s*(.+?)\s*(==|!=|<=|>=|<|>|\snot\s+in\s|\sin\s)\s*(.+?)\s*$")
+# 文本过滤条件中 OR 分支的分隔符
+_OR_PATTERN = re.compile(r"\s+or\s+")
+
+
+def _parse_literal(text):
+    """把过滤条件中的值解析为数字，或去掉引号的字符串。"""
+    if len(text) >= 2 and text[0] == text[-1] and text[0] in "\"'":
+        return text[1:-1]
+    for convert in (int, float):
+        try:
+            return convert(text)
+        except ValueError:
+            continue
+    return text
+
+
+def parse_filter(text):
+    """
+    把文本形式的过滤条件解析为 (列名, 运算符, 值)。
+
+    例如 'Age >= 25'、'Employment == "Employee"'、'Age in 21,22'。数字按数值比较，其它按字符串比较。
+
+    参数:
+        text (str): 过滤条件。
+
+    返回:
+        condition (tuple): (列名, 运算符, 值)；in/not in 的值是元组。
+    """
+    match = _FILTER_PATTERN.match(text)
+    if match is None:
+        raise ValueError(f"无法解析的过滤条件: {text}")
+    column, op, value = match.groups()
+    op = " ".join(op.split())
+    if op in ("in", "not in"):
+        return column, op, tuple(_parse_literal(item.strip()) for item in value.split(","))
+    return column, op, _parse_literal(value)
+
+
+def normalize_filter(condition):
+    """
+    把一个过滤条件规范为 OR 组：[(列名, 运算符, 值), ...]，组内任一条件满足即可。
+
+    条件可以是 parse_filter 能解析的文本（用 " or " 连接多个分支，如 'Employment == Employee or Age < 25'）、
+    (列名, 运算符, 值) 元组，或这两者组成的列表（表示 OR）。多个过滤条件之间总是 AND。
+    """
+    if isinstance(condition, str):
+        return [parse_filter(part) for part in _OR_PATTERN.split(condition.strip())]
+    if isinstance(condition, list):
+        return [branch for item in condition for branch in normalize_filter(item)]
+    column, op, value = condition
+    if op not in FILTER_OPERATORS:
+        raise ValueError(f"未知的过滤运算符: {op}")
+    return [(column, op, tuple(value) if op in ("in", "not in") else value)]
+
+
+def _is_numeric_condition(op, value):
+    if op in ("in", "not in"):
+        return bool(value) and all(isinstance(item, (int, float)) for item in value)
+    return isinstance(value, (int, float))
+
+
+def _condition_test(op, value):
+    """
+    返回判断一个值是否满足条件的函数 test(cell)；加载时的原始字符串和已解析的值使用同一个判断，
+    所以边读边过滤（见 _compile_filters）与加载后过滤（见 Table.select）的结果相同。
+
+    数字条件把值转换为数字后比较，无法转换的值不满足条件；其它条件按文本比较
+    （已解析为数值/日期的值先转换为文本，ISO 日期的文本顺序就是时间顺序）。
+    """
+    compare = FILTER_OPERATORS[op]
+    if _is_numeric_condition(op, value):
+        def test(cell):
+            try:
+                cell = float(cell)
+            except (ValueError, TypeError):
+                return False
+            return compare(cell, value)
+    else:
+        def test(cell):
+            return compare(cell if isinstance(cell, str) else str(cell), value)
+    return test
+
+
+def _compile_filters(columns, filters):
+    """
+    把过滤条件编译为判断函数 keep(values)，直接作用于 csv 解析出的原始值列表，
+    在构造任何行对象之前丢弃不满足条件的行。没有过滤条件时返回 None。
+
+    参数:
+        columns (list of str): 文件的全部列名。
+        filters (iterable): 过滤条件（见 normalize_filter），彼此之间为 AND。
+    """
+    index = {col: i for i, col in enumerate(columns)}
+    groups = []
+    for condition in filters:
+        group = []
+        for column, op, value in normalize_filter(condition):
+            if column not in index:
+                raise KeyError(column)
+            group.append((index[column], _condition_test(op, value)))
+        groups.append(group)
+    if not groups:
+        return None
+
+    def keep(values):
+        width = len(values)
+        for group in groups:
+            for i, test in group:
+                if test(values[i] if i < width else ""):
+                    break
+            else:
+                return False
+        return True
+
+    return keep
+
+
+def _projector(header, columns):
+    """
+    返回 (选中的列名, 从原始值列表中取出选中列的函数)；不需要投影时函数为 None。
+    """
+    if columns is None or list(columns) == header:
+        return header, None
+    columns = list(columns)
+    missing = [col for col in columns if col not in header]
+    if missing:
+        raise KeyError(missing[0])
+    positions = [header.index(col) for col in columns]
+    width = max(positions) + 1
+
+    def project(values):
+        if len(values) < width:
+            values = values + [""] * (width - len(values))
+        return [values[i] for i in positions]
+
+    return columns, project
+
+
+def iter_csv_batches(file_path, batch_size=DEFAULT_BATCH_SIZE, as_dict=True, columns=None, filters=()):
+    """
+    以流式方式分批读取 CSV 文件，每次产出一批已解析的行。
+
+    有多个文件时（列表或 glob 模式，见 expand_paths）依次读取，每个文件按列名取出与第一个文件
+    相同的列，因此各文件的列顺序可以不同。每批只包含一个文件中的行。
+
+    参数:
+        file_path (str 或 list of str): 文件的路径、glob 模式或文件列表；压缩文件按扩展名识别。
+        batch_size (int): 每批的行数。
+        as_dict (bool): 为 True 时每行是 {列名: 值} 字典，否则是值列表（更省内存）。
+        columns (list of str): 只保留这些列（列投影）；为 None 时保留全部列。
+        filters (iterable): 行过滤条件（见 parse_filter），解析时即丢弃不满足条件的行。
+
+    产出:
+        batch (list of dict 或 list of list): 一批数据行。
+    """
+    if batch_size < 1:
+        raise ValueError("batch_size 必须是正整数")
+    paths = expand_paths(file_path)
+    if len(paths) > 1 and columns is None:
+        columns = read_header(paths[0])
+    for path in paths:
+        yield from _iter_file_batches(path, batch_size, as_dict, columns, filters)
+
+
+def _iter_file_batches(file_path, batch_size, as_dict, columns, filters):
+    """iter_csv_batches 对单个文件的实现。"""
+    file, reader = _open_csv(file_path)
+    with file:
+        header = [col.strip() for col in next(reader, [])]
+        keep = _compile_filters(header, filters)
+        columns, project = _projector(header, columns)
+        if keep is not None or project is not None:
+            reader = filter(None, reader)  # 先跳过空行
+        if keep is not None:
+            reader = filter(keep, reader)
+        if project is not None:
+            reader = map(project, reader)
+        batch = []
+        append = batch.append
+        for values in reader:
+            if not values:  # 跳过空行
+                continue
+            append(dict(zip(columns, values)) if as_dict else values)
+            if len(batch) >= batch_size:
+                yield batch
+                batch = []
+                append = batch.append
+        if batch:
+            yield batch
+
+
+def iter_csv_rows(file_path, batch_size=DEFAULT_BATCH_SIZE, columns=None, filters=()):
+    """
+    逐行产出 CSV 数据（字典形式），可以直接作为 data 参数传给透视表函数，
+    这样无需把整个文件读入内存。
+
+    参数:
+        file_path (str 或 list of str): 文件的路径、glob 模式或文件列表（见 iter_csv_batches）。
+        batch_size (int): 内部读取时每批的行数。
+        columns (list of str): 只保留这些列；为 None 时保留全部列。
+        filters (iterable): 行过滤条件（见 parse_filter）。
+
+    产出:
+        row (dict): 包含列名和值的字典。
+    """
+    for batch in iter_csv_batches(file_path, batch_size, columns=columns, filters=filters):
+        yield from batch
+
+
+# 推断列类型时检查的样本行数
+INFER_SAMPLE_ROWS = 1000
+
+
+def _parse_date(value):
+    """把 ISO 格式的日期（YYYY-MM-DD）解析为 date。"""
+    return value if isinstance(value, date) else date.fromisoformat(value)
+
+
+# 列类型及其解析函数。推断时按 int → float → date 的顺序尝试，都不符合时为 str
+COLUMN_TYPES = {"int": int, "float": float, "date": _parse_date, "str": None}
+# 解析失败时依次放宽到的类型
+_WIDER_TYPES = {"int": ("int", "float", "str"), "float": ("float", "str"), "date": ("date", "str"), "str": ("str",)}
+
+
+def infer_column_type(values):
+    """
+    根据样本值推断一列的类型。
+
+    参数:
+        values (list): 样本值（通常是字符串）。
+
+    返回:
+        kind (str): "int"、"float"、"date" 或 "str"。
+    """
+    for kind in ("int", "float", "date"):
+        parse = COLUMN_TYPES[kind]
+        try:
+            for value in values:
+                parse(value)
+        except (ValueError, TypeError):
+            continue
+        return kind
+    return "str"
+
+
+def _check_schema(schema):
+    for column, kind in (schema or {}).items():
+        if kind not in COLUMN_TYPES:
+            raise ValueError(f"列 '{column}' 的类型未知: {kind}（可选 {', '.join(COLUMN_TYPES)}）")
+    return dict(schema or {})
+
+
+def _parse_column(values, kind=None, strict=False):
+    """
+    把一列值解析为同一种类型，每个值只解析一次。
+
+    参数:
+        values (list): 列中的值。
+        kind (str): 列类型；为 None 时按前 INFER_SAMPLE_ROWS 个值推断。
+        strict (bool): 为 True 时（显式指定的类型）解析失败即报错，否则逐级放宽类型。
+
+    返回:
+        kind (str): 最终的类型。
+        parsed (list): 解析后的值。
+    """
+    if kind is None:
+        kind = infer_column_type(values[:INFER_SAMPLE_ROWS])
+    for candidate in ((kind,) if strict else _WIDER_TYPES[kind]):
+        parse = COLUMN_TYPES[candidate]
+        if parse is None:
+            return candidate, list(values)
+        try:
+            return candidate, [parse(value) for value in values]
+        except (ValueError, TypeError) as e:
+            if strict:
+                raise ValueError(f"值无法解析为 {kind}: {e}") from None
+    raise AssertionError("unreachable")
+
+
+def infer_schema(file_path, sample_rows=INFER_SAMPLE_ROWS, columns=None):
+    """
+    读取文件开头的样本行，推断每列的类型。
+
+    参数:
+        file_path (str 或 list of str): 文件的路径、glob 模式或文件列表；从第一个文件取样本。
+        sample_rows (int): 样本行数。
+        columns (list of str): 只推断这些列；为 None 时推断全部列。
+
+    返回:
+        schema (dict): {列名: 类型}，可以修改后作为 schema 参数传给 load_data / load_table。
+    """
+    batch = next(iter_csv_batches(file_path, sample_rows, as_dict=False, columns=columns), [])
+    names = list(columns) if columns is not None else read_header(file_path)
+    return {name: infer_column_type([row[i] for row in batch if i < len(row)]) for i, name in enumerate(names)}
+
+
+def load_data(file_path, columns=None, filters=(), schema=None, infer_types=True):
+    """
+    从 CSV 文件中加载数据。
+
+    参数:
+        file_path (str 或 list of str): 文件的路径、glob 模式或文件列表（见 iter_csv_batches）。
+        columns (list of str): 只加载这些列（如透视只用到的 Gender、Age、Salary）；为 None 时加载全部列。
+        filters (iterable): 行过滤条件，如 ("Employment", "==", "Employee") 或 "Age >= 25"（见 parse_filter）。
+        schema (dict): 显式指定的列类型，如 {"Age": "int", "Date": "date"}（见 COLUMN_TYPES）；
+            其余列按样本推断。
+        infer_types (bool): 为 True 时每列在加载时解析一次为 int/float/date/str，之后的透视直接使用
+            这些值，并按数值/日期的自然顺序排序；为 False 时所有值保持为字符串。
+
+    返回:
+        data (list of dict): 数据列表，其中每个条目是一个包含列名和值的字典。
+        columns (list of str): 列名列表。
+    """
+    schema = _check_schema(schema)
+    stage = _active_stats and _active_stats.begin("load_data")
+    columns = list(columns) if columns is not None else read_header(file_path)  # Assuming the first row contains column names
+    data = []
+    for batch in iter_csv_batches(file_path, columns=columns, filters=filters):
+        data.extend(batch)
+
+    if infer_types or schema:
+        for column in columns:
+            if not infer_types and column not in schema:
+                continue
+            try:
+                _, parsed = _parse_column([row.get(column, "") for row in data], schema.get(column),
+                                          strict=column in schema)
+            except ValueError as e:
+                raise ValueError(f"列 '{column}': {e}") from None
+            for row, value in zip(data, parsed):
+                if column in row:
+                    row[column] = value
+
+    if stage:
+        stage.finish(rows=len(data), bytes_read=_input_size(file_path))
+    return data, columns
+
+# For testing purposes, let's manually create a small CSV file and load data from it.
+# 为了测试数据，先生成一个小的数据集
+
+
+# # Loading data from the created CSV file
+# test_data, test_columns = load_data(test_csv)
+# test_data,test_columns
+#%%
+# Step 2: Adding/Deleting Columns and Rows
+# 添加行，列；删除行，列。
+# 数据以列式存储：每一列是一个类型化的 array（数值列，每个单元格 8 字节）
+# 或一个字典编码的 DictColumn（文本列），列名只保存一次，而不是每行的字典里都重复一遍。
+
+class DictColumn:
+    """
+    字典编码的文本列：每个单元格只保存一个整数编号（4 字节），
+    每个不同的值（标签）只保存一次。编号按值首次出现的顺序分配。
+
+    属性:
+        codes (array): 每行的编号。
+        labels (list): 编号对应的标签。
+    """
+
+    __slots__ = ("codes", "labels", "_index")
+
+    def __init__(self, values=()):
+        index = {}
+        self.codes = array("i", [index.setdefault(value, len(index)) for value in values])
+        self.labels = list(index)
+        self._index = index
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, index):
+        return self.labels[self.codes[index]]
+
+    def __iter__(self):
+        labels = self.labels
+        return (labels[code] for code in self.codes)
+
+    def __delitem__(self, index):
+        del self.codes[index]
+
+    def __mul__(self, times):
+        column = DictColumn()
+        column.codes = self.codes * times
+        column.labels = list(self.labels)
+        column._index = dict(self._index)
+        return column
+
+    def append(self, value):
+        """追加一个值，必要时为它分配新的编号。"""
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.labels)
+            self.labels.append(value)
+        self.codes.append(code)
+
+
+def _pack_column(values, kind=None, strict=False):
+    """
+    把一列值解析并压缩成最紧凑的存储：整数用 array('q')，其它数字用 array('d')，
+    日期和文本使用字典编码的 DictColumn（标签是 date 或 str，按自然顺序排序）。
+
+    参数:
+        values (list): 列中的值。
+        kind (str): 列类型（见 COLUMN_TYPES）；为 None 时按样本推断，解析失败时逐级放宽。
+        strict (bool): 为 True 时 kind 是显式指定的，解析失败即报错。
+
+    返回:
+        column (array 或 DictColumn): 打包后的列。
+    """
+    kind, parsed = _parse_column(values, kind, strict)
+    if kind == "int":
+        try:
+            return array("q", parsed)
+        except OverflowError:
+            if strict:
+                raise ValueError("整数超出 64 位范围") from None
+            kind, parsed = _parse_column(values, "float")
+    if kind == "float":
+        return array("d", parsed)
+    return DictColumn(parsed)
+
+
+def _typecode(column):
+    """返回数值列的类型码；数值列是 array，或是从快照映射进来的只读 memoryview。"""
+    return column.format if isinstance(column, memoryview) else column.typecode
+
+
+def _coerce_cell(column, value):
+    """
+    把一个新值转换成列的类型；转换失败时返回 None，表示该列需要放宽类型。
+    """
+    if isinstance(column, DictColumn):
+        if column.labels and isinstance(column.labels[0], date):
+            try:
+                return _parse_date(value)
+            except (ValueError, TypeError):
+                return None
+        return value
+    try:
+        if _typecode(column) == "q":
+            if isinstance(value, float):
+                return None
+            return int(value)
+        return float(value)
+    except (ValueError, TypeError, OverflowError):
+        return None
+
+
+# 位图索引允许的最大不同取值个数；高基数的列（如 Name）逐行过滤更合适
+INDEX_MAX_VALUES = 4096
+
+# 每个字节值中为 1 的位的位置
+_BYTE_BITS = [tuple(bit for bit in range(8) if byte >> bit & 1) for byte in range(256)]
+_NONZERO_BYTE = re.compile(rb"[^\x00]")
+
+
+def _bitset(positions, n_rows):
+    """由行号构建位集（Python 整数，第 i 位对应第 i 行）。"""
+    if numpy is not None:
+        positions = numpy.asarray(positions, dtype=numpy.int64)
+        buffer = numpy.zeros((n_rows + 7) // 8, dtype=numpy.uint8)
+        numpy.bitwise_or.at(buffer, positions >> 3, numpy.left_shift(1, positions & 7).astype(numpy.uint8))
+        return int.from_bytes(buffer.tobytes(), "little")
+    buffer = bytearray((n_rows + 7) // 8)
+    for row in positions:
+        buffer[row >> 3] |= 1 << (row & 7)
+    return int.from_bytes(buffer, "little")
+
+
+def _bit_positions(bits, n_rows):
+    """返回位集中为 1 的位的位置（升序的行号列表）。"""
+    data = bits.to_bytes((n_rows + 7) // 8, "little")
+    if numpy is not None:
+        return numpy.flatnonzero(numpy.unpackbits(numpy.frombuffer(data, dtype=numpy.uint8),
+                                                  bitorder="little")).tolist()
+    # 在 C 中跳过全零的字节，只展开非零字节
+    rows = []
+    for match in _NONZERO_BYTE.finditer(data):
+        base = match.start() * 8
+        rows.extend(base + bit for bit in _BYTE_BITS[data[match.start()]])
+    return rows
+
+
+def _take_array(values, rows):
+    """按行号从 array（或快照中的 memoryview）中取出元素，返回新的 array。"""
+    typecode = _typecode(values)
+    if numpy is not None and len(rows):
+        picked = numpy.frombuffer(values, dtype=typecode)[numpy.asarray(rows, dtype=numpy.int64)]
+        return array(typecode, picked.tobytes())
+    return array(typecode, [values[row] for row in rows])
+
+
+class BitmapIndex:
+    """
+    一列的位图索引：{取值: 位集}，位集是一个 Python 整数，第 i 位为 1 表示第 i 行取这个值。
+
+    适用于 Gender、Employment 这样的低基数维度列；条件之间的与/或运算是整数的 & 和 |，
+    在 C 中按机器字进行。由 Table.add_row / delete_row 维护。
+    """
+
+    def __init__(self, column):
+        """
+        参数:
+            column (array 或 DictColumn): 列的存储。
+        """
+        if not isinstance(column, DictColumn):
+            column = DictColumn(column)
+        labels = column.labels
+        if len(labels) > INDEX_MAX_VALUES:
+            raise ValueError(f"不同取值过多（{len(labels)} > {INDEX_MAX_VALUES}），不适合位图索引")
+        n_rows = len(column.codes)
+        positions = [[] for _ in labels]
+        for row, code in enumerate(column.codes):
+            positions[code].append(row)
+        self.bitmaps = {label: _bitset(rows, n_rows) for label, rows in zip(labels, positions) if rows}
+
+    def add(self, row, value):
+        """第 row 行（表末尾）取值为 value。"""
+        self.bitmaps[value] = self.bitmaps.get(value, 0) | (1 << row)
+
+    def delete(self, row):
+        """删除第 row 行：之后各行的位都向低位移动一位。"""
+        low = (1 << row) - 1
+        for value, bits in list(self.bitmaps.items()):
+            bits = (bits & low) | (bits >> (row + 1) << row)
+            if bits:
+                self.bitmaps[value] = bits
+            else:
+                del self.bitmaps[value]
+
+    def lookup(self, test):
+        """返回取值满足 test 的所有行的位集。只对每个不同的取值判断一次，不逐行判断。"""
+        bits = 0
+        for value, value_bits in self.bitmaps.items():
+            if test(value):
+                bits |= value_bits
+        return bits
+
+
+_table_ids = count(1)
+
+
+class Table:
+    """
+    列式数据表：每列一个类型化的 array 或 DictColumn，行只在需要时才拼成字典。
+
+    表被修改时会通知通过 subscribe 注册的回调：callback(event, *args)，其中 event 为
+    "add_row"(index, row, retyped)、"delete_row"(index, row)、"add_column"(name) 或 "delete_column"(name)，
+    row 是被添加/删除的行的 {列名: 值} 字典；retyped 是因新值而放宽了类型的列名元组
+    （通常为空），这些列中已有的值都被重新解析过，依赖旧取值的状态需要重建。
+
+    属性:
+        columns (list of str): 列名列表（保持原始顺序）。
+        schema (dict): 加载时显式指定的列类型；这些列在 add_row 时不会被放宽类型。
+        id (int): 表的唯一编号。
+        version (int): 数据版本号，每次修改后加 1。
+    """
+
+    def __init__(self, columns=None, data=None):
+        """
+        参数:
+            columns (list of str): 列名列表。
+            data (dict): {列名: array 或 DictColumn}，各列长度必须一致。
+        """
+        self.columns = list(columns or [])
+        self._data = dict(data) if data else {col: DictColumn() for col in self.columns}
+        # 数值列的字典编码缓存，数据被修改时清空
+        self._encodings = {}
+        # 位图索引（见 create_index），随行的增删同步维护
+        self._indexes = {}
+        self._listeners = []
+        self.schema = {}
+        self.id = next(_table_ids)
+        self.version = 0
+        lengths = {len(self._data[col]) for col in self.columns}
+        if len(lengths) > 1:
+            raise ValueError("各列的长度必须一致")
+        self._length = lengths.pop() if lengths else 0
+
+    @classmethod
+    def from_rows(cls, columns, rows, schema=None):
+        """
+        从按行排列的数据（list 或 dict）构建表。每列只解析一次，类型按样本推断。
+
+        参数:
+            columns (list of str): 列名列表。
+            rows (iterable): 每行是值列表或 {列名: 值} 字典。
+            schema (dict): 显式指定的列类型，如 {"Age": "int"}（见 COLUMN_TYPES）。
+        """
+        schema = _check_schema(schema)
+        unknown = [col for col in schema if col not in columns]
+        if unknown:
+            raise KeyError(unknown[0])
+        raw = {col: [] for col in columns}
+        appends = [raw[col].append for col in columns]
+        for row in rows:
+            if isinstance(row, dict):
+                row = [row.get(col, "") for col in columns]
+            for append, value in zip(appends, row):
+                append(value)
+            # 缺少的字段用空字符串补齐
+            for append in appends[len(row):]:
+                append("")
+        data = {}
+        for col, values in raw.items():
+            try:
+                data[col] = _pack_column(values, schema.get(col), strict=col in schema)
+            except ValueError as e:
+                raise ValueError(f"列 '{col}': {e}") from None
+            raw[col] = None  # 尽早释放原始字符串
+        table = cls(columns, data)
+        table.schema = schema
+        return table
+
+    def __len__(self):
+        return self._length
+
+    def __iter__(self):
+        """按行产出 {列名: 值} 字典，使旧的按行处理的函数仍然可以使用 Table。"""
+        columns = self.columns
+        for values in zip(*(self._data[col] for col in columns)):
+            yield dict(zip(columns, values))
+
+    def __repr__(self):
+        return f"Table({self._length} rows × {len(self.columns)} columns: {', '.join(self.columns)})"
+
+    def column(self, column_name):
+        """返回某一列的底层存储（array 或 DictColumn；从快照打开的表是只读的 memoryview）。"""
+        return self._data[column_name]
+
+    def encoding(self, column_name):
+        """
+        返回某列的字典编码，用于按维度分组。
+
+        文本列本身就以编码形式存储；数值列（如 Age）在第一次使用时编码并缓存，
+        直到表被修改为止。
+
+        参数:
+            column_name (str): 列名。
+
+        返回:
+            codes (array of int): 每行的编号。
+            labels (list): 编号对应的标签。
+        """
+        column = self._data[column_name]
+        if isinstance(column, DictColumn):
+            return column.codes, column.labels
+        encoded = self._encodings.get(column_name)
+        if encoded is None:
+            column = DictColumn(column)
+            encoded = self._encodings[column_name] = (column.codes, column.labels)
+        return encoded
+
+    def row(self, index):
+        """返回第 index 行（基于0）的 {列名: 值} 字典。"""
+        return {col: self._data[col][index] for col in self.columns}
+
+    def take(self, rows, columns=None):
+        """
+        按行号取出部分行，返回新的表。
+
+        参数:
+            rows (list of int): 行号，新表中的行按这个顺序排列。
+            columns (iterable of str): 只取出这些列；为 None 时取出全部列。
+        """
+        columns = list(columns) if columns is not None else self.columns
+        data = {}
+        for col in columns:
+            column = self._data[col]
+            if isinstance(column, DictColumn):
+                taken = DictColumn()
+                taken.codes = _take_array(column.codes, rows)
+                taken.labels, taken._index = list(column.labels), dict(column._index)
+            else:
+                taken = _take_array(column, rows)
+            data[col] = taken
+        table = Table(columns, data)
+        table.schema = {col: kind for col, kind in self.schema.items() if col in data}
+        return table
+
+    def create_index(self, column_name):
+        """
+        为一列（通常是 Gender、Employment、Age 这样的低基数维度）建立位图索引。
+        之后 select 和带过滤条件的 build_pivot 在这一列上的条件直接由位图求出，索引由 add_row / delete_row 维护。
+
+        参数:
+            column_name (str): 列名。
+        """
+        self._indexes[column_name] = BitmapIndex(self._data[column_name])
+
+    def drop_index(self, column_name):
+        """删除一列的位图索引。"""
+        self._indexes.pop(column_name, None)
+
+    @property
+    def indexes(self):
+        """有位图索引的列名列表。"""
+        return list(self._indexes)
+
+    def select(self, filters):
+        """
+        返回满足全部过滤条件的行号（升序）。
+
+        条件之间为 AND，每个条件内的分支为 OR（见 normalize_filter）。只涉及有索引的列的条件
+        在位图上求并集、交集；其余条件只对已选出的行逐行检查，所以选择性高的查询的代价
+        主要与匹配的行数有关。
+
+        参数:
+            filters (iterable): 过滤条件。
+
+        返回:
+            rows (list of int): 行号。
+        """
+        groups = [normalize_filter(condition) for condition in filters]
+        for group in groups:
+            for column, _, _ in group:
+                if column not in self._data:
+                    raise KeyError(column)
+        selected = (1 << self._length) - 1
+        remaining = []
+        for group in groups:
+            if all(column in self._indexes for column, _, _ in group):
+                bits = 0
+                for column, op, value in group:
+                    bits |= self._indexes[column].lookup(_condition_test(op, value))
+                selected &= bits
+            else:
+                remaining.append([(self._data[column], _condition_test(op, value)) for column, op, value in group])
+        rows = _bit_positions(selected, self._length)
+        if remaining:
+            rows = [row for row in rows
+                    if all(any(test(column[row]) for column, test in group) for group in remaining)]
+        return rows
+
+    def subscribe(self, callback):
+        """注册一个在表被修改后调用的回调。"""
+        self._listeners.append(callback)
+
+    def unsubscribe(self, callback):
+        """取消注册回调。"""
+        if callback in self._listeners:
+            self._listeners.remove(callback)
+
+    def fingerprint(self):
+        """返回标识当前数据内容的 (表编号, 版本号)。"""
+        return self.id, self.version
+
+    def _notify(self, event, *args):
+        self.version += 1
+        # 一个回调出错时仍然通知其余的回调（例如缓存的失效），最后再抛出第一个错误
+        error = None
+        for callback in list(self._listeners):
+            try:
+                callback(event, *args)
+            except Exception as e:
+                if error is None:
+                    error = e
+        if error is not None:
+            raise error
+
+    def add_column(self, column_name, default_value=None):
+        """
+        添加一个新列。
+
+        参数:
+            column_name (str): 新列的名称。
+            default_value: 新列的默认值；为 None 时使用基于1的行索引编号。
+        """
+        if column_name in self._data:
+            raise ValueError(f"列 '{column_name}' 已存在")
+        if default_value is None:
+            column = array("q", range(1, self._length + 1))
+        else:
+            column = _pack_column([default_value]) * self._length
+        self.columns.append(column_name)
+        self._data[column_name] = column
+        self._notify("add_column", column_name)
+
+    def delete_column(self, column_name):
+        """
+        删除一个列，只需丢弃这一列的存储，不会触碰其它列。
+
+        参数:
+            column_name (str): 要删除的列的名称。
+        """
+        if column_name not in self._data:
+            raise KeyError(column_name)
+        del self._data[column_name]
+        self.schema.pop(column_name, None)
+        self._encodings.pop(column_name, None)
+        self._indexes.pop(column_name, None)
+        self.columns.remove(column_name)
+        self._notify("delete_column", column_name)
+
+    def _detach(self):
+        """写时复制：把从快照映射进来的只读列复制为可修改的 array。"""
+        for col, column in self._data.items():
+            if isinstance(column, memoryview):
+                self._data[col] = array(column.format, column.tobytes())
+            elif isinstance(column, DictColumn) and isinstance(column.codes, memoryview):
+                column.codes = array("i", column.codes.tobytes())
+
+    def add_row(self, values):
+        """
+        在表末尾追加一行。
+
+        值与推断出的列类型不符时，该列被放宽类型（int → float → str），并在 "add_row" 通知中
+        列出（见 Table）；显式指定了类型的列（schema）不会被放宽，而是像加载时一样报错，表保持不变。
+
+        参数:
+            values (dict 或 list): {列名: 值} 字典，或按列顺序排列的值列表。
+        """
+        if isinstance(values, dict):
+            values = [values.get(col, "") for col in self.columns]
+        if len(values) != len(self.columns):
+            raise ValueError("值的个数与列数不一致")
+        cells = [_coerce_cell(self._data[col], value) for col, value in zip(self.columns, values)]
+        for col, value, cell in zip(self.columns, values, cells):
+            if cell is None and col in self.schema:
+                raise ValueError(f"列 '{col}': 值无法解析为 {self.schema[col]}: {value!r}")
+        self._detach()
+        retyped = []
+        for col, value, cell in zip(self.columns, values, cells):
+            column = self._data[col]
+            if cell is None:
+                # 值与列类型不符：整数列先放宽为浮点列，仍不行就改为字典编码的文本列。
+                # 按文本重新解析，放宽为文本列时不会混入不能互相比较的标签
+                column = _pack_column([str(item) for item in column] + [str(value)])
+                self._data[col] = column
+                retyped.append(col)
+                if col in self._indexes:
+                    self._indexes[col] = BitmapIndex(column)
+            else:
+                column.append(cell)
+                index = self._indexes.get(col)
+                if index is not None:
+                    index.add(self._length, column[self._length])
+        self._length += 1
+        self._encodings.clear()
+        self._notify("add_row", self._length - 1, self.row(self._length - 1), tuple(retyped))
+
+    def delete_row(self, index):
+        """
+        删除第 index 行（基于0）。
+
+        参数:
+            index (int): 要删除的行的索引。
+        """
+        if not 0 <= index < self._length:
+            raise IndexError(index)
+        removed = self.row(index) if self._listeners else None
+        self._detach()
+        for col in self.columns:
+            del self._data[col][index]
+        for bitmap_index in self._indexes.values():
+            bitmap_index.delete(index)
+        self._length -= 1
+        self._encodings.clear()
+        self._notify("delete_row", index, removed)
+
+
+def load_table(file_path, batch_size=DEFAULT_BATCH_SIZE, dimensions=(), columns=None, filters=(), schema=None):
+    """
+    从 CSV 文件流式加载数据到列式的 Table 中。文本列在加载时即被字典编码。
+    未选中的列在解析后立即丢弃，不满足过滤条件的行不会进入表中，
+    所以宽表的加载代价只与用到的列数和保留的行数有关。
+
+    参数:
+        file_path (str 或 list of str): 文件的路径、glob 模式或文件列表（见 iter_csv_batches）。
+        batch_size (int): 每批读取的行数。
+        dimensions (iterable of str): 需要预先编码的数值维度列（如 Age）。
+        columns (list of str): 只加载这些列；为 None 时加载全部列。
+        filters (iterable): 行过滤条件（见 parse_filter）。
+        schema (dict): 显式指定的列类型（见 COLUMN_TYPES），其余列按样本推断。
+
+    返回:
+        table (Table): 加载好的数据表。
+    """
+    stage = _active_stats and _active_stats.begin("load_table")
+    columns = list(columns) if columns is not None else read_header(file_path)
+    rows = (values for batch in iter_csv_batches(file_path, batch_size, as_dict=False, columns=columns,
+                                                 filters=filters) for values in batch)
+    table = Table.from_rows(columns, rows, schema)
+    for column_name in dimensions:
+        table.encoding(column_name)
+    if stage:
+        stage.finish(rows=len(table), bytes_read=_input_size(file_path))
+    return table
+
+
+def add_column(data):
+    """
+    向数据集中添加一个新列。
+
+    参数:
+        data (Table 或 list of dict): 数据集。
+        column_name (str): 新列的名称。
+    """
+    column_name = input(f"Add:")
+
+    # 验证 column_name 是否是字母数字的
+    if not column_name.isalnum():
+        raise ValueError("列名称必须是字母数字的")
+
+    # 如果数据集至少有一行，提示用户输入新列的默认值
+    if len(data) > 0:
+        default_value = input(f"请输入列 '{column_name}' 的默认值（直接按Enter使用基于1的索引编号）: ")
+        if isinstance(data, Table):
+            # 列式存储：整列一次性生成，不需要逐行修改
+            data.add_column(column_name, default_value if default_value != "" else None)
+        elif default_value == "":
+            # 使用基于1的行索引编号作为默认值
+            for i, row in enumerate(data):
+                row[column_name] = i + 1
+        else:
+            # 使用用户输入的默认值
+            for row in data:
+                row[column_name] = default_value
+    else:
+        # 如果数据集为空，不进行任何操作
+        pass
+
+
+
+def delete_column(data):
+    """
+    从数据集中删除一个列。
+
+    参数:
+        data (Table 或 list of dict): 数据集。
+        column_name (str): 要删除的列的名称。
+    """
+    column_name = input(f"Delete:")
+
+
+    # 检查数据集是否至少有一行
+    if len(data) == 0:
+        print("数据集为空，没有列可以删除。")
+        return
+
+    # 检查要删除的列是否存在于数据集中
+    columns = data.columns if isinstance(data, Table) else data[0]
+    if column_name not in columns:
+        print(f"列 '{column_name}' 不存在于数据集中，无法删除。")
+        return
+
+    # 删除列
+    if isinstance(data, Table):
+        data.delete_column(column_name)
+    else:
+        for row in data:
+            del row[column_name]
+
+    print(f"列 '{column_name}' 已从数据集中删除。")
+
+
+
+def add_row(data):
+    """
+    向数据集中添加一个新行。
+
+    参数:
+        data (Table 或 list of dict): 数据集。
+    """
+    # 检查数据集是否至少有一个列
+    if isinstance(data, Table):
+        columns = list(data.columns)
+    elif len(data) > 0:
+        columns = list(data[0].keys())
+    else:
+        columns = []
+    if len(columns) == 0:
+        print("数据集应至少包含一个列。")
+        return
+
+    # 为新行创建一个字典，并提示用户为每个列输入值
+    new_row = {}
+    for column in columns:
+        new_row[column] = input(f"'{column}':")
+
+    # 将新行添加到数据集中
+    if isinstance(data, Table):
+        try:
+            data.add_row(new_row)
+        except ValueError as e:
+            print(e)
+    else:
+        data.append(_coerce_row(data, new_row))
+
+
+# 已解析的值的 Python 类型对应的列类型（见 COLUMN_TYPES）
+_VALUE_KINDS = {int: "int", float: "float", date: "date"}
+
+
+def _coerce_row(data, row):
+    """
+    按各列已有的值的类型（load_data 推断出的 int/float/date）解析新行中的字符串，
+    使同一列的值仍可以互相比较、排序。新值无法解析时该列逐级放宽（见 _WIDER_TYPES），
+    放宽为文本时已有的值也一并转换成字符串，与 Table.add_row 放宽列类型的方式相同。
+
+    参数:
+        data (list of dict): 数据集。
+        row (dict): 新行，值为输入的字符串。
+
+    返回:
+        row (dict): 解析后的新行。
+    """
+    for column, value in row.items():
+        kinds = {_VALUE_KINDS.get(type(existing[column]), "str") for existing in data if column in existing}
+        if not kinds or "str" in kinds or (len(kinds) > 1 and kinds != {"int", "float"}):
+            continue
+        kind, (row[column],) = _parse_column([value], "float" if "float" in kinds else kinds.pop())
+        if kind == "str":
+            for existing in data:
+                if column in existing:
+                    existing[column] = str(existing[column])
+    return row
+
+
+
+def delete_row(data):
+    """
+    从数据集中删除一个行。
+
+    参数:
+        data (Table 或 list of dict): 数据集。
+        row_index (int): 要删除的行的索引（基于1）。
+    """
+    # 调整行索引以适应基于0的索引
+
+    row_index = int(input("Delete:"))
+
+    row_index -= 1
+
+    # 检查行索引是否在有效范围内
+    if 0 <= row_index < len(data):
+        if isinstance(data, Table):
+            data.delete_row(row_index)
+        else:
+            del data[row_index]
+        print(f"第 {row_index + 1} 行已从数据集中删除。")
+    else:
+        print(f"错误：没有找到索引为 {row_index + 1} 的行。")
+#%%
+# Step 3: Defining Pivot Fields
+# 数据透视表字段定义；
+
+# 行、列字段保存为属性名；值字段保存为 (属性名, 聚合函数)，同一属性可以配不同的聚合函数。
+
+def _field_name(field):
+    """返回透视字段的属性名（值字段是 (属性名, 聚合函数) 元组）。"""
+    return field[0] if isinstance(field, tuple) else field
+
+
+def view_pivot_fields(data_structure):
+    """
+    查看当前添加的透视表字段列表。
+
+    参数:
+        data_structure (dict): 存储透视字段的数据结构。
+    """
+    print("Columns:")
+    print("•", "、".join([_field_name(field) for field in data_structure["columns"]]))
+
+    print("Rows:")
+    print("•", "、".join([_field_name(field) for field in data_structure["rows"]]))
+
+    print("Values:")
+    print("•", "、".join([f"{field[0]} – {field[1].capitalize()}" for field in data_structure["values"]]))
+
+
+def add_pivot_field(data_structure):
+    """
+    通过提示用户输入属性名和字段类型来添加一个透视表字段。
+    对于值字段，提示用户选择所需的聚合函数。
+    参数:
+        data_structure (dict): 存储透视字段的数据结构。
+    """
+    field_name = input("请输入属性名称: （在Name、Gender、Age、Employment（columns、rows）；Salary（values）中选择）: ")
+    field_type = input("请输入字段类型（columns/rows/values）: ")
+
+    if field_type not in ["columns", "rows", "values"]:
+        print("无效的字段类型。必须是 'columns'、'rows' 或 'values'。")
+        return
+
+    field = field_name
+    if field_type == "values":
+        aggregation = input("请选择聚合函数（count/sum/average/minimum/maximum/median/distinct，或 p90 等分位数）: ")
+        try:
+            get_aggregator(aggregation)
+        except ValueError:
+            print("无效的聚合函数。")
+            return
+        field = (field_name, aggregation)
+
+    if field in data_structure[field_type]:
+        print("错误：该属性已作为透视表字段添加。")
+        return
+
+    data_structure[field_type].append(field)
+    print(f"{field_name} 已添加到 {field_type}。")
+
+
+def remove_pivot_field(data_structure):
+    """
+    通过提示用户输入属性名称来删除一个透视表字段。
+
+    参数:
+        data_structure (dict): 存储透视字段的数据结构。
+    """
+    field_name = input("请输入要删除的属性名称: ")
+
+    field_removed = False
+    for field_type in ["columns", "rows", "values"]:
+        original_length = len(data_structure[field_type])
+        data_structure[field_type] = [field for field in data_structure[field_type]
+                                      if _field_name(field) != field_name]
+        if len(data_structure[field_type]) < original_length:
+            field_removed = True
+
+    if field_removed:
+        print(f"{field_name} 已从透视表字段中删除。")
+    else:
+        print("错误：该属性未作为透视表字段添加。")
+
+
+def pivot_measures(data_structure):
+    """
+    把值字段按属性分组，得到 build_pivot 需要的 value_key 和 aggregation_funcs。
+
+    参数:
+        data_structure (dict): 存储透视字段的数据结构。
+
+    返回:
+        value_key (str 或 list of str): 只有一个值属性时是属性名，否则是属性名列表。
+        aggregation_funcs (list): 对应的聚合函数列表（多个值属性时是列表的列表）。
+    """
+    if not data_structure["values"]:
+        raise ValueError("至少需要一个值字段")
+    grouped = {}
+    for field_name, aggregation in data_structure["values"]:
+        grouped.setdefault(field_name, []).append(aggregation)
+    if len(grouped) == 1:
+        return next(iter(grouped.items()))
+    return list(grouped), list(grouped.values())
+
+
+#%%
+#Step 9:聚合函数
+# 每个聚合函数都有一个可合并的流式状态：按行累加，按分区合并，只在输出时计算最终值。
+# 单元格的基础状态是 (sum, count, min, max)，由引擎用扁平数组维护；
+# 中位数/分位数、去重计数需要额外的草图（sketch）状态，其大小与单元格中的行数无关。
+
+_INF = float("inf")
+
+
+def _hash64(value):
+    """稳定的 64 位哈希（不受 PYTHONHASHSEED 影响，可以跨进程合并）。"""
+    return int.from_bytes(hashlib.blake2b(str(value).encode("utf-8"), digest_size=8).digest(), "big")
+
+
+class TDigest:
+    """
+    t-digest 风格的分位数草图：把值聚成若干带权质心，靠近两端的质心更小，
+    因此尾部分位数更准。质心个数只与 compression 有关；值较少（未压缩）时结果是精确的。
+    """
+
+    __slots__ = ("compression", "means", "weights", "buffer", "low", "high")
+
+    def __init__(self, compression=100):
+        self.compression = compression
+        self.means = []
+        self.weights = []
+        self.buffer = []
+        self.low = _INF
+        self.high = -_INF
+
+    def add(self, value):
+        """累加一个值。"""
+        self.buffer.append(value)
+        if value < self.low:
+            self.low = value
+        if value > self.high:
+            self.high = value
+        if len(self.buffer) >= 4 * self.compression:
+            self._compress()
+
+    def merge(self, other):
+        """合并另一个草图（原地修改）。"""
+        if other.low < self.low:
+            self.low = other.low
+        if other.high > self.high:
+            self.high = other.high
+        self._compress(list(zip(other.means, other.weights)) + [(value, 1) for value in other.buffer])
+        return self
+
+    def _compress(self, extra=()):
+        points = sorted(chain(zip(self.means, self.weights), ((value, 1) for value in self.buffer), extra))
+        self.buffer = []
+        if not points:
+            self.means, self.weights = [], []
+            return
+        total = sum(weight for _, weight in points)
+        # k1 尺度函数：相邻质心的 k 值最多相差 1，质心个数不超过 compression / 2 左右
+        scale = 2 * math.pi / self.compression
+        means, weights = [points[0][0]], [points[0][1]]
+        before = 0  # 当前质心之前的累计权重
+        limit = (math.sin(min(math.pi / 2, math.asin(-1.0) + scale)) + 1) / 2 * total
+        for mean, weight in points[1:]:
+            merged = weights[-1] + weight
+            if before + merged <= limit:
+                means[-1] += (mean - means[-1]) * weight / merged
+                weights[-1] = merged
+            else:
+                before += weights[-1]
+                k = math.asin(max(-1.0, min(1.0, 2 * before / total - 1))) + scale
+                limit = (math.sin(min(math.pi / 2, k)) + 1) / 2 * total
+                means.append(mean)
+                weights.append(weight)
+        self.means, self.weights = means, weights
+
+    def quantile(self, q):
+        """
+        估计第 q 分位数（0 <= q <= 1）；没有数据时返回 None。
+        尚未压缩过的值按权重 1 参与插值，因此值较少时结果是精确的。
+        """
+        points = sorted(chain(zip(self.means, self.weights), ((value, 1) for value in self.buffer)))
+        if not points:
+            return None
+        target = q * sum(weight for _, weight in points)
+        prev_center, prev_mean = 0.0, self.low
+        cumulative = 0
+        for mean, weight in points:
+            center = cumulative + weight / 2
+            if target <= center:
+                if center == prev_center:
+                    return mean
+                return prev_mean + (mean - prev_mean) * (target - prev_center) / (center - prev_center)
+            prev_center, prev_mean = center, mean
+            cumulative += weight
+        if cumulative == prev_center:
+            return self.high
+        return prev_mean + (self.high - prev_mean) * (target - prev_center) / (cumulative - prev_center)
+
+
+class HyperLogLog:
+    """
+    HyperLogLog 去重计数草图。不同值较少时精确保存它们的哈希，
+    超过阈值后换成 2**precision 个单字节寄存器（precision=10 时约 1KB，误差约 3%）。
+    """
+
+    __slots__ = ("precision", "hashes", "registers")
+
+    # 精确阶段最多保存的哈希个数
+    EXACT_LIMIT = 32
+
+    def __init__(self, precision=10):
+        self.precision = precision
+        self.hashes = set()
+        self.registers = None
+
+    def add(self, value):
+        """累加一个值。"""
+        if self.registers is None:
+            self.hashes.add(_hash64(value))
+            if len(self.hashes) > self.EXACT_LIMIT:
+                self._to_registers()
+        else:
+            self._add_hash(_hash64(value))
+
+    def _to_registers(self):
+        self.registers = bytearray(1 << self.precision)
+        for h in self.hashes:
+            self._add_hash(h)
+        self.hashes = set()
+
+    def _add_hash(self, h):
+        width = 64 - self.precision
+        index = h >> width
+        rank = width - (h & ((1 << width) - 1)).bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        """合并另一个草图（原地修改）。"""
+        if self.registers is None and other.registers is None:
+            self.hashes |= other.hashes
+            if len(self.hashes) > self.EXACT_LIMIT:
+                self._to_registers()
+            return self
+        if self.registers is None:
+            self._to_registers()
+        if other.registers is None:
+            for h in other.hashes:
+                self._add_hash(h)
+        else:
+            self.registers = bytearray(map(max, self.registers, other.registers))
+        return self
+
+    def cardinality(self):
+        """估计不同值的个数。"""
+        if self.registers is None:
+            return len(self.hashes)
+        m = len(self.registers)
+        estimate = 0.7213 / (1 + 1.079 / m) * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            estimate = m * math.log(m / zeros)  # 小基数时使用线性计数
+        return int(round(estimate))
+
+
+class Aggregator:
+    """
+    聚合函数的基类。
+
+    属性:
+        name (str): 聚合函数的规范名称。
+        numeric (bool): 是否需要把值转换为数字。
+        needs_extrema (bool): 是否需要引擎维护每个单元格的 min/max。
+        sketch (bool): 是否需要每个单元格一个草图状态（见 create/update/merge）。
+    """
+
+    name = None
+    numeric = True
+    needs_extrema = False
+    sketch = False
+
+    def create(self):
+        """新建一个空的草图状态。"""
+        return None
+
+    def update(self, state, value):
+        """把一个值累加到草图状态中。"""
+
+    def merge(self, state, other):
+        """合并两个草图状态，返回合并后的状态。"""
+        return state
+
+    def finalize(self, base, state):
+        """
+        计算最终值。
+
+        参数:
+            base (tuple): 单元格的基础状态 (sum, count, min, max)，count 一定大于 0。
+            state: 本聚合函数的草图状态（没有草图时为 None）。
+        """
+        raise NotImplementedError
+
+    def finalize_column(self, sums, counts, mins, maxs, states):
+        """
+        批量计算一组单元格的最终值（渲染时按列使用）；count 为 0 的单元格的值没有意义，由调用方跳过。
+
+        参数:
+            sums, counts, mins, maxs (sequence): 各单元格的基础状态。
+            states (sequence): 各单元格的草图状态；没有草图时为 None。
+        """
+        finalize = self.finalize
+        return [finalize(base, state) if base[1] else None
+                for base, state in zip(zip(sums, counts, mins, maxs), states or repeat(None))]
+
+
+class CountAggregator(Aggregator):
+    name = "count"
+    numeric = False
+
+    def finalize(self, base, state):
+        return base[1]
+
+    def finalize_column(self, sums, counts, mins, maxs, states):
+        return counts
+
+
+class SumAggregator(Aggregator):
+    name = "sum"
+
+    def finalize(self, base, state):
+        return base[0]
+
+    def finalize_column(self, sums, counts, mins, maxs, states):
+        return sums
+
+
+class MeanAggregator(Aggregator):
+    name = "average"
+
+    def finalize(self, base, state):
+        return base[0] / base[1]
+
+    def finalize_column(self, sums, counts, mins, maxs, states):
+        return [total / count if count else None for total, count in zip(sums, counts)]
+
+
+class MinAggregator(Aggregator):
+    name = "minimum"
+    needs_extrema = True
+
+    def finalize(self, base, state):
+        return base[2]
+
+    def finalize_column(self, sums, counts, mins, maxs, states):
+        return mins
+
+
+class MaxAggregator(Aggregator):
+    name = "maximum"
+    needs_extrema = True
+
+    def finalize(self, base, state):
+        return base[3]
+
+    def finalize_column(self, sums, counts, mins, maxs, states):
+        return maxs
+
+
+class QuantileAggregator(Aggregator):
+    """近似分位数（t-digest）；q=0.5 即中位数。"""
+
+    sketch = True
+
+    def __init__(self, q, name):
+        self.q = q
+        self.name = name
+
+    def create(self):
+        return TDigest()
+
+    def update(self, state, value):
+        state.add(value)
+
+    def merge(self, state, other):
+        return state.merge(other)
+
+    def finalize(self, base, state):
+        return state.quantile(self.q)
+
+
+class DistinctCountAggregator(Aggregator):
+    """近似去重计数（HyperLogLog）。"""
+
+    name = "distinct"
+    numeric = False
+    sketch = True
+
+    def create(self):
+        return HyperLogLog()
+
+    def update(self, state, value):
+        state.add(value)
+
+    def merge(self, state, other):
+        return state.merge(other)
+
+    def finalize(self, base, state):
+        return state.cardinality()
+
+
+AGGREGATORS = {
+    "count": CountAggregator(),
+    "sum": SumAggregator(),
+    "average": MeanAggregator(),
+    "minimum": MinAggregator(),
+    "maximum": MaxAggregator(),
+    "median": QuantileAggregator(0.5, "median"),
+    "distinct": DistinctCountAggregator(),
+}
+# 旧代码中使用的别名
+AGGREGATORS["mean"] = AGGREGATORS["average"]
+
+
+def get_aggregator(func):
+    """
+    按名称查找聚合函数。除 AGGREGATORS 中的名称外，还支持 p1~p99 形式的分位数（如 p90）。
+
+    参数:
+        func (str): 聚合函数名称。
+
+    返回:
+        aggregator (Aggregator): 聚合函数。
+    """
+    aggregator = AGGREGATORS.get(func)
+    if aggregator is not None:
+        return aggregator
+    if func[:1] == "p" and func[1:].isdigit() and 0 < int(func[1:]) < 100:
+        aggregator = AGGREGATORS[func] = QuantileAggregator(int(func[1:]) / 100, func)
+        return aggregator
+    raise ValueError(f"未知的聚合函数: {func}")
+
+
+# 精确求和时每个单元格最多缓存的值的个数，超过时先压缩成部分和
+_EXACT_SUM_CHUNK = 1 << 12
+
+
+def _fsum(values):
+    """math.fsum；和溢出或者同时有 inf 和 -inf 时退回普通的浮点和（结果为 inf 或 nan）。"""
+    values = values if isinstance(values, list) else list(values)
+    try:
+        return math.fsum(values)
+    except (OverflowError, ValueError):
+        return sum(values)
+
+
+def _exact_partials(values):
+    """
+    把一组 float 的精确和表示为若干个 float 之和，第一个是正确舍入的和（即 math.fsum(values)），
+    其余是依次的舍入误差。
+
+    返回:
+        partials (list of float): 至少一个元素。
+    """
+    values = list(values)
+    partials = []
+    while True:
+        try:
+            total = math.fsum(values)
+        except (OverflowError, ValueError):  # 见 _fsum
+            return [sum(values)]
+        if total or not partials:
+            partials.append(total)
+        if not total or not math.isfinite(total):
+            return partials
+        values.append(-total)
+
+
+class _ExactSum(float):
+    """
+    浮点数的精确和：值是正确舍入的和（与 math.fsum 相同），partials 的和恰好等于精确和。
+    部分状态按 partials 合并，所以合并的结果与数据的分区方式和合并顺序无关。
+    """
+
+    __slots__ = ("partials",)
+
+    def __new__(cls, partials):
+        total = float.__new__(cls, partials[0])
+        total.partials = tuple(partials)
+        return total
+
+    def __reduce__(self):
+        return _ExactSum, (self.partials,)
+
+
+def _exact_sum(terms):
+    """
+    求若干个 float 或 _ExactSum 的精确和；结果能用一个 float 精确表示时返回 float，否则返回 _ExactSum。
+    """
+    values = []
+    for term in terms:
+        if isinstance(term, _ExactSum):
+            values.extend(term.partials)
+        else:
+            values.append(term)
+    partials = _exact_partials(values)
+    return partials[0] if len(partials) == 1 else _ExactSum(partials)
+
+
+def _exact_add(a, b):
+    """两个和的精确和（见 _exact_sum）；都是 float 时用 TwoSum 直接求出舍入误差。"""
+    if type(a) is float and type(b) is float:
+        total = a + b
+        if not math.isfinite(total):
+            return total
+        b_part = total - a
+        error = (a - (total - b_part)) + (b - b_part)
+        return total if not error else _ExactSum((total, error))
+    return _exact_sum((a, b))
+
+
+def _float_sums_exact(column):
+    """
+    判断一列数值逐个相加时是否每一步都没有舍入误差：整数列的绝对值之和小于 2**53 时，
+    任意顺序、任意分段的浮点和都是精确的，可以直接累加，不需要精确求和。
+    """
+    if isinstance(column, DictColumn) or _typecode(column) != "q":
+        return False
+    return not len(column) or max(max(column), -min(column)) * len(column) < 2 ** 53
+
+
+def _exact_cell_sums(cells, values, n_cells):
+    """
+    每个单元格上的值的正确舍入的和（与对每个单元格的全部值调用 math.fsum 相同）。
+    按块把值分到各单元格，每块结束时把每个单元格的值压缩成部分和（见 _exact_partials），
+    内存只与块大小和单元格数有关。
+
+    返回:
+        sums (array): 长度为 n_cells 的 array('d')。
+    """
+    partials = {}
+    cells, values = iter(cells), iter(values)
+    while True:
+        buckets = {}
+        for cell, value in zip(islice(cells, _EXACT_SUM_CHUNK * 16), values):
+            bucket = buckets.get(cell)
+            if bucket is None:
+                bucket = buckets[cell] = partials.get(cell, [])
+            bucket.append(float(value))
+        if not buckets:
+            break
+        for cell, bucket in buckets.items():
+            partials[cell] = _exact_partials(bucket)
+    sums = array("d", bytes(8 * n_cells))
+    for cell, cell_partials in partials.items():
+        sums[cell] = cell_partials[0]
+    return sums
+
+
+class _AggregationPlan:
+    """
+    根据所选的聚合函数决定引擎需要维护哪些状态。
+    """
+
+    def __init__(self, aggregation_funcs):
+        self.aggregators = {func: get_aggregator(func) for func in aggregation_funcs}
+        unique = list({agg.name: agg for agg in self.aggregators.values()}.values())
+        self.numeric = any(agg.numeric for agg in unique)
+        self.extrema = any(agg.needs_extrema for agg in unique)
+        self.sketches = [agg for agg in unique if agg.sketch]
+
+    def new_cell(self):
+        """稀疏路径中一个单元格的状态：[sum, count, min, max, 草图...]。"""
+        return [0.0, 0, _INF, -_INF] + [agg.create() for agg in self.sketches]
+
+    def merge_cell(self, cell, other):
+        """合并两个稀疏单元格状态（原地修改 cell）；sum 精确相加，与合并的顺序无关。"""
+        cell[0] = _exact_add(cell[0], other[0])
+        cell[1] += other[1]
+        if other[2] < cell[2]:
+            cell[2] = other[2]
+        if other[3] > cell[3]:
+            cell[3] = other[3]
+        for i, agg in enumerate(self.sketches, 4):
+            cell[i] = agg.merge(cell[i], other[i])
+
+    def finalize(self, cell):
+        """由稀疏单元格状态计算 {聚合函数: 值}；没有数据时返回 None。"""
+        if not cell[1]:
+            return None
+        base = tuple(cell[:4])
+        sketches = {agg.name: cell[i] for i, agg in enumerate(self.sketches, 4)}
+        return {func: agg.finalize(base, sketches.get(agg.name)) for func, agg in self.aggregators.items()}
+
+
+#%%
+#Step 10:生成多维透视表
+# 聚合只做一次：build_pivot 扫描数据得到 PivotResult，
+# 之后由不同的渲染器（CSV 文件、控制台、内存中的行列表）消费同一个结果。
+# 对 Table 按字典编码的整数分组：每个单元格的编号是 行编号 * 列数 + 列编号，
+# 累加器是按这个编号索引的扁平数组，标签只在渲染时才解码。
+# 值字段可以有多个（如 Salary 求和、Age 平均、S/N 计数），每个值字段有自己的聚合函数列表，
+# 分组键只计算一次，所有值字段共用。
+# sum 是精确求和后正确舍入的值（与 math.fsum 相同），与数据的顺序、分区和合并方式无关，
+# 所以串行、并行、外部聚合和各级总计得到完全相同的浮点和。整数列的和不超过 2**53 时
+# 逐个相加本来就是精确的，仍走直接累加的快速路径。
+
+# 稠密单元格网格最多允许是输入行数的多少倍；超过时（维度组合非常稀疏）改用按键哈希的稀疏路径。
+DENSE_CELL_FACTOR = 4
+
+
+def normalize_measures(value_key, aggregation_funcs):
+    """
+    把值字段的定义规范化为 [(值字段, (聚合函数, ...)), ...]。
+
+    参数：
+        value_key (str 或 list of str): 一个值字段，或多个值字段。
+        aggregation_funcs (list): 一个值字段时是聚合函数列表；多个值字段时是与之一一对应的
+            聚合函数列表的列表（某一项也可以是单个聚合函数名）。
+
+    返回：
+        measures (list of tuple): 规范化后的值字段定义。
+    """
+    if isinstance(value_key, str):
+        return [(value_key, tuple(aggregation_funcs))]
+    if len(value_key) != len(aggregation_funcs):
+        raise ValueError("每个值字段都需要对应一组聚合函数")
+    return [(key, (funcs,) if isinstance(funcs, str) else tuple(funcs))
+            for key, funcs in zip(value_key, aggregation_funcs)]
+
+
+def _iter_pivot_inputs(data, row_keys, col_keys, value_keys):
+    """
+    产出 (行键元组, 列键元组, 各值字段的原始值元组) 三元组。
+
+    对 Table 直接按列压缩（zip），不需要为每一行构造字典。
+    """
+    if isinstance(data, Table):
+        row_cols = [data.column(k) for k in row_keys]
+        col_cols = [data.column(k) for k in col_keys]
+        row_labels = zip(*row_cols) if row_cols else repeat(())
+        col_labels = zip(*col_cols) if col_cols else repeat(())
+        return zip(row_labels, col_labels, zip(*(data.column(k) for k in value_keys)))
+    return ((tuple(row[k] for k in row_keys), tuple(row[k] for k in col_keys), tuple(row[k] for k in value_keys))
+            for row in data)
+
+
+def _filter_rows(data, filters):
+    """逐行检查过滤条件（见 normalize_filter），产出满足条件的 {列名: 值} 字典。"""
+    groups = [[(column, _condition_test(op, value)) for column, op, value in normalize_filter(condition)]
+              for condition in filters]
+    for row in data:
+        if all(any(test(row[column]) for column, test in group) for group in groups):
+            yield row
+
+
+class _Measure:
+    """
+    一个值字段在所有单元格上的聚合状态（扁平数组）。
+
+    属性:
+        value_key (str): 值字段的列名。
+        aggregation_funcs (list of str): 该值字段的聚合函数。
+        plan (_AggregationPlan): 需要维护的状态。
+        sums, counts, mins, maxs (array): 每个单元格的 sum/count/min/max 基础状态。
+        sketches (dict): {聚合函数名: 每个单元格的草图状态列表}。
+    """
+
+    def __init__(self, value_key, aggregation_funcs, n_cells):
+        self.value_key = value_key
+        self.aggregation_funcs = list(aggregation_funcs)
+        self.plan = _AggregationPlan(self.aggregation_funcs)
+        self.sums, self.counts, self.mins, self.maxs = _new_accumulators(n_cells)
+        self.sketches = {agg.name: [None] * n_cells for agg in self.plan.sketches}
+
+    def set_state(self, cell, state):
+        """把稀疏形式的单元格状态 [sum, count, min, max, 草图...] 写入第 cell 个单元格。"""
+        self.sums[cell], self.counts[cell], self.mins[cell], self.maxs[cell] = state[:4]
+        for agg, sketch in zip(self.plan.sketches, state[4:]):
+            self.sketches[agg.name][cell] = sketch
+
+    def state(self, cell):
+        """以稀疏形式 [sum, count, min, max, 草图...] 返回第 cell 个单元格的状态（草图不复制）。"""
+        sketches = self.sketches
+        return ([self.sums[cell], self.counts[cell], self.mins[cell], self.maxs[cell]]
+                + [sketches[agg.name][cell] for agg in self.plan.sketches])
+
+    def values(self, cell):
+        """返回第 cell 个单元格的 {聚合函数: 值}；没有数据时返回 None。"""
+        count = self.counts[cell]
+        if not count:
+            return None
+        base = (self.sums[cell], count, self.mins[cell], self.maxs[cell])
+        sketches = self.sketches
+        return {
+            func: agg.finalize(base, sketches[agg.name][cell] if agg.sketch else None)
+            for func, agg in self.plan.aggregators.items()
+        }
+
+
+class PivotResult:
+    """
+    一次扫描得到的透视表聚合结果。
+
+    单元格 (行序号 r, 列序号 c) 的状态保存在各值字段扁平数组的第 r * len(col_labels) + c 个位置。
+
+    属性:
+        row_keys (list of str): 用于行分组的列名的列表。
+        col_keys (list of str): 用于列分组的列名的列表。
+        measures (list of _Measure): 各值字段的聚合状态。
+        row_labels (list of tuple): 全部行键，按首次出现的顺序排列。
+        col_labels (list of tuple): 排序后的全部列键。
+    """
+
+    def __init__(self, row_keys, col_keys, measures, row_labels, col_labels):
+        self.row_keys = list(row_keys)
+        self.col_keys = list(col_keys)
+        self.measures = measures
+        self.row_labels = row_labels
+        self.col_labels = col_labels
+
+    @property
+    def value_columns(self):
+        """每个列键下的值列：[(值字段序号, 聚合函数, 表头文本), ...]。"""
+        single = len(self.measures) == 1
+        return [(m, func, func if single else f"{func} of {measure.value_key}")
+                for m, measure in enumerate(self.measures) for func in measure.aggregation_funcs]
+
+    @classmethod
+    def from_partials(cls, row_keys, col_keys, measures, pivot_data, col_labels=None):
+        """
+        由嵌套字典形式的部分状态（见 _aggregate_inputs）构建结果。
+
+        参数：
+            measures (list of tuple): normalize_measures 返回的值字段定义。
+            col_labels (list of tuple): 全部列键（已排序）；为 None 时由 pivot_data 得到。
+        """
+        row_labels = list(pivot_data)
+        if col_labels is None:
+            col_labels = sorted(set(col_key for row_data in pivot_data.values() for col_key in row_data))
+        col_pos = {col_key: i for i, col_key in enumerate(col_labels)}
+        n_cells = len(row_labels) * len(col_labels)
+        states = [_Measure(key, funcs, n_cells) for key, funcs in measures]
+        for r, row_data in enumerate(pivot_data.values()):
+            base = r * len(col_labels)
+            for col_key, cell_states in row_data.items():
+                cell = base + col_pos[col_key]
+                for measure, state in zip(states, cell_states):
+                    measure.set_state(cell, state)
+        return cls(row_keys, col_keys, states, row_labels, col_labels)
+
+    def take_rows(self, row_indices):
+        """
+        按给定的顺序取出部分行，返回新的结果。每行的单元格状态整段复制，不重新聚合。
+
+        参数：
+            row_indices (iterable of int): 行序号，新结果中的行按这个顺序排列。
+        """
+        row_indices = list(row_indices)
+        n_cols = len(self.col_labels)
+        spans = [(r * n_cols, (r + 1) * n_cols) for r in row_indices]
+        measures = []
+        for measure in self.measures:
+            taken = _Measure(measure.value_key, measure.aggregation_funcs, 0)
+            taken.sums, taken.counts, taken.mins, taken.maxs = (
+                array(source.typecode, chain.from_iterable(source[start:end] for start, end in spans))
+                for source in (measure.sums, measure.counts, measure.mins, measure.maxs))
+            taken.sketches = {name: list(chain.from_iterable(cells[start:end] for start, end in spans))
+                              for name, cells in measure.sketches.items()}
+            measures.append(taken)
+        return PivotResult(self.row_keys, self.col_keys, measures, [self.row_labels[r] for r in row_indices],
+                           self.col_labels)
+
+    def cell(self, row_index, col_index):
+        """
+        返回一个单元格每个值字段的 {聚合函数: 值} 列表；单元格没有数据时返回 None。
+        """
+        cell = row_index * len(self.col_labels) + col_index
+        if not self.measures[0].counts[cell]:
+            return None
+        return [measure.values(cell) for measure in self.measures]
+
+
+def _new_accumulators(n_cells):
+    """创建 n_cells 个单元格的 sum/count/min/max 扁平数组。"""
+    return (array("d", bytes(8 * n_cells)), array("q", bytes(8 * n_cells)),
+            array("d", [_INF]) * n_cells, array("d", [-_INF]) * n_cells)
+
+
+def _accumulate_dense(measure, cells, values):
+    """
+    把 (单元格编号, 值) 累加到一个值字段的扁平数组中。只维护所选聚合函数需要的状态。
+    逐个相加可能有舍入误差时，sum 最后由 _exact_cell_sums 精确求出。
+    """
+    plan = measure.plan
+    exact = plan.numeric and not _float_sums_exact(values)
+    if exact and not isinstance(cells, (array, list)):
+        cells = array("q", cells)
+    sums, counts, mins, maxs, sketches = measure.sums, measure.counts, measure.mins, measure.maxs, measure.sketches
+    if not plan.sketches and not plan.numeric:
+        for cell, _ in zip(cells, values):
+            counts[cell] += 1
+    elif not plan.sketches and not plan.extrema:
+        for cell, value in zip(cells, values):
+            sums[cell] += float(value)
+            counts[cell] += 1
+    elif not plan.sketches:
+        for cell, value in zip(cells, values):
+            value = float(value)
+            sums[cell] += value
+            counts[cell] += 1
+            if value < mins[cell]:
+                mins[cell] = value
+            if value > maxs[cell]:
+                maxs[cell] = value
+    else:
+        numeric, extrema = plan.numeric, plan.extrema
+        sketch_lists = [(agg, sketches[agg.name], agg.numeric) for agg in plan.sketches]
+        for cell, raw in zip(cells, values):
+            counts[cell] += 1
+            value = raw
+            if numeric:
+                value = float(raw)
+                sums[cell] += value
+                if extrema:
+                    if value < mins[cell]:
+                        mins[cell] = value
+                    if value > maxs[cell]:
+                        maxs[cell] = value
+            for agg, states, wants_number in sketch_lists:
+                state = states[cell]
+                if state is None:
+                    state = states[cell] = agg.create()
+                agg.update(state, value if wants_number else raw)
+    if exact:
+        measure.sums = _exact_cell_sums(cells, values, len(sums))
+
+
+def _encode_keys(table, keys):
+    """
+    把若干维度列的字典编码组合成一个整数分组编号。
+
+    返回：
+        codes (sequence of int): 每行的组合编号（多列时按混合进制组合）。
+        order (list of int): 出现过的组合编号，按首次出现的顺序排列。
+        labels (list of tuple): 与 order 一一对应的解码后的标签。
+    """
+    if not keys:
+        return repeat(0, len(table)), [0] if len(table) else [], [()] if len(table) else []
+    encodings = [table.encoding(k) for k in keys]
+    codes = encodings[0][0]
+    for key_codes, key_labels in encodings[1:]:
+        radix = len(key_labels)
+        codes = [a * radix + b for a, b in zip(codes, key_codes)]
+    order = list(dict.fromkeys(codes))
+    return codes, order, _decode_codes(order, encodings)
+
+
+def _decode_codes(order, encodings):
+    """把混合进制的组合编号解码为标签元组。"""
+    labels = []
+    for code in order:
+        parts = []
+        for _, key_labels in reversed(encodings):
+            code, part = divmod(code, len(key_labels))
+            parts.append(key_labels[part])
+        labels.append(tuple(reversed(parts)))
+    return labels
+
+
+def _build_pivot_encoded(table, row_keys, col_keys, measures):
+    """
+    按字典编码的整数单元格编号聚合 Table；维度组合过于稀疏时返回 None。
+    """
+    stage = _active_stats and _active_stats.begin("pivot.encode_keys")
+    row_codes, row_order, row_labels = _encode_keys(table, row_keys)
+    col_codes, col_order, col_labels = _encode_keys(table, col_keys)
+    if stage:
+        stage.finish(rows=len(table))
+    n_cols = len(col_labels)
+    n_cells = len(row_labels) * n_cols
+    if n_cells > DENSE_CELL_FACTOR * len(table) + 1024:
+        return None
+
+    # 列按标签排序；把原始编号映射为 列序号，行编号映射为 行序号 * 列数
+    col_rank = sorted(range(n_cols), key=col_labels.__getitem__)
+    col_labels = [col_labels[i] for i in col_rank]
+    col_map = {col_order[i]: pos for pos, i in enumerate(col_rank)}
+    row_map = {code: r * n_cols for r, code in enumerate(row_order)}
+    if isinstance(row_codes, (array, memoryview)) and row_order and max(row_order) < 4 * len(row_order):
+        # 单列维度时编号本来就很紧凑，用列表下标代替字典查找
+        row_map = [row_map.get(code, 0) for code in range(max(row_order) + 1)]
+
+    states = [_Measure(key, funcs, n_cells) for key, funcs in measures]
+    cells = (row_map[r] + col_map[c] for r, c in zip(row_codes, col_codes))
+    if len(states) > 1:
+        # 多个值字段共用同一组单元格编号，分组只计算一次
+        cells = array("q", cells)
+    for measure in states:
+        _accumulate_dense(measure, cells, table.column(measure.value_key))
+
+    return PivotResult(row_keys, col_keys, states, row_labels, col_labels)
+
+
+def _factorize_numpy(table, keys):
+    """
+    _encode_keys 的 NumPy 版本。
+
+    返回：
+        index (ndarray): 每行的分组序号，序号按首次出现的顺序编号。
+        labels (list of tuple): 每个序号对应的标签。
+    """
+    n_rows = len(table)
+    if not keys or not n_rows:
+        return numpy.zeros(n_rows, dtype=numpy.int64), [()] if n_rows else []
+    encodings = [table.encoding(k) for k in keys]
+    codes = numpy.zeros(n_rows, dtype=numpy.int64)
+    space = 1
+    for key_codes, key_labels in encodings:
+        # frombuffer 只是临时视图，运算结果是新数组，不会锁住表中可增长的编码数组
+        codes = codes * len(key_labels) + numpy.frombuffer(key_codes, dtype=_typecode(key_codes))
+        space *= len(key_labels)
+
+    if space > DENSE_CELL_FACTOR * n_rows + 1024:
+        # 组合编号过于稀疏：排序去重
+        unique, first, inverse = numpy.unique(codes, return_index=True, return_inverse=True)
+        appearance = numpy.argsort(first, kind="stable")
+        rank = numpy.empty(len(unique), dtype=numpy.int64)
+        rank[appearance] = numpy.arange(len(unique))
+        return rank[inverse.ravel()], _decode_codes(unique[appearance].tolist(), encodings)
+
+    # 组合编号紧凑：按编号直接寻址，不需要排序。
+    # 重复下标赋值时最后一次生效，所以倒序赋值得到每个编号首次出现的行号
+    first = numpy.full(space, n_rows, dtype=numpy.int64)
+    first[codes[::-1]] = numpy.arange(n_rows - 1, -1, -1)
+    present = numpy.flatnonzero(first < n_rows)
+    order = present[numpy.argsort(first[present], kind="stable")]
+    rank = numpy.zeros(space, dtype=numpy.int64)
+    rank[order] = numpy.arange(len(order))
+    return rank[codes], _decode_codes(order.tolist(), encodings)
+
+
+def _accumulate_numpy(measure, cells, column):
+    """
+    _accumulate_dense 的向量化版本：count/sum 用 bincount，min/max 用 ufunc.at（不需要排序）。
+
+    bincount 逐个累加，只在每一步都精确时（整数值且绝对值之和小于 2**53）用于 sum；
+    否则按单元格排序后对每个单元格调用 math.fsum，得到与纯 Python 路径相同的正确舍入的和。
+    """
+    plan = measure.plan
+    n_cells = len(measure.counts)
+    measure.counts = array("q", numpy.bincount(cells, minlength=n_cells).astype(numpy.int64).tobytes())
+    if not plan.numeric or not len(cells):
+        return
+    values = numpy.frombuffer(column, dtype=_typecode(column)).astype(numpy.float64)
+    magnitude = numpy.abs(values).sum()
+    if magnitude < 2 ** 53 and numpy.array_equal(values, numpy.trunc(values)):
+        measure.sums = array("d", numpy.bincount(cells, weights=values, minlength=n_cells).tobytes())
+    else:
+        order = numpy.argsort(cells)
+        sorted_cells = cells[order]
+        starts = numpy.flatnonzero(numpy.diff(sorted_cells, prepend=-1))
+        ordered = values[order].tolist()
+        bounds = starts.tolist() + [len(ordered)]
+        sums = numpy.zeros(n_cells)
+        sums[sorted_cells[starts]] = [_fsum(ordered[a:b]) for a, b in zip(bounds, bounds[1:])]
+        measure.sums = array("d", sums.tobytes())
+    if plan.extrema:
+        mins = numpy.full(n_cells, _INF)
+        maxs = numpy.full(n_cells, -_INF)
+        numpy.minimum.at(mins, cells, values)
+        numpy.maximum.at(maxs, cells, values)
+        measure.mins, measure.maxs = array("d", mins.tobytes()), array("d", maxs.tobytes())
+
+
+def _build_pivot_numpy(table, row_keys, col_keys, measures):
+    """
+    _build_pivot_encoded 的 NumPy 版本：分组编号和 sum/count/min/max 都向量化计算；
+    需要草图的聚合函数（中位数、去重计数等）仍逐行更新。维度组合过于稀疏时返回 None。
+    """
+    stage = _active_stats and _active_stats.begin("pivot.encode_keys")
+    row_index, row_labels = _factorize_numpy(table, row_keys)
+    col_index, col_labels = _factorize_numpy(table, col_keys)
+    if stage:
+        stage.finish(rows=len(table))
+    n_cols = len(col_labels)
+    n_cells = len(row_labels) * n_cols
+    if n_cells > DENSE_CELL_FACTOR * len(table) + 1024:
+        return None
+
+    col_rank = sorted(range(n_cols), key=col_labels.__getitem__)
+    col_labels = [col_labels[i] for i in col_rank]
+    col_pos = numpy.empty(n_cols, dtype=numpy.int64)
+    col_pos[col_rank] = numpy.arange(n_cols)
+    cells = row_index * n_cols + col_pos[col_index]
+
+    states = []
+    cell_list = None
+    for key, funcs in measures:
+        measure = _Measure(key, funcs, n_cells)
+        column = table.column(key)
+        if measure.plan.sketches or (measure.plan.numeric and isinstance(column, DictColumn)):
+            if cell_list is None:
+                cell_list = cells.tolist()
+            _accumulate_dense(measure, cell_list, column)
+        else:
+            _accumulate_numpy(measure, cells, column)
+        states.append(measure)
+    return PivotResult(row_keys, col_keys, states, row_labels, col_labels)
+
+
+def _aggregate_inputs(inputs, plans, pivot_data=None):
+    """
+    把 (行键, 列键, 值元组) 累加到部分聚合状态中。
+
+    部分状态的每个单元格是各值字段状态的列表，每个状态是 [sum, count, min, max, 草图...]，
+    可以在多个分区之间直接合并。
+
+    参数：
+        inputs (iterable): _iter_pivot_inputs 产出的三元组。
+        plans (list of _AggregationPlan): 每个值字段需要维护的状态。
+        pivot_data (dict): 已有的部分状态；为 None 时新建。
+
+    返回：
+        pivot_data (dict): {行键: {列键: 单元格状态}}，行键按首次出现的顺序排列。
+    """
+    if pivot_data is None:
+        pivot_data = {}
+    specs = [(plan.numeric, list(enumerate(plan.sketches, 4))) for plan in plans]
+    # 累加过的 sum 状态：值先收集在 state[0] 的列表中，最后精确求和（见 _exact_sum）
+    pending = []
+
+    for row_key, col_key, raws in inputs:
+        row_data = pivot_data.get(row_key)
+        if row_data is None:
+            row_data = pivot_data[row_key] = {}
+        cell = row_data.get(col_key)
+        if cell is None:
+            cell = row_data[col_key] = [plan.new_cell() for plan in plans]
+
+        for state, (numeric, sketches), raw in zip(cell, specs, raws):
+            state[1] += 1
+            value = raw
+            if numeric:
+                value = float(raw)
+                values = state[0]
+                if values.__class__ is not list:
+                    values = state[0] = [values]
+                    pending.append(state)
+                elif len(values) > _EXACT_SUM_CHUNK:
+                    values[:] = [_exact_sum(values)]
+                values.append(value)
+                if value < state[2]:
+                    state[2] = value
+                if value > state[3]:
+                    state[3] = value
+            for i, agg in sketches:
+                agg.update(state[i], value if agg.numeric else raw)
+
+    for state in pending:
+        state[0] = _exact_sum(state[0])
+    return pivot_data
+
+
+def _merge_partials(pivot_data, partial, plans):
+    """
+    把另一个分区的部分状态合并到 pivot_data 中（原地修改）。
+
+    按分区顺序合并可以保证行键的顺序与串行扫描时一致。
+    """
+    for row_key, partial_row in partial.items():
+        row_data = pivot_data.get(row_key)
+        if row_data is None:
+            pivot_data[row_key] = partial_row
+            continue
+        for col_key, other in partial_row.items():
+            cell = row_data.get(col_key)
+            if cell is None:
+                row_data[col_key] = other
+            else:
+                for plan, state, other_state in zip(plans, cell, other):
+                    plan.merge_cell(state, other_state)
+    return pivot_data
+
+
+def build_pivot(data, row_keys, col_keys, value_key, aggregation_funcs, backend="auto", filters=()):
+    """
+    扫描一次数据，构建透视表的聚合结果。
+
+    对 Table 可以使用 NumPy 向量化聚合（backend="numpy"）；"auto" 在 NumPy 可以导入时使用它，
+    否则使用纯 Python 路径（"python"）。两条路径的输出完全相同。
+
+    有过滤条件时，对 Table 先用位图索引选出匹配的行（见 Table.select），只取出并聚合这些行；
+    结果与用同样的条件加载数据后再透视相同。
+
+    参数：
+        data (Table 或 iterable of dict): 数据集，也可以是 iter_csv_rows 产出的行。
+        row_keys (list of str): 用于行分组的列名的列表。
+        col_keys (list of str): 用于列分组的列名的列表。
+        value_key (str 或 list of str): 值字段的列名；多个值字段时传入列表。
+        aggregation_funcs (list): 聚合函数的列表（见 AGGREGATORS）；多个值字段时是
+            与 value_key 一一对应的聚合函数列表的列表（见 normalize_measures）。
+        backend (str): "auto"、"python" 或 "numpy"。
+        filters (iterable): 行过滤条件（见 normalize_filter），彼此之间为 AND。
+
+    返回：
+        result (PivotResult): 聚合结果。
+    """
+    if backend not in ("auto", "python", "numpy"):
+        raise ValueError(f"未知的聚合后端: {backend}")
+    if backend == "numpy" and numpy is None:
+        raise ImportError("backend='numpy' 需要安装 NumPy")
+    measures = normalize_measures(value_key, aggregation_funcs)
+    stage = _active_stats and _active_stats.begin("pivot")
+    result = None
+    if filters and isinstance(data, Table):
+        # 只复制匹配的行中用到的列，之后与不带过滤条件时走同样的（向量化）聚合路径
+        needed = dict.fromkeys(list(row_keys) + list(col_keys) + [key for key, _ in measures])
+        data = data.take(data.select(filters), needed)
+    elif filters:
+        data = _filter_rows(data, filters)
+    if isinstance(data, Table):
+        if backend != "python" and numpy is not None:
+            result = _build_pivot_numpy(data, row_keys, col_keys, measures)
+        else:
+            result = _build_pivot_encoded(data, row_keys, col_keys, measures)
+    if result is None:
+        plans = [_AggregationPlan(funcs) for _, funcs in measures]
+        inputs = _iter_pivot_inputs(data, row_keys, col_keys, [key for key, _ in measures])
+        result = PivotResult.from_partials(row_keys, col_keys, measures, _aggregate_inputs(inputs, plans))
+    if stage:
+        stage.finish(rows=len(data) if isinstance(data, (Table, list)) else None, cells=_count_cells(result))
+    return result
+
+
+def _grouping_states(result, row_positions, col_positions):
+    """
+    把最细粒度的单元格状态按行键/列键的一部分合并，得到一个分组集合的聚合状态，不需要重新扫描数据。
+
+    参数：
+        result (PivotResult): 聚合结果。
+        row_positions (tuple of int): 保留的行分组列在 row_keys 中的位置。
+        col_positions (tuple of int): 保留的列分组列在 col_keys 中的位置。
+
+    返回：
+        states (dict): {(行键, 列键): [每个值字段的稀疏状态]}，行键按首次出现的顺序排列。
+    """
+    measures = result.measures
+    plans = [measure.plan for measure in measures]
+    counts = measures[0].counts
+    n_cols = len(result.col_labels)
+    col_groups = [tuple(label[i] for i in col_positions) for label in result.col_labels]
+    states = {}
+    for r, row_label in enumerate(result.row_labels):
+        row_group = tuple(row_label[i] for i in row_positions)
+        base = r * n_cols
+        for c, col_group in enumerate(col_groups):
+            cell = base + c
+            if not counts[cell]:
+                continue
+            key = (row_group, col_group)
+            total = states.get(key)
+            if total is None:
+                total = states[key] = [plan.new_cell() for plan in plans]
+            for plan, state, measure in zip(plans, total, measures):
+                plan.merge_cell(state, measure.state(cell))
+    return states
+
+
+def grouping_sets(result, cube=False):
+    """
+    计算各级小计和总计（ROLLUP，或 CUBE）。所有分组集合都由最细粒度的单元格状态合并而来，
+    代价与单元格数成正比，与输入行数无关；每个聚合函数分别计算（平均值是总和除以总个数，
+    中位数和去重计数合并草图），而不是把格式化后的数值相加。
+
+    ROLLUP 对行分组列的每个前缀（从全部行分组列到空）分别按全部列键和不按列键分组；
+    CUBE 对行分组列和列分组列的所有子集组合分组。
+
+    参数：
+        result (PivotResult): 聚合结果。
+        cube (bool): 为 True 时计算 CUBE，否则计算 ROLLUP。
+
+    返回：
+        sets (dict): {(行分组列元组, 列分组列元组): {(行键, 列键): [每个值字段的 {聚合函数: 值}]}}。
+    """
+    n_rows, n_cols = len(result.row_keys), len(result.col_keys)
+    if cube:
+        row_sets = [p for k in range(n_rows, -1, -1) for p in combinations(range(n_rows), k)]
+        col_sets = [p for k in range(n_cols, -1, -1) for p in combinations(range(n_cols), k)]
+    else:
+        row_sets = [tuple(range(k)) for k in range(n_rows, -1, -1)]
+        col_sets = list(dict.fromkeys([tuple(range(n_cols)), ()]))
+    plans = [measure.plan for measure in result.measures]
+
+    sets = {}
+    for row_positions in row_sets:
+        for col_positions in col_sets:
+            states = _grouping_states(result, row_positions, col_positions)
+            name = (tuple(result.row_keys[i] for i in row_positions),
+                    tuple(result.col_keys[i] for i in col_positions))
+            sets[name] = {key: [plan.finalize(state) for plan, state in zip(plans, cell)]
+                          for key, cell in states.items()}
+    return sets
+
+
+def _subtotal_order(row_labels, depth):
+    """把行按前 depth 层行键分组排列（每层按首次出现的顺序），以便在每组之后插入小计行。"""
+    ranks = [{} for _ in range(depth)]
+    keys = []
+    for r, label in enumerate(row_labels):
+        keys.append(tuple(rank.setdefault(label[:level + 1], len(rank)) for level, rank in enumerate(ranks)) + (r,))
+    return sorted(range(len(row_labels)), key=keys.__getitem__)
+
+
+def _row_sort_values(result, by, column):
+    """每一行的排序值：by 为 "label" 时是行键，否则是指定值列的行总计（或某个列键下的值），没有数据时为 None。"""
+    if by == "label":
+        return result.row_labels
+    matches = [(m, func) for m, func, label in result.value_columns if by in (label, func)]
+    if not matches:
+        choices = ", ".join(["label"] + [label for _, _, label in result.value_columns])
+        raise ValueError(f"未知的排序依据: {by}（可选 {choices}）")
+    m, func = matches[0]
+    measure = result.measures[m]
+
+    if column is None:
+        row_totals = _grouping_states(result, tuple(range(len(result.row_keys))), ())
+        values = []
+        for row_label in result.row_labels:
+            total = row_totals.get((row_label, ()))
+            values.append(None if total is None else measure.plan.finalize(total[m])[func])
+        return values
+
+    column = tuple(column) if isinstance(column, (list, tuple)) else (column,)
+    # 命令行给出的列键是字符串，按文本匹配已解析为数值/日期的列键
+    positions = [i for i, label in enumerate(result.col_labels)
+                 if label == column or tuple(map(str, label)) == tuple(map(str, column))]
+    if not positions:
+        raise ValueError(f"列键不存在: {column}")
+    n_cols = len(result.col_labels)
+    col_index = positions[0]
+    cells = range(col_index, n_cols * len(result.row_labels), n_cols)
+    return [None if not measure.counts[cell] else measure.values(cell)[func] for cell in cells]
+
+
+def sort_rows(result, by="label", column=None, descending=False, limit=None):
+    """
+    对聚合结果的行排序，或只保留前 N / 后 N 行。
+
+    排序值只对每一行计算一次；指定 limit 时用大小为 limit 的堆（heapq.nlargest / nsmallest）选出行，
+    代价是 O(行数 × log limit)，而不是对所有行完整排序。排序是稳定的，值相同的行保持原来的顺序；
+    没有数据的行总是排在最后。Total 行由保留下来的行计算。
+
+    参数：
+        result (PivotResult): 聚合结果。
+        by (str): "label" 按行键排序；否则是值列的表头文本（如 "sum of Salary"）或聚合函数名（如 "sum"），
+            按这一列的行总计排序。
+        column: 与 by 一起使用，按这个列键下的值（而不是行总计）排序；只有一个列分组列时可以直接给出取值。
+        descending (bool): 是否降序。
+        limit (int): 只保留排序后的前 limit 行；降序时即 “前 N 行”，升序时即 “后 N 行”。
+
+    返回：
+        result (PivotResult): 行按顺序排列的新结果。
+    """
+    values = _row_sort_values(result, by, column)
+    rows = range(len(result.row_labels))
+    if by == "label":
+        key = values.__getitem__
+    elif descending:
+        key = lambda r: (values[r] is not None, values[r] or 0)  # 缺失值最小，排在最后
+    else:
+        key = lambda r: (values[r] is None, values[r] or 0)  # 缺失值最大，排在最后
+
+    if limit is None:
+        order = sorted(rows, key=key, reverse=descending)
+    else:
+        order = (heapq.nlargest if descending else heapq.nsmallest)(limit, rows, key=key)
+    return result.take_rows(order)
+
+
+def pivot_lines(result, totals=True, missing=" ", subtotals=False):
+    """
+    把聚合结果展开为输出行，每行是一个字符串列表。
+
+    有多个值字段时，每个列键下依次排列各值字段的各聚合函数（与 Excel 的“值”区域一致），
+    表头显示为 “聚合函数 of 值字段”。
+    总计由单元格的聚合状态合并得到（见 grouping_sets），每个聚合函数各有一列行总计。
+
+    参数：
+        result (PivotResult): 聚合结果。
+        totals (bool): 是否输出行总计和列总计。
+        missing (str): 单元格没有数据时填充的文本。
+        subtotals (bool): 有多个行分组列时，是否按行分组列的每一层输出小计行（ROLLUP）。
+
+    产出：
+        line (list of str): 一行输出。
+    """
+    for batch in pivot_batches(result, totals, missing, subtotals):
+        yield from batch
+
+
+def pivot_batches(result, totals=True, missing=" ", subtotals=False):
+    """
+    与 pivot_lines 相同的输出行，按块产出，供写入器成批编码（见 PivotWriter）。
+
+    参数与 pivot_lines 相同。
+
+    产出：
+        batch (list of list of str): 连续的若干行输出。
+    """
+    yield list(_header_lines(result, totals))
+    if subtotals and totals and len(result.row_keys) > 1:
+        lines = _body_lines(result, missing)
+        while True:
+            batch = list(islice(lines, FORMAT_CHUNK_ROWS))
+            if not batch:
+                break
+            yield batch
+    else:
+        yield from _body_batches(result, totals, missing)
+    if totals:
+        # 列总计与全部总计
+        yield [_total_line(result, *_column_totals(result), missing)]
+
+
+def _header_lines(result, totals):
+    """表头：每个列分组列一行标签，再加一行聚合函数名。"""
+    row_keys = result.row_keys
+    value_columns = result.value_columns
+    # 只有一个聚合函数时行总计只有一列，表头与旧格式保持一致
+    total_header = [label for _, _, label in value_columns] if totals and len(value_columns) > 1 else [""]
+
+    # 列标签
+    for i in range(len(result.col_keys)):
+        # 在第二行导入行标签
+        row_labels = "/".join(row_keys)
+        total_label = ["Total"] + [""] * (len(total_header) - 1) if i == 0 and len(total_header) > 1 else [""] * len(total_header)
+        yield [row_labels] + [""] * (len(row_keys) - 1) + [str(col[i]) for col in result.col_labels for _ in
+                                                           value_columns] + total_label
+    yield [""] * len(row_keys) + [label for _ in result.col_labels for _, _, label in value_columns] + total_header
+
+
+def _format_values(result, cells, missing):
+    """把一行各列键的 [每个值字段的 {聚合函数: 值}] 格式化为文本。"""
+    return [missing if cells[cell_index] is None or cells[cell_index][m] is None
+            else str(cells[cell_index][m].get(func, missing))
+            for cell_index in range(len(result.col_labels)) for m, func, _ in result.value_columns]
+
+
+def _format_totals(result, state):
+    """把一个总计的聚合状态格式化为每个 (值字段, 聚合函数) 一列的文本。"""
+    values = [measure.plan.finalize(measure_state) for measure, measure_state in zip(result.measures, state)]
+    return [str(values[m][func]) for m, func, _ in result.value_columns]
+
+
+def _finalize_cells(result, states):
+    return [None if state is None else [measure.plan.finalize(s) for measure, s in zip(result.measures, state)]
+            for state in states]
+
+
+# 没有小计行时，数据行按块格式化：每块 FORMAT_CHUNK_ROWS 行，每个值列批量转换为文本（见 Aggregator.finalize_column），
+# 行总计和列总计按列累加，而不是为每个单元格构造状态和字典；格式化完一块就产出，输出不必等全部行格式化完成。
+# 累加的顺序与 _grouping_states 相同，所以输出与逐个单元格合并时完全一致。
+FORMAT_CHUNK_ROWS = 4096
+
+
+def _column_texts(agg, base, states, missing):
+    """
+    把一组单元格上一个聚合函数的值转换为文本，与逐个单元格 str(finalize(...)) 的结果相同。
+
+    参数:
+        agg (Aggregator): 聚合函数。
+        base (tuple): 这些单元格的 (sums, counts, mins, maxs)。
+        states (sequence): 这些单元格上 agg 的草图状态；没有草图时为 None。
+        missing (str): count 为 0 的单元格的文本。
+    """
+    counts = base[1]
+    texts = list(map(str, agg.finalize_column(*base, states)))
+    if not all(counts):
+        for i in compress(count(), map(operator.not_, counts)):
+            texts[i] = missing
+    return texts
+
+
+def _fold_states(measure, mask, cells):
+    """
+    按单元格顺序合并一个值字段在切片 cells 上、mask 非零的单元格，与 _grouping_states 的合并结果相同。
+
+    返回:
+        state (list): 稀疏状态 [sum, count, min, max, 草图...]。
+    """
+    plan = measure.plan
+    state = plan.new_cell()
+    if plan.sketches:
+        for cell in range(*cells.indices(len(mask))):
+            if mask[cell]:
+                plan.merge_cell(state, measure.state(cell))
+        return state
+    present = mask[cells]
+    # 与逐个 merge_cell 相同：sum 精确求和，count 按顺序相加，min/max 比较
+    state[0] = _fsum(compress(measure.sums[cells], present))
+    state[1] = reduce(operator.add, compress(measure.counts[cells], present), state[1])
+    if plan.extrema:
+        state[2] = min(chain((state[2],), compress(measure.mins[cells], present)))
+        state[3] = max(chain((state[3],), compress(measure.maxs[cells], present)))
+    return state
+
+
+def _column_totals(result):
+    """列总计与全部总计的状态，即 _grouping_states(result, (), 全部列) 和 _grouping_states(result, (), ()) 的结果。"""
+    measures = result.measures
+    mask = measures[0].counts
+    n_cols = len(result.col_labels)
+    col_totals = {}
+    for c, col in enumerate(result.col_labels):
+        states = [_fold_states(measure, mask, slice(c, None, n_cols)) for measure in measures]
+        if states[0][1]:
+            col_totals[(), col] = states
+    grand_total = [_fold_states(measure, mask, slice(None)) for measure in measures]
+    return col_totals, grand_total if grand_total[0][1] else None
+
+
+def _row_totals(measure, mask, first, last, n_cols):
+    """
+    第 first~last-1 行各自的行总计，按列累加；sum 与 _fold_states 一样精确求和。
+
+    返回:
+        base (tuple): 各行的 (sums, counts, mins, maxs)。
+        sketches (dict): {聚合函数名: 各行的草图状态}。
+    """
+    plan = measure.plan
+    if plan.sketches:
+        states = [_fold_states(measure, mask, slice(r * n_cols, (r + 1) * n_cols)) for r in range(first, last)]
+        return (tuple([state[i] for state in states] for i in range(4)),
+                {agg.name: [state[i] for state in states] for i, agg in enumerate(plan.sketches, 4)})
+    k = last - first
+    sums, counts, mins, maxs = [[] for _ in range(k)], [0] * k, [_INF] * k, [-_INF] * k
+    for c in range(n_cols):
+        cells = slice(first * n_cols + c, last * n_cols, n_cols)
+        present = mask[cells]
+        for values, v, p in zip(sums, measure.sums[cells], present):
+            if p:
+                values.append(v)
+        counts = [t + v if p else t for t, v, p in zip(counts, measure.counts[cells], present)]
+        if plan.extrema:
+            mins = [v if p and v < t else t for t, v, p in zip(mins, measure.mins[cells], present)]
+            maxs = [v if p and v > t else t for t, v, p in zip(maxs, measure.maxs[cells], present)]
+    return (list(map(_fsum, sums)), counts, mins, maxs), {}
+
+
+def _body_batches(result, totals, missing):
+    """没有小计行时的数据行：按块、按值列格式化（见本节说明），每块产出一次。"""
+    measures = result.measures
+    mask = measures[0].counts
+    n_cols = len(result.col_labels)
+    n_row_keys = len(result.row_keys)
+    value_columns = [(m, measures[m].plan.aggregators[func]) for m, func, _ in result.value_columns]
+    for first in range(0, len(result.row_labels), FORMAT_CHUNK_ROWS):
+        labels = result.row_labels[first:first + FORMAT_CHUNK_ROWS]
+        last = first + len(labels)
+        columns = [[str(label[i]) for label in labels] for i in range(n_row_keys)]
+        for c in range(n_cols):
+            cells = slice(first * n_cols + c, last * n_cols, n_cols)
+            bases = [(measure.sums[cells], measure.counts[cells], measure.mins[cells], measure.maxs[cells])
+                     for measure in measures]
+            for m, agg in value_columns:
+                states = measures[m].sketches[agg.name][cells] if agg.sketch else None
+                columns.append(_column_texts(agg, bases[m], states, missing))
+        if totals:
+            row_totals = [_row_totals(measure, mask, first, last, n_cols) for measure in measures]
+            for m, agg in value_columns:
+                base, sketches = row_totals[m]
+                columns.append(_column_texts(agg, base, sketches.get(agg.name), missing))
+        yield list(map(list, zip(*columns)))
+
+
+def _body_lines(result, missing):
+    """带小计行的数据行（有多个行分组列时），每行末尾是按各聚合函数分别计算的行总计。"""
+    n_row_keys = len(result.row_keys)
+    unique_col_labels = result.col_labels
+    all_cols = tuple(range(len(result.col_keys)))
+
+    def group_lines(level, row_label):
+        # 某一层的小计行：前缀标签 + “X Total”，其余行标签留空
+        prefix = row_label[:level]
+        cells = _finalize_cells(result, [level_cells[level].get((prefix, col)) for col in unique_col_labels])
+        line = [str(item) for item in prefix[:-1]] + [f"{prefix[-1]} Total"] + [""] * (n_row_keys - level)
+        return line + _format_values(result, cells, missing) + _format_totals(result, level_totals[level][prefix, ()])
+
+    row_totals = _grouping_states(result, tuple(range(n_row_keys)), ())
+    order = _subtotal_order(result.row_labels, n_row_keys - 1)
+    level_cells = {level: _grouping_states(result, tuple(range(level)), all_cols) for level in range(1, n_row_keys)}
+    level_totals = {level: _grouping_states(result, tuple(range(level)), ()) for level in range(1, n_row_keys)}
+
+    previous = None
+    for row_index in order:
+        row_key = result.row_labels[row_index]
+        if previous is not None:
+            for level in range(n_row_keys - 1, 0, -1):
+                if previous[:level] != row_key[:level]:
+                    yield group_lines(level, previous)
+        previous = row_key
+
+        row = [str(item) for item in row_key]
+        # 此处填充数值
+        row += _format_values(result, [result.cell(row_index, col_index)
+                                       for col_index in range(len(unique_col_labels))], missing)
+        # 此处引入行总计
+        row += _format_totals(result, row_totals[row_key, ()])
+        yield row
+
+    if previous is not None:
+        for level in range(n_row_keys - 1, 0, -1):
+            yield group_lines(level, previous)
+
+
+def _total_line(result, col_totals, grand_total, missing):
+    """
+    Total 行。
+
+    参数：
+        col_totals (dict): {((), 列键): 聚合状态}，见 _grouping_states。
+        grand_total (list): 全部数据的聚合状态；没有数据时为 None。
+    """
+    cells = _finalize_cells(result, [col_totals.get(((), col)) for col in result.col_labels])
+    line = ["Total"] + [""] * (len(result.row_keys) - 1) + _format_values(result, cells, missing)
+    return line + (_format_totals(result, grand_total) if grand_total else [missing] * len(result.value_columns))
+
+
+def pivot_to_rows(result, totals=True, subtotals=False):
+    """
+    内存渲染器：把聚合结果渲染为字符串列表的列表，便于其它程序直接使用。
+
+    参数：
+        result (PivotResult): 聚合结果。
+        totals (bool): 是否包含总计。
+        subtotals (bool): 是否包含各层行分组的小计行。
+
+    返回：
+        rows (list of list of str): 渲染后的所有行。
+    """
+    return list(pivot_lines(result, totals=totals, subtotals=subtotals))
+
+
+def render_pivot_csv(result, output_file, subtotals=False):
+    """
+    文件渲染器：把聚合结果写入 CSV 文件（文件名以 .gz 结尾时压缩）。其它格式见 render_pivot_file。
+
+    参数：
+        result (PivotResult): 聚合结果。
+        output_file (str): 输出文件的路径。
+        subtotals (bool): 是否输出各层行分组的小计行。
+    """
+    render_pivot_file(result, output_file, "csv", subtotals=subtotals)
+
+
+def render_pivot_console(result, totals=True, subtotals=False, pager=None):
+    """
+    控制台渲染器：在控制台上打印聚合结果。
+
+    参数：
+        result (PivotResult): 聚合结果。
+        totals (bool): 是否打印总计。
+        subtotals (bool): 是否打印各层行分组的小计行。
+        pager (bool): 是否分页、按列对齐显示（见 page_pivot_console）；为 None 时
+            标准输入和标准输出都是交互终端时分页，否则逗号分隔地打印全部行。
+    """
+    if pager is None:
+        pager = sys.stdin.isatty() and sys.stdout.isatty()
+    if pager:
+        page_pivot_console(result, totals=totals, subtotals=subtotals)
+        return
+    stage = _active_stats and _active_stats.begin("console")
+    printed = 0
+    for batch in pivot_batches(result, totals=totals, missing="None", subtotals=subtotals):
+        sys.stdout.write("\n".join(map(",".join, batch)) + "\n")
+        printed += len(batch)
+    if stage:
+        stage.finish(rows=printed)
+
+
+def generate_pivot_table(data, row_keys, col_keys, value_key, aggregation_funcs):
+    """
+    生成透视表并在控制台上打印它。
+
+    参数：
+        data (list of dict): 数据列表，其中每个条目是一个包含列名和值的字典。
+        row_keys (list of str): 用于行分组的列名的列表。
+        col_keys (list of str): 用于列分组的列名的列表。
+        value_key (str): 用于值字段的列名。
+        aggregation_funcs (list of str): 用于聚合函数的列表。
+    """
+    render_pivot_console(build_pivot(data, row_keys, col_keys, value_key, aggregation_funcs), totals=False)
+
+
+#Step 11:多维透视表加入统计
+
+def generate_pivot_table_no_csv(data, row_keys, col_keys, value_key, aggregation_funcs, output_file):
+    """
+    生成透视表并将其保存到CSV文件中。
+
+    参数：
+        data (list of dict): 数据列表，其中每个条目是一个包含列名和值的字典。
+        row_keys (list of str): 用于行分组的列名的列表。
+        col_keys (list of str): 用于列分组的列名的列表。
+        value_key (str): 用于值字段的列名。
+        aggregation_funcs (list of str): 用于聚合函数的列表。
+        output_file (str): 输出文件的路径。
+    """
+    render_pivot_csv(build_pivot(data, row_keys, col_keys, value_key, aggregation_funcs), output_file)
+
+
+def generate_pivot_table_console(data, row_keys, col_keys, value_key, aggregation_funcs):
+    """
+    生成透视表并在控制台上打印它。
+
+    参数：
+        data (list of dict): 数据列表，其中每个条目是一个包含列名和值的字典。
+        row_keys (list of str): 用于行分组的列名的列表。
+        col_keys (list of str): 用于列分组的列名的列表。
+        value_key (str): 用于值字段的列名。
+        aggregation_funcs (list of str): 用于聚合函数的列表。
+    """
+    render_pivot_console(build_pivot(data, row_keys, col_keys, value_key, aggregation_funcs))
+
+#%%
+#Step 12:多进程并行透视
+# 把输入文件按换行对齐切分成若干字节区间，每个区间在一个工作进程中聚合成部分状态，
+# 父进程再按区间顺序合并，得到与串行路径相同的结果。
+# 有多个输入文件（如按天分区的文件）时，每个文件各自切分；压缩文件不能按字节切分，
+# 整个文件作为一个任务，在工作进程中边解压边解析，所以总耗时接近最慢的那个文件。
+# 注意：按换行切分要求字段内不包含换行符（带引号的多行字段请使用串行路径）。
+
+# 每个区间的最大字节数，决定了工作进程一次读入内存的数据量。
+PARALLEL_CHUNK_BYTES = 32 << 20
+
+
+def split_byte_ranges(file_path, parts):
+    """
+    把 CSV 文件（去掉表头）切分成按换行对齐的字节区间。
+
+    参数：
+        file_path (str): 文件的路径。
+        parts (int): 期望的区间个数。
+
+    返回：
+        ranges (list of tuple): [(起始偏移, 结束偏移), ...]，首尾相接覆盖全部数据行。
+    """
+    size = os.path.getsize(file_path)
+    with open(file_path, "rb") as file:
+        file.readline()  # 跳过表头
+        start = file.tell()
+        step = max(1, (size - start) // max(1, parts))
+        ranges = []
+        while start < size:
+            file.seek(min(start + step, size))
+            if file.tell() < size:
+                file.readline()  # 把边界推进到下一行的开头
+            end = min(file.tell(), size)
+            ranges.append((start, end))
+            start = end
+    return ranges
+
+
+def _aggregate_byte_range(task):
+    """
+    工作进程：解析一个字节区间（end 为 None 时是整个文件）并返回部分聚合状态。
+    """
+    file_path, start, end, columns, row_keys, col_keys, measures, filters, kinds = task
+    if end is None:
+        file, reader = _open_csv(file_path)
+        next(reader, None)  # 跳过表头
+    else:
+        with open(file_path, "rb") as raw:
+            raw.seek(start)
+            chunk = raw.read(end - start)
+        # 与串行路径相同的解码方式（系统默认编码）
+        file = io.TextIOWrapper(io.BytesIO(chunk), newline="")
+        reader = csv.reader(file)
+    index = {col: i for i, col in enumerate(columns)}
+    row_idx = [index[k] for k in row_keys]
+    col_idx = [index[k] for k in col_keys]
+    value_idx = [index[key] for key, _ in measures]
+    # 与 load_table 相同的列类型；类型在父进程中由样本确定，这里逐值解析
+    parsers = {i: COLUMN_TYPES[kinds[columns[i]]] for i in set(row_idx + col_idx + value_idx)}
+    parsers = {i: parser for i, parser in parsers.items() if parser is not None}
+
+    def parse(values, positions):
+        try:
+            return tuple(parsers[i](values[i]) if i in parsers else values[i] for i in positions)
+        except (ValueError, TypeError) as e:
+            raise ValueError(f"{file_path}: 值无法按推断的类型解析: {e}（可以用 schema 指定更宽的类型）") from None
+
+    with file:
+        keep = _compile_filters(columns, filters)
+        if keep is not None:
+            reader = filter(keep, filter(None, reader))
+        inputs = ((parse(values, row_idx), parse(values, col_idx), parse(values, value_idx))
+                  for values in reader if values)
+        return _aggregate_inputs(inputs, [_AggregationPlan(funcs) for _, funcs in measures])
+
+
+def parallel_build_pivot(file_path, row_keys, col_keys, value_key, aggregation_funcs, workers=None, filters=(),
+                         schema=None):
+    """
+    使用多个进程并行构建透视表的聚合结果。
+
+    每个工作进程返回 sum/count/min/max（以及草图）部分状态，父进程按文件顺序合并，
+    因此行的顺序和各单元格的值（包括非整数的浮点和，见 Step 10 的说明）与 build_pivot
+    串行扫描 load_table 加载的同一数据时完全相同。
+    列类型由第一个文件开头的样本确定（见 infer_schema），之后的值不符合该类型时报错。
+
+    参数：
+        file_path (str 或 list of str): CSV 文件的路径、glob 模式或文件列表（见 expand_paths），
+            可以是 .gz/.bz2/.xz 压缩文件。
+        row_keys (list of str): 用于行分组的列名的列表。
+        col_keys (list of str): 用于列分组的列名的列表。
+        value_key (str 或 list of str): 值字段的列名（见 build_pivot）。
+        aggregation_funcs (list): 聚合函数的列表（见 build_pivot）。
+        workers (int): 工作进程数，默认为 CPU 核数。
+        filters (iterable): 行过滤条件（见 parse_filter），在各工作进程解析时应用。
+        schema (dict): 显式指定的列类型（见 COLUMN_TYPES），其余列按样本推断。
+
+    返回：
+        result (PivotResult): 聚合结果。
+    """
+    workers = workers or os.cpu_count() or 1
+    measures = normalize_measures(value_key, aggregation_funcs)
+    needed = list(dict.fromkeys(list(row_keys) + list(col_keys) + [key for key, _ in measures]))
+    paths = expand_paths(file_path)
+    headers = [read_header(path) for path in paths]
+    for path, columns in zip(paths, headers):
+        for key in needed:
+            if key not in columns:
+                raise KeyError(key if len(paths) == 1 else f"{key}（{path}）")
+    kinds = dict(infer_schema(paths, columns=needed), **_check_schema(schema))
+
+    size = sum(os.path.getsize(path) for path in paths)
+    plain = [path for path in paths if _codec(path) is None]
+    plain_size = sum(os.path.getsize(path) for path in plain)
+    plans = [_AggregationPlan(funcs) for _, funcs in measures]
+    filters = [normalize_filter(f) for f in filters]
+    tasks = []
+    for path, columns in zip(paths, headers):
+        _compile_filters(columns, filters)  # 在主进程中先检查过滤条件
+        if _codec(path) is not None:
+            ranges = [(0, None)]
+        else:
+            # 未压缩的文件按大小分配区间数，使各任务的数据量大致相同
+            share = os.path.getsize(path) / plain_size if plain_size else 1
+            parts = max(1, round(workers * share), -(-os.path.getsize(path) // PARALLEL_CHUNK_BYTES))
+            ranges = split_byte_ranges(path, parts)
+        tasks.extend((path, start, end, columns, row_keys, col_keys, measures, filters, kinds)
+                     for start, end in ranges)
+
+    stage = _active_stats and _active_stats.begin("parallel_pivot")
+    pivot_data = {}
+    if workers == 1 or len(tasks) <= 1:
+        for task in tasks:
+            _merge_partials(pivot_data, _aggregate_byte_range(task), plans)
+    else:
+        with multiprocessing.Pool(min(workers, len(tasks))) as pool:
+            # imap 按任务顺序返回结果，保证合并顺序与文件顺序一致
+            for partial in pool.imap(_aggregate_byte_range, tasks):
+                _merge_partials(pivot_data, partial, plans)
+
+    result = PivotResult.from_partials(row_keys, col_keys, measures, pivot_data)
+    if stage:
+        stage.finish(bytes_read=size, cells=_count_cells(result))
+    return result
+
+
+def generate_pivot_table_parallel(file_path, row_keys, col_keys, value_key, aggregation_funcs, output_file,
+                                  workers=None):
+    """
+    并行生成透视表并将其保存到CSV文件中，输出与 generate_pivot_table_no_csv 相同。
+
+    参数：
+        file_path (str): 输入 CSV 文件的路径。
+        row_keys (list of str): 用于行分组的列名的列表。
+        col_keys (list of str): 用于列分组的列名的列表。
+        value_key (str): 用于值字段的列名。
+        aggregation_funcs (list of str): 用于聚合函数的列表。
+        output_file (str): 输出文件的路径。
+        workers (int): 工作进程数，默认为 CPU 核数。
+    """
+    render_pivot_csv(
+        parallel_build_pivot(file_path, row_keys, col_keys, value_key, aggregation_funcs, workers),
+        output_file,
+    )
+
+#%%
+#Step 13:增量维护的透视表
+# MaterializedPivot 订阅 Table 的修改，把每次增删行转换成对单元格及其行/列/总计的增量更新，
+# 而不是重新扫描整个数据集。sum/count 可以直接撤销；删除的值恰好是 min/max，
+# 或者使用了不可撤销的草图（中位数、去重计数）时，只把受影响的单元格标记为过期，
+# 读取时由每个单元格保存的值的多重集（Counter）重算，不需要重新扫描数据表。
+
+class MaterializedPivot:
+    """
+    随 Table 修改而自动更新的透视表。
+
+    参数:
+        table (Table): 数据表。
+        row_keys (list of str): 用于行分组的列名的列表。
+        col_keys (list of str): 用于列分组的列名的列表。
+        value_key (str 或 list of str): 值字段的列名（见 build_pivot）。
+        aggregation_funcs (list): 聚合函数的列表（见 build_pivot）。
+
+    行的顺序保持为各行键首次出现的顺序；删除行不会改变已有行键的位置。
+    """
+
+    def __init__(self, table, row_keys, col_keys, value_key, aggregation_funcs):
+        self.table = table
+        self.row_keys = list(row_keys)
+        self.col_keys = list(col_keys)
+        self.measures = normalize_measures(value_key, aggregation_funcs)
+        self.plans = [_AggregationPlan(funcs) for _, funcs in self.measures]
+        self.value_keys = [key for key, _ in self.measures]
+        # min/max 和草图不能撤销一个值，需要保存每个单元格的值的多重集，用于重算过期的单元格
+        self._tracked = any(plan.extrema or plan.sketches for plan in self.plans)
+        self.valid = True
+        self._refresh()
+        table.subscribe(self._on_change)
+
+    def close(self):
+        """停止跟踪表的修改。"""
+        self.table.unsubscribe(self._on_change)
+
+    def _new_cell(self):
+        return [plan.new_cell() for plan in self.plans]
+
+    def _merge_cell(self, cell, other):
+        for plan, state, other_state in zip(self.plans, cell, other):
+            plan.merge_cell(state, other_state)
+
+    def _refresh(self):
+        """全量重建：用一次扫描得到所有单元格，再由单元格合并出各级总计。"""
+        result = build_pivot(self.table, self.row_keys, self.col_keys, self.value_keys,
+                             [funcs for _, funcs in self.measures])
+        self.cells = {}
+        n_cols = len(result.col_labels)
+        for r, row_label in enumerate(result.row_labels):
+            for c, col_label in enumerate(result.col_labels):
+                i = r * n_cols + c
+                if result.measures[0].counts[i]:
+                    self.cells[row_label, col_label] = [m.state(i) for m in result.measures]
+        self.rows = dict.fromkeys(result.row_labels)
+        self._values = {}
+        if self._tracked:
+            for row_label, col_label, raws in _iter_pivot_inputs(self.table, self.row_keys, self.col_keys,
+                                                                 self.value_keys):
+                values = self._values.get((row_label, col_label))
+                if values is None:
+                    values = self._values[row_label, col_label] = Counter()
+                values[raws] += 1
+        self._stale_cells = set()
+        self._rebuild_totals()
+
+    def _rebuild_totals(self):
+        self.row_totals, self.col_totals = {}, {}
+        self.grand_total = self._new_cell()
+        for (row_label, col_label), cell in self.cells.items():
+            for totals, label in ((self.row_totals, row_label), (self.col_totals, col_label)):
+                total = totals.get(label)
+                if total is None:
+                    total = totals[label] = self._new_cell()
+                self._merge_cell(total, cell)
+            self._merge_cell(self.grand_total, cell)
+        self._stale_totals = False
+
+    def _on_change(self, event, *args):
+        if not self.valid:
+            return
+        if event == "add_row":
+            if set(args[2]) & set(self.row_keys + self.col_keys + self.value_keys):
+                # 透视字段所用的列被放宽了类型，已有的键和值都变了，只能全量重建
+                self._refresh()
+            else:
+                self._apply(args[1], 1)
+        elif event == "delete_row":
+            self._apply(args[1], -1)
+        elif event == "delete_column" and args[0] in self.row_keys + self.col_keys + self.value_keys:
+            self.valid = False
+            self.close()
+        # 新增的列不会被已定义的透视字段使用，无需处理
+
+    def _apply(self, row, sign):
+        """把一行的贡献加入（sign=1）或撤销（sign=-1）。"""
+        row_label = tuple(row[k] for k in self.row_keys)
+        col_label = tuple(row[k] for k in self.col_keys)
+        raws = tuple(row[k] for k in self.value_keys)
+        values = [float(raw) if plan.numeric else raw for plan, raw in zip(self.plans, raws)]
+        key = (row_label, col_label)
+        if self._tracked:
+            counter = self._values.get(key)
+            if counter is None:
+                counter = self._values[key] = Counter()
+            counter[raws] += sign
+            if not counter[raws]:
+                del counter[raws]
+
+        if sign > 0:
+            self.rows.setdefault(row_label)
+            targets = [self.cells.setdefault(key, self._new_cell()),
+                       self.row_totals.setdefault(row_label, self._new_cell()),
+                       self.col_totals.setdefault(col_label, self._new_cell()),
+                       self.grand_total]
+            for cell in targets:
+                for plan, state, value, raw in zip(self.plans, cell, values, raws):
+                    state[1] += 1
+                    if plan.numeric:
+                        state[0] += value
+                        if value < state[2]:
+                            state[2] = value
+                        if value > state[3]:
+                            state[3] = value
+                    for i, agg in enumerate(plan.sketches, 4):
+                        agg.update(state[i], value if agg.numeric else raw)
+            return
+
+        cell = self.cells[key]
+        invertible = True
+        for plan, state, value in zip(self.plans, cell, values):
+            state[1] -= 1
+            if plan.numeric:
+                state[0] -= value
+            if plan.sketches or (plan.extrema and (value <= state[2] or value >= state[3])):
+                invertible = False
+        if cell[0][1] == 0:
+            del self.cells[key]
+            self._values.pop(key, None)
+            self._stale_cells.discard(key)
+            invertible = False
+        elif not invertible:
+            # 不可撤销的状态：读取时重算这个单元格
+            self._stale_cells.add(key)
+        if not invertible or self._stale_totals:
+            self._stale_totals = True
+        else:
+            for total in (self.row_totals[row_label], self.col_totals[col_label], self.grand_total):
+                for plan, state, value in zip(self.plans, total, values):
+                    state[1] -= 1
+                    if plan.numeric:
+                        state[0] -= value
+
+    def _recompute_stale(self):
+        """由值的多重集重算过期的单元格，代价只与这些单元格中的值的个数有关；再重新合并各级总计。"""
+        if not self.valid:
+            raise ValueError("透视字段所用的列已被删除，请重新定义透视表")
+        if self._stale_cells:
+            partial = _aggregate_inputs(
+                chain.from_iterable(repeat((row_label, col_label, raws), n)
+                                    for row_label, col_label in self._stale_cells
+                                    for raws, n in self._values[row_label, col_label].items()),
+                self.plans)
+            for row_label, row_data in partial.items():
+                for col_label, cell in row_data.items():
+                    self.cells[row_label, col_label] = cell
+            self._stale_cells = set()
+        if self._stale_totals:
+            self._rebuild_totals()
+            # 已经没有数据的行键不再输出
+            self.rows = {label: None for label in self.rows if label in self.row_totals}
+
+    def _finalize(self, cell):
+        if cell is None or not cell[0][1]:
+            return None
+        return [plan.finalize(state) for plan, state in zip(self.plans, cell)]
+
+    def cell(self, row_label, col_label):
+        """返回一个单元格每个值字段的 {聚合函数: 值} 列表；没有数据时返回 None。"""
+        self._recompute_stale()
+        return self._finalize(self.cells.get((tuple(row_label), tuple(col_label))))
+
+    def row_total(self, row_label):
+        """返回一行的总计（按各聚合函数分别计算）。"""
+        self._recompute_stale()
+        return self._finalize(self.row_totals.get(tuple(row_label)))
+
+    def col_total(self, col_label):
+        """返回一列的总计（按各聚合函数分别计算）。"""
+        self._recompute_stale()
+        return self._finalize(self.col_totals.get(tuple(col_label)))
+
+    def total(self):
+        """返回全部数据的总计（按各聚合函数分别计算）。"""
+        self._recompute_stale()
+        return self._finalize(self.grand_total)
+
+    def result(self):
+        """
+        把当前状态导出为 PivotResult，可以交给任意渲染器；代价只与单元格数有关。
+        """
+        self._recompute_stale()
+        row_labels = list(self.rows)
+        col_labels = sorted(self.col_totals)
+        col_pos = {label: c for c, label in enumerate(col_labels)}
+        row_pos = {label: r for r, label in enumerate(row_labels)}
+        n_cols = len(col_labels)
+        measures = [_Measure(key, funcs, len(row_labels) * n_cols) for key, funcs in self.measures]
+        for (row_label, col_label), cell in self.cells.items():
+            i = row_pos[row_label] * n_cols + col_pos[col_label]
+            for measure, state in zip(measures, cell):
+                measure.set_state(i, state)
+        return PivotResult(self.row_keys, self.col_keys, measures, row_labels, col_labels)
+
+
+#%%
+#Step 14:透视结果缓存
+# 同样的透视字段在未修改的数据上重复运行时，直接返回缓存的结果。
+# 缓存键 = 数据指纹（Table 的编号和版本号，或每个 CSV 文件的路径、大小和修改时间）+ 规范化的字段定义。
+# 按最近最少使用（LRU）的顺序淘汰，总大小不超过内存预算。
+
+# 缓存的默认内存预算（字节）
+DEFAULT_CACHE_BYTES = 256 << 20
+
+
+def _is_path_input(data):
+    """判断 data 是文件输入（路径、glob 模式或它们的列表，见 expand_paths），而不是行字典的列表。"""
+    if isinstance(data, (str, os.PathLike)):
+        return True
+    return (isinstance(data, (list, tuple)) and len(data) > 0
+            and all(isinstance(item, (str, os.PathLike)) for item in data))
+
+
+def data_fingerprint(data):
+    """
+    返回数据集的指纹；无法判断是否被修改的数据（如普通的 list）返回 None。
+
+    参数:
+        data (Table、str 或 list of str): 数据表，或 CSV 文件的路径、glob 模式或文件列表。
+            文件输入先展开，指纹包含每个文件的 (绝对路径, 大小, 修改时间)，
+            所以 glob 新匹配到的文件和任何一个文件的修改都会使指纹改变。
+    """
+    if isinstance(data, Table):
+        return ("table",) + data.fingerprint()
+    if _is_path_input(data):
+        files = []
+        for path in expand_paths(data):
+            stat = os.stat(path)
+            files.append((os.path.abspath(path), stat.st_size, stat.st_mtime_ns))
+        return ("files",) + tuple(files)
+    return None
+
+
+def normalize_pivot_spec(row_keys, col_keys, value_key, aggregation_funcs):
+    """
+    把透视字段定义规范化为可哈希的元组，作为缓存键的一部分。
+    """
+    measures = tuple((key.strip(), tuple(f.strip() for f in funcs))
+                     for key, funcs in normalize_measures(value_key, aggregation_funcs))
+    return tuple(k.strip() for k in row_keys), tuple(k.strip() for k in col_keys), measures
+
+
+def estimate_result_bytes(result):
+    """粗略估计一个 PivotResult 占用的内存（字节）。"""
+    size = 64 * (len(result.row_labels) + len(result.col_labels))
+    for measure in result.measures:
+        size += sum(arr.itemsize * len(arr) for arr in (measure.sums, measure.counts, measure.mins, measure.maxs))
+        for states in measure.sketches.values():
+            size += sum(1024 for state in states if state is not None)
+    return size
+
+
+class PivotCache:
+    """
+    带内存预算和 LRU 淘汰的透视结果缓存。
+
+    参数:
+        max_bytes (int): 内存预算（字节）。
+
+    属性:
+        hits, misses, evictions, invalidations (int): 命中/未命中/淘汰/失效的次数。
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # 键 -> (结果, 大小)
+        self._subscribed = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def pivot(self, data, row_keys, col_keys, value_key, aggregation_funcs):
+        """
+        返回透视结果：命中缓存时直接返回，否则调用 build_pivot 并缓存结果。
+
+        参数:
+            data (Table、str 或 list of str): 数据表，或 CSV 文件的路径、glob 模式或文件列表；
+                其它数据不缓存。文件只加载用到的列，按与 load_table 相同的类型推断透视，
+                结果与先加载成 Table 再透视相同。
+            其余参数同 build_pivot。
+        """
+        fingerprint = data_fingerprint(data)
+        if fingerprint is None:
+            self.misses += 1
+            return build_pivot(data, row_keys, col_keys, value_key, aggregation_funcs)
+
+        key = (fingerprint, normalize_pivot_spec(row_keys, col_keys, value_key, aggregation_funcs))
+        entry = self._entries.get(key)
+        if entry is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return entry[0]
+
+        self.misses += 1
+        source = data
+        if fingerprint[0] == "files":
+            # 加载计算指纹时展开的那些文件，而不是重新展开 glob
+            needed = dict.fromkeys(list(row_keys) + list(col_keys)
+                                   + [key for key, _ in normalize_measures(value_key, aggregation_funcs)])
+            source = load_table([path for path, _, _ in fingerprint[1:]], columns=list(needed))
+        result = build_pivot(source, row_keys, col_keys, value_key, aggregation_funcs)
+        self._store(key, result)
+        if isinstance(data, Table) and data.id not in self._subscribed:
+            data.subscribe(lambda *_, table_id=data.id: self.invalidate(table_id))
+            self._subscribed.add(data.id)
+        return result
+
+    def _store(self, key, result):
+        size = estimate_result_bytes(result)
+        if size > self.max_bytes:
+            return  # 比整个预算还大的结果不缓存
+        self._entries[key] = (result, size)
+        self.current_bytes += size
+        while self.current_bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted
+            self.evictions += 1
+
+    def invalidate(self, table_id=None):
+        """
+        丢弃某个表（table_id 为 None 时是全部数据）的缓存结果。
+        """
+        for key in [key for key in self._entries if table_id is None or key[0][:2] == ("table", table_id)]:
+            self.current_bytes -= self._entries.pop(key)[1]
+            self.invalidations += 1
+
+    def stats(self):
+        """返回缓存的统计信息。"""
+        lookups = self.hits + self.misses
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+# 模块级的默认缓存，菜单和批处理共用
+pivot_cache = PivotCache()
+
+
+#%%
+#Step 15:二进制列式快照
+# 把解析好的、带类型的、字典编码的 Table 保存为二进制快照文件，下次用 mmap 打开：
+# 数值列和编码列直接是文件映射上的 memoryview（零拷贝），只需解析一个很小的 JSON 文件头。
+# 快照记录了源 CSV 文件的大小和修改时间，源文件变化后快照自动失效并重新生成。
+#
+# 文件格式：魔数(8 字节) + 文件头长度(8 字节，小端) + JSON 文件头 + 按 8 字节对齐的各列数据。
+
+SNAPSHOT_MAGIC = b"PYPIVOT\x01"
+# 默认的快照文件名 = CSV 文件名 + 后缀
+SNAPSHOT_SUFFIX = ".pvsnap"
+
+
+def _source_stat(source_path):
+    """返回源文件的 {size, mtime_ns}，用于判断快照是否过期。"""
+    stat = os.stat(source_path)
+    return {"size": stat.st_size, "mtime_ns": stat.st_mtime_ns}
+
+
+def _encode_labels(labels):
+    """DictColumn 的标签转换为可以写入 JSON 的形式：日期保存为 ISO 文本。"""
+    if labels and all(isinstance(label, date) for label in labels):
+        return "date", [label.isoformat() for label in labels]
+    return None, labels
+
+
+def _decode_labels(label_type, labels):
+    return [date.fromisoformat(label) for label in labels] if label_type == "date" else labels
+
+
+def save_snapshot(table, snapshot_path, source_path=None, schema=None):
+    """
+    把 Table 保存为二进制列式快照。
+
+    参数:
+        table (Table): 数据表。
+        snapshot_path (str): 快照文件的路径。
+        source_path (str): 数据来源的 CSV 文件；给出时记录它的大小和修改时间。
+        schema (dict): 加载时显式指定的列类型；一并记录，类型定义改变后快照失效。
+    """
+    blobs = []
+    specs = []
+    offset = 0
+
+    def add_blob(column):
+        nonlocal offset
+        blob = memoryview(column)
+        blobs.append(blob)
+        start = offset
+        offset += blob.nbytes + (-blob.nbytes) % 8
+        return start
+
+    for name in table.columns:
+        column = table.column(name)
+        if isinstance(column, DictColumn):
+            label_type, labels = _encode_labels(column.labels)
+            specs.append({"name": name, "type": "dict", "offset": add_blob(column.codes), "labels": labels,
+                          "label_type": label_type})
+        else:
+            specs.append({"name": name, "type": _typecode(column), "offset": add_blob(column)})
+    # 数值维度列（如 Age）已缓存的字典编码也一并保存
+    encodings = [{"name": name, "offset": add_blob(codes), "labels": labels}
+                 for name, (codes, labels) in table._encodings.items()]
+
+    header = json.dumps({
+        "rows": len(table),
+        "byteorder": sys.byteorder,
+        "source": _source_stat(source_path) if source_path else None,
+        "schema": dict(schema or {}),
+        "columns": specs,
+        "encodings": encodings,
+    }).encode("utf-8")
+    start = len(SNAPSHOT_MAGIC) + 8 + len(header)
+    padding = (-start) % 8
+
+    # 先写临时文件再替换，打开着的旧快照不会读到写了一半的数据
+    temp_path = snapshot_path + ".tmp"
+    with open(temp_path, "wb") as file:
+        file.write(SNAPSHOT_MAGIC)
+        file.write((len(header) + padding).to_bytes(8, "little"))
+        file.write(header + b" " * padding)
+        for blob in blobs:
+            file.write(blob)
+            file.write(bytes((-blob.nbytes) % 8))
+    os.replace(temp_path, snapshot_path)
+
+
+def open_snapshot(snapshot_path, source_path=None, schema=None):
+    """
+    用 mmap 打开二进制快照，返回 Table。数值列和编码列是只读的 memoryview，
+    第一次修改表时才复制为 array（见 Table._detach）。
+
+    参数:
+        snapshot_path (str): 快照文件的路径。
+        source_path (str): 数据来源的 CSV 文件；给出时检查快照是否过期。
+        schema (dict): 期望的显式列类型；与保存快照时的不同时视为过期（只在给出 source_path 时检查）。
+
+    返回:
+        table (Table): 数据表；快照不存在、已过期或由不同字节序的机器生成时返回 None。
+
+    异常:
+        ValueError: 文件不是快照，或快照被截断、已损坏（文件头无法解析、数据不完整）。
+    """
+    try:
+        file = open(snapshot_path, "rb")
+    except FileNotFoundError:
+        return None
+    stage = _active_stats and _active_stats.begin("open_snapshot")
+    with file:
+        if file.read(len(SNAPSHOT_MAGIC)) != SNAPSHOT_MAGIC:
+            raise ValueError(f"不是快照文件: {snapshot_path}")
+        header_size = int.from_bytes(file.read(8), "little")
+        header = json.loads(file.read(header_size))
+        if header["byteorder"] != sys.byteorder:
+            return None
+        if source_path is not None and (header["source"] != _source_stat(source_path)
+                                        or header.get("schema", {}) != dict(schema or {})):
+            return None
+        # 映射在文件关闭后仍然有效；memoryview 引用着映射，不再使用时自动释放
+        mapped = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ)
+
+    base = len(SNAPSHOT_MAGIC) + 8 + header_size
+    n_rows = header["rows"]
+    view = memoryview(mapped)
+
+    def blob(offset, typecode):
+        start = base + offset
+        end = start + n_rows * array(typecode).itemsize
+        if end > len(view):
+            raise ValueError(f"快照文件不完整: {snapshot_path}")
+        return view[start:end].cast(typecode)
+
+    data = {}
+    for spec in header["columns"]:
+        if spec["type"] == "dict":
+            column = DictColumn()
+            column.codes = blob(spec["offset"], "i")
+            column.labels = _decode_labels(spec.get("label_type"), spec["labels"])
+            column._index = {label: code for code, label in enumerate(column.labels)}
+        else:
+            column = blob(spec["offset"], spec["type"])
+        data[spec["name"]] = column
+
+    table = Table([spec["name"] for spec in header["columns"]], data)
+    table.schema = dict(header.get("schema", {}))
+    table._encodings = {spec["name"]: (blob(spec["offset"], "i"), spec["labels"]) for spec in header["encodings"]}
+    if stage:
+        # 列数据通过映射按需读入，这里只计入实际读取的文件头
+        stage.finish(rows=n_rows, bytes_read=base)
+    return table
+
+
+def load_table_snapshot(file_path, snapshot_path=None, batch_size=DEFAULT_BATCH_SIZE, dimensions=(), schema=None):
+    """
+    加载 CSV 文件：有未过期的快照时直接打开快照，否则解析 CSV 并写入新的快照。
+
+    参数:
+        file_path (str): CSV 文件的路径。
+        snapshot_path (str): 快照文件的路径；默认是 file_path + SNAPSHOT_SUFFIX。
+        batch_size (int): 解析 CSV 时每批读取的行数。
+        dimensions (iterable of str): 需要预先编码的数值维度列（见 load_table）。
+        schema (dict): 显式指定的列类型（见 load_table）。
+
+    返回:
+        table (Table): 加载好的数据表。
+    """
+    if snapshot_path is None:
+        snapshot_path = file_path + SNAPSHOT_SUFFIX
+    try:
+        table = open_snapshot(snapshot_path, file_path, schema)
+    except (ValueError, KeyError, TypeError):
+        # 截断或损坏的快照（如写入时进程被杀死）：从 CSV 重建，新快照会覆盖它。
+        # 开头不是快照魔数的文件不是我们写的，不覆盖
+        with open(snapshot_path, "rb") as file:
+            if not SNAPSHOT_MAGIC.startswith(file.read(len(SNAPSHOT_MAGIC))):
+                raise
+        table = None
+    if table is not None:
+        return table
+    table = load_table(file_path, batch_size, dimensions, schema=schema)
+    try:
+        save_snapshot(table, snapshot_path, file_path, schema)
+    except OSError:
+        pass  # 目录不可写时只是不生成快照
+    return table
+
+
+#%%
+# 定义测试数据
+primary_data = [
+    {"S/N": 1, "Name": "Albert", "Gender": "Male", "Age": 21, "Employment": "Employee", "Salary": 4800},
+    {"S/N": 2, "Name": "Bob", "Gender": "Male", "Age": 21, "Employment": "Employee", "Salary": 5000},
+    {"S/N": 3, "Name": "Charles", "Gender": "Male", "Age": 22, "Employment": "Employee", "Salary": 6000},
+    {"S/N": 4, "Name": "Derrick", "Gender": "Male", "Age": 23, "Employment": "Self-Employed", "Salary": 10000},
+    {"S/N": 5, "Name": "Fred", "Gender": "Male", "Age": 23, "Employment": "Unemployed", "Salary": 1200},
+    {"S/N": 6, "Name": "George", "Gender": "Male", "Age": 25, "Employment": "Self-Employed", "Salary": 12000},
+    {"S/N": 7, "Name": "Hubert", "Gender": "Male", "Age": 26, "Employment": "Unemployed", "Salary": 1000},
+    {"S/N": 8, "Name": "Issac", "Gender": "Male", "Age": 28, "Employment": "Employee", "Salary": 3000},
+    {"S/N": 9, "Name": "John", "Gender": "Male", "Age": 30, "Employment": "Employee", "Salary": 2500},
+    {"S/N": 10, "Name": "Kerry", "Gender": "Male", "Age": 30, "Employment": "Self-Employed", "Salary": 8500},
+    {"S/N": 11, "Name": "Linda", "Gender": "Female", "Age": 21, "Employment": "Self-Employed", "Salary": 9000},
+    {"S/N": 12, "Name": "Mindy", "Gender": "Female", "Age": 21, "Employment": "Self-Employed", "Salary": 8500},
+    {"S/N": 13, "Name": "Nicole", "Gender": "Female", "Age": 22, "Employment": "Unemployed", "Salary": 2000},
+    {"S/N": 14, "Name": "Oprah", "Gender": "Female", "Age": 22, "Employment": "Employee", "Salary": 6500},
+    {"S/N": 15, "Name": "Penny", "Gender": "Female", "Age": 23, "Employment": "Employee", "Salary": 7500},
+    {"S/N": 16, "Name": "Queenie", "Gender": "Female", "Age": 25, "Employment": "Employee", "Salary": 7000},
+    {"S/N": 17, "Name": "Ruby", "Gender": "Female", "Age": 25, "Employment": "Employee", "Salary": 4000},
+    {"S/N": 18, "Name": "Stacy", "Gender": "Female", "Age": 27, "Employment": "Employee", "Salary": 3500},
+    {"S/N": 19, "Name": "Tiffany", "Gender": "Female", "Age": 27, "Employment": "Self-Employed", "Salary": 5000},
+    {"S/N": 20, "Name": "Ursula", "Gender": "Female", "Age": 27, "Employment": "Unemployed", "Salary": 1500},
+]
+
+test_csv = 'Data/test_data_1.csv'  # 你可以指定你想要的文件名
+
+
+def write_test_data(file_path=test_csv):
+    """
+    把测试数据写入 CSV 文件。只在交互菜单中调用，导入模块时不会写任何文件。
+
+    参数:
+        file_path (str): 文件的路径。
+    """
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    # 打开文件以写入数据
+    with open(file_path, "w") as file:
+        # 写入头部信息
+        file.write("S/N,Name,Gender,Age,Employment,Salary\n")
+
+        # 遍历 primary_data 并将每一行数据写入文件
+        for data in primary_data:
+            file.write(f"{data['S/N']},{data['Name']},{data['Gender']},{data['Age']},{data['Employment']},{data['Salary']}\n")
+
+
+#%%
+#Step 16:非交互的批处理入口
+# run_pivot 按一个透视规格完成 加载 → 透视 → 输出，不需要任何输入提示，可以从其它程序导入调用；
+# 命令行入口 main(argv) 接受同样的参数，或一个包含多个规格的 JSON 文件（在同一个进程中依次运行）。
+
+# 透视规格中与行排序有关的字段（见 order_by_spec）
+ORDER_KEYS = ("sort_by", "sort_column", "descending", "top", "bottom")
+
+
+def order_by_spec(result, spec):
+    """
+    按透视规格中的排序字段（见 run_pivot）对聚合结果的行排序或取前/后 N 行；没有排序字段时原样返回。
+
+    参数:
+        result (PivotResult): 聚合结果。
+        spec (dict): 透视规格。
+
+    返回:
+        result (PivotResult): 排序后的结果。
+    """
+    if spec.get("top") and spec.get("bottom"):
+        raise ValueError("top 和 bottom 只能指定一个")
+    if not any(spec.get(key) for key in ORDER_KEYS):
+        return result
+    limit = spec.get("top") or spec.get("bottom")
+    by = spec.get("sort_by") or ("label" if limit is None else result.value_columns[0][2])
+    descending = bool(spec.get("top")) if limit else spec.get("descending", False)
+    return sort_rows(result, by, spec.get("sort_column"), descending, limit)
+
+
+def run_pivot(spec):
+    """
+    按透视规格运行一次透视。
+
+    参数:
+        spec (dict): 透视规格，包含以下键：
+            input (str 或 list of str): CSV 文件的路径（必需）；也可以是 glob 模式或文件列表，
+                有多个文件时并行加载（见 parallel_build_pivot）。压缩文件（.gz/.bz2/.xz）按扩展名识别。
+            rows (list of str): 行分组列，默认为空。
+            columns (list of str): 列分组列，默认为空。
+            values (str 或 list of str): 值字段（必需）。
+            funcs (list): 聚合函数（必需，格式见 build_pivot）。
+            output (str): 输出文件的路径；为空时打印到控制台。以 .gz 结尾时压缩。
+            format (str): 输出格式 "csv"、"tsv" 或 "jsonl"（见 OUTPUT_FORMATS）；默认按 output 的扩展名推断。
+            pager (bool): 打印到控制台时是否分页显示（见 render_pivot_console）；默认在交互终端中分页。
+            subtotals (bool): 是否输出小计行，默认为 False。
+            backend (str): 聚合后端（见 build_pivot），默认为 "auto"。
+            snapshot (bool): 是否使用二进制快照加速加载（见 load_table_snapshot），默认为 True。
+            filters (list): 行过滤条件（见 parse_filter）。有过滤条件或不使用快照时，
+                只加载透视用到的列和满足条件的行。
+            schema (dict): 显式指定的列类型，如 {"Age": "int"}（见 COLUMN_TYPES）。
+            memory_budget (int): 分组状态的内存预算（字节）。指定时使用外部聚合（见 external_pivot_csv），
+                分组数超出预算的部分溢出到临时文件；需要 output，不支持 subtotals 和排序。
+            sort_by (str): 行的排序依据（见 sort_rows）："label"，或值列的表头文本/聚合函数名。
+            sort_column: 按某个列键下的值（而不是行总计）排序。
+            descending (bool): 是否降序，默认为 False。
+            top (int): 只输出按 sort_by（默认为第一个值列）的行总计最大的 N 行。
+            bottom (int): 只输出行总计最小的 N 行。
+
+    返回:
+        result (PivotResult): 聚合结果；使用外部聚合时为 None。
+    """
+    missing = [key for key in ("input", "values", "funcs") if not spec.get(key)]
+    if missing:
+        raise ValueError(f"透视规格缺少字段: {', '.join(missing)}")
+    unknown = set(spec) - {"input", "rows", "columns", "values", "funcs", "output", "format", "pager", "subtotals",
+                           "backend", "snapshot", "filters", "schema", "memory_budget", *ORDER_KEYS}
+    if unknown:
+        raise ValueError(f"未知的透视规格字段: {', '.join(sorted(unknown))}")
+
+    if spec.get("memory_budget"):
+        if not spec.get("output") or spec.get("subtotals") or any(spec.get(key) for key in ORDER_KEYS):
+            raise ValueError("外部聚合（memory_budget）需要 output，且不支持 subtotals 和排序")
+        external_pivot_csv(spec["input"], spec.get("rows", []), spec.get("columns", []), spec["values"], spec["funcs"],
+                           spec["output"], memory_budget=spec["memory_budget"], filters=spec.get("filters", ()),
+                           schema=spec.get("schema"), fmt=spec.get("format"))
+        return None
+
+    values = [spec["values"]] if isinstance(spec["values"], str) else list(spec["values"])
+    needed = list(dict.fromkeys(spec.get("rows", []) + spec.get("columns", []) + values))
+    schema = {col: kind for col, kind in (spec.get("schema") or {}).items() if col in needed}
+    paths = expand_paths(spec["input"])
+    if len(paths) > 1:
+        # 多个文件（如按天分区）在多个进程中并行解压、解析和聚合，再合并部分状态
+        result = parallel_build_pivot(spec["input"], spec.get("rows", []), spec.get("columns", []), spec["values"],
+                                      spec["funcs"], filters=spec.get("filters", ()), schema=schema)
+    else:
+        if spec.get("snapshot", True) and not spec.get("filters"):
+            # 快照保存完整的表，之后的任何透视都可以复用
+            table = load_table_snapshot(paths[0], schema=spec.get("schema"))
+        else:
+            table = load_table(paths[0], columns=needed, filters=spec.get("filters", ()), schema=schema)
+        result = build_pivot(table, spec.get("rows", []), spec.get("columns", []), spec["values"], spec["funcs"],
+                             backend=spec.get("backend", "auto"))
+    result = order_by_spec(result, spec)
+    if spec.get("output"):
+        render_pivot_file(result, spec["output"], spec.get("format"), subtotals=spec.get("subtotals", False))
+    else:
+        render_pivot_console(result, subtotals=spec.get("subtotals", False), pager=spec.get("pager"))
+    return result
+
+
+def _parse_args(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(
+        description="不经过交互菜单，直接按参数生成透视表。不带任何参数运行时进入交互菜单。")
+    parser.add_argument("input", nargs="?",
+                        help="CSV 文件的路径，或 glob 模式（如 \"Data/day-*.csv.gz\"，多个文件并行加载）")
+    parser.add_argument("--rows", nargs="*", default=[], help="行分组列")
+    parser.add_argument("--columns", nargs="*", default=[], help="列分组列")
+    parser.add_argument("--values", nargs="+", help="值字段；多个值字段时与 --funcs 一一对应")
+    parser.add_argument("--funcs", nargs="+",
+                        help="聚合函数；多个值字段时每项是逗号分隔的函数列表，如 sum,average count")
+    parser.add_argument("--where", action="append", default=[], help="行过滤条件，如 \"Age >= 25\"，可重复使用")
+    parser.add_argument("--schema", nargs="+", default=[], metavar="COLUMN=TYPE",
+                        help="显式指定列类型，如 Age=int Date=date（类型: int/float/date/str）")
+    parser.add_argument("--output", help="输出文件的路径（.csv/.tsv/.jsonl，可再加 .gz 压缩）；省略时打印到控制台")
+    parser.add_argument("--format", choices=("csv", "tsv", "jsonl"), help="输出格式；默认按 --output 的扩展名推断")
+    parser.add_argument("--no-pager", action="store_true", help="打印到控制台时不分页，直接输出全部行")
+    parser.add_argument("--subtotals", action="store_true", help="输出各层行分组的小计行")
+    parser.add_argument("--backend", choices=("auto", "python", "numpy"), default="auto", help="聚合后端")
+    parser.add_argument("--no-snapshot", action="store_true", help="不读写二进制快照")
+    parser.add_argument("--sort-by", help="行的排序依据：label，或值列的表头/聚合函数名（如 sum）")
+    parser.add_argument("--sort-column", nargs="+", help="按这个列键下的值排序，而不是按行总计")
+    parser.add_argument("--descending", action="store_true", help="降序排列")
+    group = parser.add_mutually_exclusive_group()
+    group.add_argument("--top", type=int, metavar="N", help="只输出行总计最大的 N 行")
+    group.add_argument("--bottom", type=int, metavar="N", help="只输出行总计最小的 N 行")
+    parser.add_argument("--memory-budget", type=float, metavar="MB",
+                        help="分组状态的内存预算（MB）；超出时溢出到临时文件（外部聚合），需要 --output")
+    parser.add_argument("--spec", help="JSON 文件：一个透视规格或规格列表（键同 run_pivot）")
+    parser.add_argument("--stats", action="store_true", help="在标准错误输出上打印各阶段的性能统计")
+    args = parser.parse_args(argv)
+    if args.spec is None and (args.input is None or not args.values or not args.funcs):
+        parser.error("需要 input、--values 和 --funcs，或使用 --spec")
+    if any("=" not in item for item in args.schema):
+        parser.error("--schema 的格式是 列名=类型")
+    return args
+
+
+def main(argv=None):
+    """
+    命令行入口。
+
+    参数:
+        argv (list of str): 命令行参数，默认为 sys.argv[1:]。
+
+    返回:
+        status (int): 退出码，0 表示全部成功。
+    """
+    args = _parse_args(argv)
+    if args.spec:
+        with open(args.spec, encoding="utf-8") as file:
+            specs = json.load(file)
+        if isinstance(specs, dict):
+            specs = [specs]
+    else:
+        values, funcs = args.values, args.funcs
+        if len(values) == 1:
+            values, funcs = values[0], [func for item in funcs for func in item.split(",")]
+        else:
+            funcs = [item.split(",") for item in funcs]
+        specs = [{"input": args.input, "rows": args.rows, "columns": args.columns, "values": values,
+                  "funcs": funcs, "output": args.output, "format": args.format, "subtotals": args.subtotals,
+                  "backend": args.backend, "snapshot": not args.no_snapshot, "filters": args.where,
+                  "schema": dict(item.split("=", 1) for item in args.schema)}]
+        for key in ORDER_KEYS:
+            if getattr(args, key):
+                specs[0][key] = getattr(args, key)
+        if args.no_pager:
+            specs[0]["pager"] = False
+        if args.memory_budget:
+            specs[0]["memory_budget"] = int(args.memory_budget * (1 << 20))
+
+    status = 0
+    for spec in specs:
+        try:
+            if args.stats:
+                with collect_stats() as stats:
+                    run_pivot(spec)
+                stats.report(sys.stderr)
+            else:
+                run_pivot(spec)
+        except (OSError, ValueError, KeyError, ImportError) as e:
+            print(f"透视失败 ({spec.get('input')}): {e}", file=sys.stderr)
+            status = 1
+    return status
+
+#%%
+#Step 17:分阶段的性能统计
+# 默认关闭。在 collect_stats() 的 with 块中运行时，各阶段（加载、透视、写出）结束后记录
+# 耗时、处理的行数、生成的单元格数、读写的字节数和内存，并通知注册的回调。
+# 关闭时每个阶段只多一次全局变量的判断，不在逐行的循环里做任何事情。
+
+# 当前启用的 PivotStats；为 None 时统计关闭
+_active_stats = None
+
+
+def _peak_rss():
+    """
+    返回进程启动以来的峰值常驻内存（字节）；平台不支持时返回 None。
+
+    这是整个进程的历史最大值，不能归到某一个阶段：内存占用最大的阶段之后的各阶段都得到同一个数。
+    """
+    try:
+        import resource
+    except ImportError:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位是 KB，macOS 上是字节
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+class StageStats:
+    """
+    一个阶段的统计。
+
+    属性:
+        name (str): 阶段名，如 "load_table"、"pivot"、"write_csv"。
+        seconds (float): 耗时；阶段因异常中断时为 None。
+        rows (int): 处理的行数。
+        cells (int): 生成的非空单元格数。
+        bytes_read, bytes_written (int): 读取/写入的字节数。
+        peak_rss (int): 到阶段结束时为止进程的峰值常驻内存（字节），是进程级的累计最大值（见 _peak_rss）。
+        peak_python (int): 阶段内 Python 对象的峰值内存（字节），包括嵌套在其中的阶段；
+            只在 trace_memory=True 时记录。
+    """
+
+    __slots__ = ("name", "seconds", "rows", "cells", "bytes_read", "bytes_written", "peak_rss", "peak_python",
+                 "_owner", "_start", "_inner_peak")
+
+    def __init__(self, owner, name):
+        self.name = name
+        self.seconds = self.rows = self.cells = self.bytes_read = self.bytes_written = None
+        self.peak_rss = self.peak_python = None
+        self._owner = owner
+        # 嵌套阶段开始前、以及已结束的嵌套阶段中达到的峰值：reset_peak 会清掉这些，需要自己记住
+        self._inner_peak = 0
+        if owner.trace_memory:
+            if owner._open:
+                outer = owner._open[-1]
+                outer._inner_peak = max(outer._inner_peak, tracemalloc.get_traced_memory()[1])
+            tracemalloc.reset_peak()
+        owner._open.append(self)
+        self._start = time.perf_counter()
+
+    def finish(self, **counts):
+        """结束阶段并记录计数（rows、cells、bytes_read、bytes_written）。"""
+        self.seconds = time.perf_counter() - self._start
+        for key, value in counts.items():
+            setattr(self, key, value)
+        self.peak_rss = _peak_rss()
+        owner = self._owner
+        if self in owner._open:
+            # 中断后未结束的嵌套阶段也一并出栈
+            del owner._open[owner._open.index(self):]
+        if owner.trace_memory:
+            self.peak_python = max(tracemalloc.get_traced_memory()[1], self._inner_peak)
+            if owner._open:
+                outer = owner._open[-1]
+                outer._inner_peak = max(outer._inner_peak, self.peak_python)
+        for callback in self._owner.callbacks:
+            callback(self)
+
+    def as_dict(self):
+        return {key: getattr(self, key) for key in self.__slots__ if not key.startswith("_")}
+
+
+class PivotStats:
+    """
+    一次运行中所有阶段的统计，按阶段开始的顺序排列。
+
+    参数:
+        trace_memory (bool): 是否用 tracemalloc 记录每个阶段 Python 对象的峰值内存（开销较大）。
+
+    属性:
+        stages (list of StageStats): 各阶段的统计。
+        callbacks (list): 每个阶段结束后调用的 callback(stage)。
+    """
+
+    def __init__(self, trace_memory=False):
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.callbacks = []
+        # 已开始、尚未结束的阶段（嵌套时外层在前）
+        self._open = []
+
+    def add_callback(self, callback):
+        """注册一个在每个阶段结束后调用的回调 callback(stage)。"""
+        self.callbacks.append(callback)
+
+    def begin(self, name):
+        stage = StageStats(self, name)
+        self.stages.append(stage)
+        return stage
+
+    def as_dicts(self):
+        """以字典列表的形式返回所有阶段的统计，便于序列化为 JSON。"""
+        return [stage.as_dict() for stage in self.stages]
+
+    def report(self, file=None):
+        """打印各阶段的统计表。"""
+        file = file or sys.stdout
+        names = ["rows", "cells", "bytes_read", "bytes_written"] + ["peak_python"] * self.trace_memory
+        widths = (12, 10, 12, 12, 14)
+        titles = ("rows", "cells", "read", "written", "peak_python")
+        print(f"{'stage':<24}{'seconds':>10}" + "".join(f"{title:>{w}}" for title, w in zip(titles, widths[:len(names)]))
+              + f"{'rss_so_far':>14}", file=file)
+        for stage in self.stages:
+            cols = [getattr(stage, name) for name in names] + [stage.peak_rss]
+            seconds = "-" if stage.seconds is None else f"{stage.seconds:.4f}"
+            print(f"{stage.name:<24}{seconds:>10}" + "".join(f"{'-' if v is None else v:>{w}}"
+                                                              for v, w in zip(cols, widths[:len(names)] + (14,))),
+                  file=file)
+        # 进程的峰值常驻内存只增不减，不是各阶段自己的用量
+        print("rss_so_far: 到该阶段结束时为止整个进程的峰值常驻内存", file=file)
+
+
+@contextmanager
+def collect_stats(callback=None, trace_memory=False):
+    """
+    在 with 块中启用分阶段的性能统计。
+
+    参数:
+        callback (callable): 每个阶段结束后调用的 callback(stage)，可选。
+        trace_memory (bool): 是否记录每个阶段 Python 对象的峰值内存（见 PivotStats）。
+
+    产出:
+        stats (PivotStats): 统计结果，with 块结束后仍可读取。
+    """
+    global _active_stats
+    stats = PivotStats(trace_memory)
+    if callback is not None:
+        stats.add_callback(callback)
+    previous = _active_stats
+    started = trace_memory and not tracemalloc.is_tracing()
+    if started:
+        tracemalloc.start()
+    _active_stats = stats
+    try:
+        yield stats
+    finally:
+        _active_stats = previous
+        if started:
+            tracemalloc.stop()
+
+
+def _count_cells(result):
+    """非空单元格数（只在统计开启时计算）。"""
+    return sum(1 for count in result.measures[0].counts if count) if result.measures else 0
+
+
+#%%
+#Step 18:超出内存的外部聚合
+# 分组数超过内存预算时，把内存中的部分聚合状态按行键的哈希值分区写入临时文件（溢出），然后清空内存继续扫描。
+# 扫描结束后逐个分区合并（分区仍然放不下时用新的哈希再分区），每个分区按行键首次出现的序号排序，
+# 写成一个有序的归并段；最后用 heapq.merge 按首次出现的顺序归并所有段，分块渲染写出。
+# 段数超过 _MERGE_FAN_IN 时先分多遍归并成较少的段，同时打开的文件数始终有上限。
+# 列键（基数通常很小）、列总计和全部总计始终保留在内存中。
+
+# 外部聚合的默认内存预算（字节）
+EXTERNAL_MEMORY_BUDGET = 256 << 20
+# 每次溢出时的分区数
+EXTERNAL_PARTITIONS = 16
+# 估计的每个单元格的内存占用（字节）：字典项和状态列表；每个草图另计
+_CELL_BYTES = 240
+_SKETCH_BYTES = 2048
+# 分区合并后仍超出预算时，最多再分区的层数
+_MAX_SPILL_DEPTH = 4
+# 写临时文件和输出时每块的记录/行数
+_SPILL_CHUNK = 1000
+EXTERNAL_RENDER_ROWS = 10000
+# 一次归并最多同时打开的段文件数
+_MERGE_FAN_IN = 64
+
+
+def _cell_bytes(plans):
+    """估计一个单元格（所有值字段的状态）占用的内存。"""
+    return _CELL_BYTES + sum(_CELL_BYTES // 2 + _SKETCH_BYTES * len(plan.sketches) for plan in plans)
+
+
+def _write_partitions(records, paths, depth):
+    """
+    把 (序号, 行键, 行状态) 记录按行键的哈希值追加写入各分区文件。
+
+    depth 参与哈希，再分区时同一个分区的行键会被打散到不同的子分区。
+    """
+    files = [open(path, "ab") for path in paths]
+    buckets = [[] for _ in paths]
+    try:
+        for record in records:
+            index = hash((depth, record[1])) % len(paths)
+            bucket = buckets[index]
+            bucket.append(record)
+            if len(bucket) >= _SPILL_CHUNK:
+                pickle.dump(bucket, files[index], pickle.HIGHEST_PROTOCOL)
+                bucket.clear()
+        for file, bucket in zip(files, buckets):
+            if bucket:
+                pickle.dump(bucket, file, pickle.HIGHEST_PROTOCOL)
+    finally:
+        for file in files:
+            file.close()
+
+
+def _read_records(path):
+    """按写入顺序读回一个临时文件中的全部记录。"""
+    with open(path, "rb") as file:
+        while True:
+            try:
+                chunk = pickle.load(file)
+            except EOFError:
+                return
+            yield from chunk
+
+
+def _write_run(path, records):
+    """把按序号排好序的记录分块写成一个段文件。"""
+    records = iter(records)
+    with open(path, "wb") as file:
+        while True:
+            chunk = list(islice(records, _SPILL_CHUNK))
+            if not chunk:
+                return
+            pickle.dump(chunk, file, pickle.HIGHEST_PROTOCOL)
+
+
+def _merge_runs(runs):
+    """
+    按序号归并所有段，返回有序的记录迭代器。
+
+    段数超过 _MERGE_FAN_IN 时，每遍把每 _MERGE_FAN_IN 个段归并成一个新段（并删除旧段），
+    直到剩下的段可以一次归并完；同时打开的段文件不超过 _MERGE_FAN_IN 个。
+    """
+    passes = 0
+    while len(runs) > _MERGE_FAN_IN:
+        passes += 1
+        merged = []
+        for start in range(0, len(runs), _MERGE_FAN_IN):
+            group = runs[start:start + _MERGE_FAN_IN]
+            if len(group) == 1:
+                merged.append(group[0])
+                continue
+            merged_path = f"{group[0]}.m{passes}"
+            _write_run(merged_path, heapq.merge(*(_read_records(run) for run in group), key=operator.itemgetter(0)))
+            for run in group:
+                os.remove(run)
+            merged.append(merged_path)
+        runs = merged
+    return heapq.merge(*(_read_records(run) for run in runs), key=operator.itemgetter(0))
+
+
+def _merge_partition(path, plans, max_cells, depth, runs):
+    """
+    合并一个分区中同一行键的部分状态（序号取最小，即首次出现），按序号排序后写成有序段，
+    段文件的路径追加到 runs。合并中超出预算时把这个分区再分区，递归处理。
+    """
+    merged = {}
+    cells = 0
+    records = _read_records(path)
+    for seq, row_key, row_data in records:
+        entry = merged.get(row_key)
+        if entry is None:
+            merged[row_key] = [seq, row_data]
+            cells += len(row_data)
+        else:
+            if seq < entry[0]:
+                entry[0] = seq
+            target = entry[1]
+            for col_key, cell in row_data.items():
+                existing = target.get(col_key)
+                if existing is None:
+                    target[col_key] = cell
+                    cells += 1
+                else:
+                    for plan, state, other in zip(plans, existing, cell):
+                        plan.merge_cell(state, other)
+
+        if cells > max_cells and depth < _MAX_SPILL_DEPTH:
+            sub_paths = [f"{path}.{i}" for i in range(EXTERNAL_PARTITIONS)]
+            pending = ((entry[0], key, entry[1]) for key, entry in merged.items())
+            _write_partitions(chain(pending, records), sub_paths, depth + 1)
+            merged = None
+            os.remove(path)
+            for sub_path in sub_paths:
+                _merge_partition(sub_path, plans, max_cells, depth + 1, runs)
+            return
 
-def load_data(file_path):
+    run_path = path + ".run"
+    ordered = sorted(((entry[0], key, entry[1]) for key, entry in merged.items()), key=operator.itemgetter(0))
+    merged = None
+    _write_run(run_path, ordered)
+    os.remove(path)
+    runs.append(run_path)
+
+
+def _iter_typed_rows(file_path, columns, filters=(), schema=None):
     """
-    从 CSV 文件中加载数据。
+    流式读取 CSV，按样本推断（或显式指定）的类型逐批解析各列，逐行产出字典。
 
-    参数:
-        file_path (str): 文件的路径。
+    与 load_data 不同，列类型在读取前就确定了：之后的值不符合该类型时报错，而不是放宽整列的类型。
+    """
+    schema = dict(infer_schema(file_path, columns=columns), **_check_schema(schema))
+    kinds = [schema[column] for column in columns]
+    for batch in iter_csv_batches(file_path, columns=columns, filters=filters, as_dict=False):
+        parsed = []
+        for i, (column, kind) in enumerate(zip(columns, kinds)):
+            try:
+                parsed.append(_parse_column([row[i] if i < len(row) else "" for row in batch], kind, strict=True)[1])
+            except ValueError as e:
+                raise ValueError(f"列 '{column}': {e}（可以用 schema 指定更宽的类型）") from None
+        for values in zip(*parsed):
+            yield dict(zip(columns, values))
 
-    返回:
-        data (list of dict): 数据列表，其中每个条目是一个包含列名和值的字典。
-        columns (list of str): 列名列表。
+
+def external_pivot_csv(data, row_keys, col_keys, value_key, aggregation_funcs, output_file,
+                       memory_budget=EXTERNAL_MEMORY_BUDGET, temp_dir=None, filters=(), schema=None, fmt=None):
     """
-    data = []
-    columns = []
+    在有限内存中生成透视表并写入 CSV 文件，适用于行键基数（如 Name）超出内存的数据。
 
-    with open(file_path, "r") as file:
-        lines = file.readlines()
-        columns = lines[0].strip().split(",")  # Assuming the first row contains column names
-        for line in lines[1:]:  # Skipping the first row
-            values = line.strip().split(",")
-            row = {col: val for col, val in zip(columns, values)}
-            data.append(row)
+    内存中的分组状态超过预算时溢出到临时文件（见本节说明），峰值内存由 memory_budget 限制。
+    没有发生溢出时与 build_pivot + render_pivot_csv 完全相同；发生溢出时行的顺序、列和总计
+    与内存路径一致（sum 精确合并，浮点和也完全相同），只有中位数等草图在其误差范围内可能不同。
 
-    return data, columns
+    参数：
+        data (str、Table 或 iterable of dict): CSV 文件路径，或逐行的数据。
+        row_keys, col_keys, value_key, aggregation_funcs: 同 build_pivot。
+        output_file (str): 输出文件的路径。
+        memory_budget (int): 分组状态的内存预算（字节）。
+        temp_dir (str): 临时文件的目录，默认为系统临时目录。
+        filters (iterable): data 是文件路径时的行过滤条件（见 parse_filter）。
+        schema (dict): data 是文件路径时显式指定的列类型；其余列按文件开头的样本推断。
+        fmt (str): 输出格式（见 OUTPUT_FORMATS）；为 None 时按 output_file 的扩展名推断。
 
-# For testing purposes, let's manually create a small CSV file and load data from it.
-# 为了测试数据，先生成一个小的数据集
+    返回：
+        spills (int): 溢出到磁盘的次数；0 表示全部在内存中完成。
+    """
+    stage = _active_stats and _active_stats.begin("external_pivot")
+    measures = normalize_measures(value_key, aggregation_funcs)
+    plans = [_AggregationPlan(funcs) for _, funcs in measures]
+    value_keys = [key for key, _ in measures]
+    if isinstance(data, str):
+        needed = list(dict.fromkeys(list(row_keys) + list(col_keys) + value_keys))
+        data = _iter_typed_rows(data, needed, filters, schema)
+    inputs = _iter_pivot_inputs(data, row_keys, col_keys, value_keys)
+
+    max_cells = max(1, memory_budget // _cell_bytes(plans))
+    # 每批之后统计一次单元格数，代价与内存中的分组数成正比
+    batch_size = max(1000, min(DEFAULT_BATCH_SIZE * 10, max_cells // 8))
+    col_set = set()
+    seqs = {}
+    next_seq = 0
+    pivot_data = {}
+    spills = 0
+
+    with tempfile.TemporaryDirectory(prefix="pypivot_", dir=temp_dir) as work_dir:
+        paths = [os.path.join(work_dir, f"part{i}") for i in range(EXTERNAL_PARTITIONS)]
+        while True:
+            batch = list(islice(inputs, batch_size))
+            if batch:
+                _aggregate_inputs(batch, plans, pivot_data)
+                # 新出现的行键在字典末尾，按出现顺序编号
+                for row_key in islice(pivot_data, len(seqs), None):
+                    seqs[row_key] = next_seq
+                    next_seq += 1
+            cells = sum(len(row_data) for row_data in pivot_data.values())
+            if pivot_data and (cells > max_cells or (not batch and spills)):
+                for row_data in pivot_data.values():
+                    col_set.update(row_data)
+                _write_partitions(((seqs[key], key, row_data) for key, row_data in pivot_data.items()), paths, 0)
+                pivot_data, seqs = {}, {}
+                spills += 1
+            if not batch:
+                break
+
+        if not spills:
+            result = PivotResult.from_partials(row_keys, col_keys, measures, pivot_data)
+            render_pivot_file(result, output_file, fmt)
+            if stage:
+                stage.finish(cells=_count_cells(result))
+            return 0
+
+        runs = []
+        for path in paths:
+            if os.path.exists(path):
+                _merge_partition(path, plans, max_cells, 1, runs)
+        ordered = _merge_runs(runs)
+
+        col_labels = sorted(col_set)
+        header = PivotResult(row_keys, col_keys, [_Measure(key, funcs, 0) for key, funcs in measures], [],
+                             col_labels)
+        col_totals = {((), col): [plan.new_cell() for plan in plans] for col in col_labels}
+        grand_total = [plan.new_cell() for plan in plans]
+        rows = 0
+        with PivotWriter(output_file, fmt) as writer:
+            writer.write_lines(_header_lines(header, True))
+            while True:
+                chunk = {row_key: row_data for _, row_key, row_data in islice(ordered, EXTERNAL_RENDER_ROWS)}
+                if not chunk:
+                    break
+                rows += len(chunk)
+                result = PivotResult.from_partials(row_keys, col_keys, measures, chunk, col_labels)
+                writer.write_batches(_body_batches(result, True, " "))
+                # 与内存路径相同的合并顺序：逐行、每行按列键顺序
+                counts = result.measures[0].counts
+                for cell, col in enumerate(col_labels * len(result.row_labels)):
+                    if counts[cell]:
+                        for plan, col_total, total, measure in zip(plans, col_totals[(), col], grand_total,
+                                                                   result.measures):
+                            state = measure.state(cell)
+                            plan.merge_cell(col_total, state)
+                            plan.merge_cell(total, state)
+            writer.write_lines([_total_line(header, col_totals, grand_total if rows else None, " ")])
+
+    if stage:
+        stage.finish(rows=rows)
+    return spills
 
 
-# # Loading data from the created CSV file
-# test_data, test_columns = load_data(test_csv)
-# test_data,test_columns
 #%%
-# Step 2: Adding/Deleting Columns and Rows
-# 添加行，列；删除行，列。
+#Step 19:抽样预览
+# 定义透视字段的过程中，先在随机样本上聚合，不扫描全部数据就能马上看到透视表的形状。
+# 样本逐级加大（默认约 0.1% → 1% → 10%），每一级只聚合新抽到的行并与前一级的状态合并，
+# 直到用户接受预览，或者要求精确结果（build_pivot）为止。
+# 样本是不放回的简单随机样本：Table 和行列表按随机行号取行，代价只与样本大小有关；
+# CSV 文件在随机的字节偏移处 seek，读取其后的第一整行，不需要读完整个文件
+# （每行被抽中的概率与上一行的长度成正比，行长度相近时近似均匀；不支持压缩文件和引号内的换行）。
+# count/sum 按 总行数/样本行数 放大，并按正态近似给出每个单元格的置信区间，average 是样本均值（同样有区间）；
+# CSV 文件的总行数本身也是由样本的平均行长估计的，它的方差一并计入 count/sum 的区间（包括总计）；
+# minimum/maximum/median/distinct 等只报告样本上的值，不给区间。
 
-def add_column(data):
+# 默认的各级抽样比例
+PREVIEW_FRACTIONS = (0.001, 0.01, 0.1)
+# 每一级样本的最少行数（数据不多于此时直接使用全部数据，得到精确结果）
+PREVIEW_MIN_ROWS = 1000
+# 第一级样本的最多行数，使第一次预览的耗时与数据规模无关
+PREVIEW_FIRST_ROWS = 20000
+
+
+def _preview_text(value, half_width):
+    """把估计值格式化为 “值 ± 半宽”，两者都按半宽的前两位有效数字取整；没有区间时只显示值。"""
+    if half_width is None:
+        return str(value)
+    if half_width == 0 and value == int(value):
+        value, half_width = int(value), 0
+    elif half_width > 0:
+        digits = 1 - math.floor(math.log10(half_width))
+        value, half_width = round(value, digits), round(half_width, digits)
+        if digits <= 0:
+            value, half_width = int(value), int(half_width)
+    return f"{value} ± {half_width}"
+
+
+class PivotPreview:
     """
-    向数据集中添加一个新列。
+    一级抽样预览：样本上的聚合状态，以及由它推广到全部数据的估计。
 
-    参数:
-        data (list of dict): 数据列表。
-        column_name (str): 新列的名称。
+    属性:
+        result (PivotResult): 样本上的聚合结果（未放大）。
+        squares (dict): {(行键, 列键): [每个值字段的平方和]}，用于估计方差。
+        sample_rows (int): 样本行数。
+        total_rows (int): 全部数据的行数（CSV 文件按样本的平均行长估计）。
+        total_rows_variance (float): total_rows 的估计方差；行数已知（Table、行列表或精确结果）时为 0。
+        confidence (float): 置信区间的置信水平。
     """
-    column_name = input(f"Add:")
 
-    # 验证 column_name 是否是字母数字的
-    if not column_name.isalnum():
-        raise ValueError("列名称必须是字母数字的")
+    def __init__(self, result, squares, sample_rows, total_rows, confidence, total_rows_variance=0.0):
+        self.result = result
+        self.squares = squares
+        self.sample_rows = sample_rows
+        self.total_rows = total_rows
+        self.total_rows_variance = total_rows_variance
+        self.confidence = confidence
+        self._z = NormalDist().inv_cdf((1 + confidence) / 2)
 
-    # 如果数据集至少有一行，提示用户输入新列的默认值
-    if len(data) > 0:
-        default_value = input(f"请输入列 '{column_name}' 的默认值（直接按Enter使用基于1的索引编号）: ")
-        if default_value == "":
-            # 使用基于1的行索引编号作为默认值
-            for i, row in enumerate(data):
-                row[column_name] = i + 1
-        else:
-            # 使用用户输入的默认值
-            for row in data:
-                row[column_name] = default_value
-    else:
-        # 如果数据集为空，不进行任何操作
-        pass
+    @property
+    def exact(self):
+        """样本是否已经包含全部数据（此时的值就是精确结果）。"""
+        return self.sample_rows >= self.total_rows
 
+    @property
+    def fraction(self):
+        """样本占全部数据的比例。"""
+        return min(1.0, self.sample_rows / self.total_rows) if self.total_rows else 1.0
 
+    def estimate(self, m, func, state, squares):
+        """
+        由样本上一组单元格的状态估计全部数据上的值。
 
-def delete_column(data):
-    """
-    从数据集中删除一个列。
+        参数:
+            m (int): 值字段的序号。
+            func (str): 聚合函数。
+            state (list): 该值字段的稀疏状态 [sum, count, min, max, 草图...]。
+            squares (float): 该值字段在这组单元格上的平方和。
 
-    参数:
-        data (list of dict): 数据列表。
-        column_name (str): 要删除的列的名称。
-    """
-    column_name = input(f"Delete:")
+        返回:
+            value: 估计值；没有数据时为 None。
+            half_width (float): 置信区间的半宽；样本已包含全部数据或该聚合函数不提供区间时为 None。
+        """
+        total, count = state[0], state[1]
+        if not count:
+            return None, None
+        n, N = self.sample_rows, self.total_rows
+        if self.exact or func not in ("count", "sum", "average", "mean"):
+            return self.result.measures[m].plan.finalize(state)[func], None
+        fpc = math.sqrt(1 - n / N)  # 不放回抽样的有限总体校正
+        if func in ("average", "mean"):
+            if count < 2:
+                return total / count, None
+            variance = max(0.0, squares - total * total / count) / (count - 1)
+            return total / count, self._z * math.sqrt(variance / count) * fpc
+        # count/sum：每行贡献 z = 是否属于这组单元格（count）或 值 × 是否属于（sum），估计 N × mean(z)；
+        # N 也是估计值时，方差再加上 mean(z)² × Var(N)（总计的 mean(z) = 1，区间完全来自 N）
+        if func == "count":
+            total = squares = count
+        if n < 2:
+            return N * total / n, None
+        mean = total / n
+        variance = max(0.0, squares - n * mean * mean) / (n - 1)
+        spread = N * N * variance / n * fpc * fpc + mean * mean * self.total_rows_variance
+        return N * mean, self._z * math.sqrt(spread)
 
+    def _group(self, row_positions, col_positions):
+        """按行键/列键的一部分合并单元格（见 _grouping_states），返回 {(行键, 列键): (状态, 平方和)}。"""
+        states = _grouping_states(self.result, row_positions, col_positions)
+        squares = {}
+        for (row_label, col_label), cell_squares in self.squares.items():
+            key = (tuple(row_label[i] for i in row_positions), tuple(col_label[i] for i in col_positions))
+            total = squares.get(key)
+            if total is None:
+                squares[key] = list(cell_squares)
+            else:
+                for i, value in enumerate(cell_squares):
+                    total[i] += value
+        return {key: (state, squares[key]) for key, state in states.items()}
 
-    # 检查数据集是否至少有一行
-    if len(data) == 0:
-        print("数据集为空，没有列可以删除。")
-        return
+    def _texts(self, group, missing):
+        if group is None:
+            return [missing] * len(self.result.value_columns)
+        state, squares = group
+        texts = []
+        for m, func, _ in self.result.value_columns:
+            value, half_width = self.estimate(m, func, state[m], squares[m])
+            texts.append(missing if value is None else _preview_text(value, half_width))
+        return texts
 
-    # 检查要删除的列是否存在于数据集中
-    if column_name not in data[0]:
-        print(f"列 '{column_name}' 不存在于数据集中，无法删除。")
-        return
+    def lines(self, missing=" "):
+        """
+        与 pivot_lines 相同的布局（包含总计），有区间的单元格显示为 “估计值 ± 半宽”。
 
-    # 删除列
-    for row in data:
-        del row[column_name]
+        产出:
+            line (list of str): 一行输出。
+        """
+        result = self.result
+        all_rows, all_cols = tuple(range(len(result.row_keys))), tuple(range(len(result.col_keys)))
+        cells = self._group(all_rows, all_cols)
+        row_totals = self._group(all_rows, ())
+        col_totals = self._group((), all_cols)
+        yield from _header_lines(result, True)
+        for row_label in result.row_labels:
+            yield ([str(item) for item in row_label]
+                   + [text for col_label in result.col_labels
+                      for text in self._texts(cells.get((row_label, col_label)), missing)]
+                   + self._texts(row_totals[row_label, ()], missing))
+        yield (["Total"] + [""] * (len(result.row_keys) - 1)
+               + [text for col_label in result.col_labels
+                  for text in self._texts(col_totals.get(((), col_label)), missing)]
+               + self._texts(self._group((), ()).get(((), ())), missing))
 
-    print(f"列 '{column_name}' 已从数据集中删除。")
 
+class _RowSampler:
+    """Table 或行列表的不放回随机抽样：按随机行号取行。"""
 
+    def __init__(self, data, rng):
+        self.data = data
+        self.rng = rng
+        self.total_rows = len(data)
+        self.total_rows_variance = 0.0
+        self._taken = set()
 
-def add_row(data):
-    """
-    向数据集中添加一个新行。
+    def sample(self, k, columns):
+        """再抽取 k 个之前没有抽到过的行（k 小于剩余的行数）。"""
+        rows = []
+        taken, randrange, n = self._taken, self.rng.randrange, self.total_rows
+        while len(rows) < k:
+            row = randrange(n)
+            if row not in taken:
+                taken.add(row)
+                rows.append(row)
+        if isinstance(self.data, Table):
+            return self.data.take(rows, columns)
+        return [self.data[row] for row in rows]
 
-    参数:
-        data (list of dict): 数据列表。
-    """
-    # 检查数据集是否至少有一个列
-    if len(data) == 0 or len(data[0]) == 0:
-        print("数据集应至少包含一个列。")
-        return
+    def everything(self, columns):
+        return self.data
 
-    # 获取数据集中的列名
-    columns = list(data[0].keys())
 
-    # 为新行创建一个字典，并提示用户为每个列输入值
-    new_row = {}
-    for column in columns:
-        new_row[column] = input(f"'{column}':")
+class _FileSampler:
+    """CSV 文件的随机抽样：在随机字节偏移处 seek，读取其后的第一整行（按行首的偏移去重）。"""
 
-    # 将新行添加到数据集中
-    data.append(new_row)
+    def __init__(self, file_path, columns, rng, schema):
+        if _codec(file_path) is not None:
+            raise ValueError("抽样预览不支持压缩文件，请先加载为 Table")
+        self.file_path = file_path
+        self.rng = rng
+        self.schema = dict(infer_schema(file_path, columns=columns), **_check_schema(schema))
+        self._columns, self._project = _projector(read_header(file_path), columns)
+        self._size = os.path.getsize(file_path)
+        self._taken = set()
+        self._bytes = 0
+        self._byte_squares = 0
+        with open(file_path, "rb") as file:
+            file.readline()
+            self._data_start = file.tell()
+            # 在第一次抽样之前，按文件开头的行估计总行数
+            head = file.readlines(1 << 16)
+        self.total_rows = self._estimate_rows(len(head), sum(map(len, head)))
+        self.total_rows_variance = 0.0
 
+    def _estimate_rows(self, lines, size):
+        if not lines:
+            return 0
+        return max(len(self._taken), round((self._size - self._data_start) * lines / size))
 
+    def _estimate_rows_variance(self):
+        """总行数 = 数据字节数 / 平均行长，按 delta 方法由行长的样本方差估计它的方差。"""
+        n, N = len(self._taken), self.total_rows
+        if n < 2 or not self._bytes or n >= N:
+            return 0.0
+        mean = self._bytes / n
+        variance = max(0.0, self._byte_squares - n * mean * mean) / (n - 1)
+        return N * N * variance / (n * mean * mean) * (1 - n / N)
 
-def delete_row(data):
-    """
-    从数据集中删除一个行。
+    def sample(self, k, columns):
+        """再抽取最多 k 个之前没有抽到过的行；小文件中可能抽不到足够多的新行。"""
+        lines = []
+        with open(self.file_path, "rb") as file:
+            for _ in range(4 * k + 100):
+                if len(lines) >= k:
+                    break
+                # 从表头末尾的换行符开始取偏移，第一行数据也能被抽到
+                file.seek(self.rng.randrange(self._data_start - 1, self._size))
+                file.readline()
+                start = file.tell()
+                if start >= self._size or start in self._taken:
+                    continue
+                line = file.readline()
+                self._taken.add(start)
+                self._bytes += len(line)
+                self._byte_squares += len(line) * len(line)
+                if line.strip():
+                    lines.append(line if line.endswith(b"\n") else line + b"\n")
+        self.total_rows = self._estimate_rows(len(self._taken), self._bytes)
+        self.total_rows_variance = self._estimate_rows_variance()
+        # 与 _open_csv 相同的编码和换行处理
+        reader = csv.reader(io.TextIOWrapper(io.BytesIO(b"".join(lines)), newline=""))
+        rows = [self._project(values) if self._project else values for values in reader if values]
+        return self._typed(rows)
 
-    参数:
-        data (list of dict): 数据列表。
-        row_index (int): 要删除的行的索引（基于1）。
-    """
-    # 调整行索引以适应基于0的索引
+    def _typed(self, rows):
+        parsed = []
+        for i, column in enumerate(self._columns):
+            try:
+                parsed.append(_parse_column([row[i] if i < len(row) else "" for row in rows],
+                                            self.schema[column], strict=True)[1])
+            except ValueError as e:
+                raise ValueError(f"列 '{column}': {e}（可以用 schema 指定更宽的类型）") from None
+        return [dict(zip(self._columns, values)) for values in zip(*parsed)]
 
-    row_index = int(input("Delete:"))
+    def everything(self, columns):
+        return _iter_typed_rows(self.file_path, columns, schema=self.schema)
 
-    row_index -= 1
 
-    # 检查行索引是否在有效范围内
-    if 0 <= row_index < len(data):
-        del data[row_index]
-        print(f"第 {row_index + 1} 行已从数据集中删除。")
-    else:
-        print(f"错误：没有找到索引为 {row_index + 1} 的行。")
-#%%
-# Step 3: Defining Pivot Fields
-# 数据透视表字段定义；
+def _track_squares(inputs, numeric, squares):
+    """原样转发 _iter_pivot_inputs 的三元组，同时把数值值字段的平方累加到 squares[(行键, 列键)]。"""
+    for item in inputs:
+        row_key, col_key, raws = item
+        cell = squares.get((row_key, col_key))
+        if cell is None:
+            cell = squares[row_key, col_key] = [0.0] * len(raws)
+        for m in numeric:
+            value = float(raws[m])
+            cell[m] += value * value
+        yield item
 
-def view_pivot_fields(data_structure):
+
+def preview_pivot(data, row_keys, col_keys, value_key, aggregation_funcs, fractions=PREVIEW_FRACTIONS,
+                  confidence=0.95, seed=None, schema=None):
     """
-    查看当前添加的透视表字段列表。
+    逐级加大随机样本，产出透视表的抽样预览。
 
-    参数:
-        data_structure (dict): 存储透视字段的数据结构。
+    调用方接受某一级预览后停止迭代即可；需要精确结果时调用 build_pivot。
+    每一级只聚合新抽到的行，之前产出的预览与之后的级别共享 median 等草图的状态，需要保留时应先渲染。
+
+    参数：
+        data (Table、list of dict 或 str): 数据集，或未压缩的 CSV 文件路径。
+        row_keys, col_keys, value_key, aggregation_funcs: 同 build_pivot。
+        fractions (iterable of float): 各级样本占全部数据的比例，递增；
+            每级至少 PREVIEW_MIN_ROWS 行，第一级最多 PREVIEW_FIRST_ROWS 行。
+        confidence (float): 置信区间的置信水平。
+        seed: 随机种子；相同的种子和数据得到相同的样本。
+        schema (dict): data 是文件路径时显式指定的列类型；其余列按文件开头的样本推断。
+
+    产出：
+        preview (PivotPreview): 每一级样本上的预览；样本包含全部数据后不再继续。
     """
-    print("Columns:")
-    print("•", "、".join([field[0] for field in data_structure["columns"]]))
+    measures = normalize_measures(value_key, aggregation_funcs)
+    plans = [_AggregationPlan(funcs) for _, funcs in measures]
+    value_keys = [key for key, _ in measures]
+    needed = list(dict.fromkeys(list(row_keys) + list(col_keys) + value_keys))
+    numeric = [m for m, plan in enumerate(plans) if plan.numeric]
+    rng = random.Random(seed)
+    if isinstance(data, (str, os.PathLike)):
+        sampler = _FileSampler(os.fspath(data), needed, rng, schema)
+    elif isinstance(data, (Table, list)):
+        sampler = _RowSampler(data, rng)
+    else:
+        raise TypeError("抽样预览需要 Table、行列表或 CSV 文件路径")
 
-    print("Rows:")
-    print("•", "、".join([field[0] for field in data_structure["rows"]]))
+    pivot_data, squares, sampled = {}, {}, 0
+    for level, fraction in enumerate(fractions):
+        target = max(PREVIEW_MIN_ROWS, math.ceil(sampler.total_rows * fraction))
+        if level == 0:
+            target = min(target, PREVIEW_FIRST_ROWS)
+        if target <= sampled:
+            continue
+        stage = _active_stats and _active_stats.begin("preview")
+        full = target >= sampler.total_rows
+        if full:
+            # 样本将覆盖全部数据：重新精确聚合（文件的总行数在此之前只是估计值）
+            pivot_data, squares = {}, {}
+            rows = sampler.everything(needed)
+        else:
+            rows = sampler.sample(target - sampled, needed)
+        inputs = _track_squares(_iter_pivot_inputs(rows, row_keys, col_keys, value_keys), numeric, squares)
+        _aggregate_inputs(inputs, plans, pivot_data)
+        # 每一行都会使第一个值字段的 count 加一
+        sampled = sum(cell[0][1] for row_data in pivot_data.values() for cell in row_data.values())
+        if full:
+            sampler.total_rows, sampler.total_rows_variance = sampled, 0.0
+        result = PivotResult.from_partials(row_keys, col_keys, measures, pivot_data)
+        if stage:
+            stage.finish(rows=sampled, cells=_count_cells(result))
+        yield PivotPreview(result, {key: list(value) for key, value in squares.items()}, sampled,
+                           max(sampled, sampler.total_rows), confidence, sampler.total_rows_variance)
+        if sampled >= sampler.total_rows:
+            return
 
-    print("Values:")
-    print("•", "、".join([f"{field[0]} – {field[1].capitalize()}" for field in data_structure["values"]]))
 
+def render_preview_console(preview):
+    """控制台渲染器：打印样本规模和抽样预览（格式同 render_pivot_console）。"""
+    if preview.exact:
+        print(f"\n精确结果（全部 {preview.sample_rows} 行）")
+    else:
+        print(f"\n抽样预览：{preview.sample_rows} / 约 {preview.total_rows} 行（{preview.fraction:.1%}），"
+              f"区间为 {preview.confidence:.0%} 置信区间")
+    for line in preview.lines(missing="None"):
+        print(",".join(line))
 
-def add_pivot_field(data_structure):
+
+def preview_pivot_fields(data, data_structure, refine=False):
     """
-    通过提示用户输入属性名和字段类型来添加一个透视表字段。
-    对于值字段，提示用户选择所需的聚合函数。
+    在控制台上打印当前透视字段的抽样预览；还没有值字段时不打印。
+
     参数:
+        data (Table 或 list of dict): 数据集。
         data_structure (dict): 存储透视字段的数据结构。
+        refine (bool): 为 True 时逐级加大样本，每一级之后询问是否继续：
+            直接按 Enter 继续细化，输入 e 生成精确结果，输入其它内容接受当前预览。
     """
-    field_name = input("请输入属性名称: （在Name、Gender、Age、Employment（columns、rows）；Salary（values）中选择）: ")
-    field_type = input("请输入字段类型（columns/rows/values）: ")
-
-    if field_type not in ["columns", "rows", "values"]:
-        print("无效的字段类型。必须是 'columns'、'rows' 或 'values'。")
+    if not data_structure["values"]:
         return
+    value_key, aggregation_funcs = pivot_measures(data_structure)
+    row_keys, col_keys = data_structure["rows"], data_structure["columns"]
+    for preview in preview_pivot(data, row_keys, col_keys, value_key, aggregation_funcs):
+        render_preview_console(preview)
+        if not refine or preview.exact:
+            return
+        answer = input("按Enter继续细化，输入 e 生成精确结果，输入其它内容接受当前预览：").strip().lower()
+        if answer == "e":
+            render_pivot_console(pivot_cache.pivot(data, row_keys, col_keys, value_key, aggregation_funcs))
+            return
+        if answer:
+            return
 
-    if any(field_name in field[0] for field in data_structure[field_type]):
-        print("错误：该属性已作为透视表字段添加。")
-        return
 
-    aggregation = None
-    if field_type == "values":
-        aggregation = input("请选择聚合函数（count/sum/average/minimum/maximum）: ")
-        if aggregation not in ["count", "sum", "average", "minimum", "maximum"]:
-            print("无效的聚合函数。")
-            return
+#%%
+#Step 20:输出格式与分页显示
+# 写出：输出行按块拼接后一次写入带大缓冲的文件，而不是每行调用一次 write；行由 pivot_lines 逐块产出，
+# 第一块格式化完就开始写。格式由 fmt 参数或文件扩展名决定（.csv / .tsv / .jsonl），
+# 扩展名再加 .gz 时边写边压缩。CSV 只给含逗号、双引号或换行的字段加引号（与 csv.writer 相同），
+# 其余的行与之前的输出一致；TSV 把字段中的制表符、换行和反斜杠转义为 \t、\n、\r、\\；
+# JSON Lines 的每一行是一个字符串数组，与 CSV 的一行对应。
+# 控制台：交互终端中分页显示，表头固定在每页顶部、行标签列固定在左侧，
+# 每页只取出、对齐当前可见的行和列；输出被重定向到文件或管道时仍按逗号分隔的格式输出全部行。
 
-    data_structure[field_type].append(field_name)
-    data_structure["funcs"].append(aggregation)
-    print(f"{field_name} 已添加到 {field_type}。")
+# 输出文件的写缓冲区大小
+WRITE_BUFFER_SIZE = 1 << 20
+# 每次拼接、写入的输出行数
+WRITE_BATCH_LINES = 4096
+# gzip 输出的压缩级别：比默认的 9 快得多，压缩率相差不大
+GZIP_LEVEL = 6
 
+# 需要引号或转义的字符（逗号和制表符按字段数另行检查）
+_CSV_SPECIAL = re.compile(r'["\r\n]')
+_TSV_SPECIAL = re.compile(r"[\\\n\r]")
+_TSV_ESCAPES = str.maketrans({"\\": "\\\\", "\t": "\\t", "\n": "\\n", "\r": "\\r"})
 
-def remove_pivot_field(data_structure):
-    """
-    通过提示用户输入属性名称来删除一个透视表字段。
 
-    参数:
-        data_structure (dict): 存储透视字段的数据结构。
+def _encode_csv_line(line):
     """
-    field_name = input("请输入要删除的属性名称: ")
+    把一行编码为 CSV（不含换行符），引号规则与 csv.writer 的 QUOTE_MINIMAL 相同。
+    绝大多数行不需要引号，直接用逗号连接；只有含特殊字符的行交给 csv.writer。
+    """
+    text = ",".join(line)
+    if text.count(",") == len(line) - 1 and not _CSV_SPECIAL.search(text) and text:
+        return text
+    buffer = io.StringIO()
+    csv.writer(buffer).writerow(line)
+    return buffer.getvalue()[:-2]  # 去掉 csv.writer 的 "\r\n"
 
-    field_removed = False
-    for field_type in ["columns", "rows", "values"]:
-        original_length = len(data_structure[field_type])
-        data_structure[field_type] = [field for field in data_structure[field_type] if field[0] != field_name]
-        if len(data_structure[field_type]) < original_length:
-            field_removed = True
 
-    if field_removed:
-        print(f"{field_name} 已从透视表字段中删除。")
-    else:
-        print("错误：该属性未作为透视表字段添加。")
+def _encode_tsv_line(line):
+    """把一行编码为 TSV（不含换行符）；字段中的制表符、换行和反斜杠被转义，保证一行输出对应一行数据。"""
+    text = "\t".join(line)
+    if text.count("\t") == len(line) - 1 and not _TSV_SPECIAL.search(text):
+        return text
+    return "\t".join(field.translate(_TSV_ESCAPES) for field in line)
 
 
-#%%
-#Step 10:生成多维透视表
+# 输出格式：把一行（字符串列表）编码为一行文本（不含换行符）
+OUTPUT_FORMATS = {
+    "csv": _encode_csv_line,
+    "tsv": _encode_tsv_line,
+    # 与 json.dumps(line, ensure_ascii=False) 相同，省去通用编码器逐行的开销
+    "jsonl": lambda line: "[" + ", ".join(map(json.encoder.encode_basestring, line)) + "]",
+}
+_FORMAT_EXTENSIONS = {".csv": "csv", ".tsv": "tsv", ".tab": "tsv", ".jsonl": "jsonl", ".ndjson": "jsonl"}
 
-def generate_pivot_table(data, row_keys, col_keys, value_key, aggregation_funcs):
+
+def output_format(output_file, fmt=None):
     """
-    生成透视表并在控制台上打印它。
+    确定输出格式。
 
-    参数：
-        data (list of dict): 数据列表，其中每个条目是一个包含列名和值的字典。
-        row_keys (list of str): 用于行分组的列名的列表。
-        col_keys (list of str): 用于列分组的列名的列表。
-        value_key (str): 用于值字段的列名。
-        aggregation_funcs (list of str): 用于聚合函数的列表。
+    参数:
+        output_file (str): 输出文件的路径。
+        fmt (str): 显式指定的格式；为 None 时按扩展名（去掉 .gz 之后）推断，无法识别时为 csv。
+
+    返回:
+        fmt (str): OUTPUT_FORMATS 中的格式名。
     """
-    pivot_data = {}
+    if fmt is None:
+        base = output_file[:-3] if output_file.lower().endswith(".gz") else output_file
+        fmt = _FORMAT_EXTENSIONS.get(os.path.splitext(base)[1].lower(), "csv")
+    if fmt not in OUTPUT_FORMATS:
+        raise ValueError(f"未知的输出格式: {fmt}（可选 {', '.join(OUTPUT_FORMATS)}）")
+    return fmt
 
-    for row in data:
-        row_key = tuple(row[k] for k in row_keys)
-        col_key = tuple(row[k] for k in col_keys)
-        value = float(row[value_key])
 
-        if row_key not in pivot_data:
-            pivot_data[row_key] = {}
-        if col_key not in pivot_data[row_key]:
-            pivot_data[row_key][col_key] = {'sum': 0, 'count': 0, 'mean': 0}
+class PivotWriter:
+    """
+    透视输出的写入器：按格式编码输出行，成批拼接后写入带大缓冲的文件；文件名以 .gz 结尾时边写边压缩。
 
-        pivot_data[row_key][col_key]['sum'] += value
-        pivot_data[row_key][col_key]['count'] += 1
-        pivot_data[row_key][col_key]['mean'] = pivot_data[row_key][col_key]['sum'] / pivot_data[row_key][col_key][
-            'count']
+    参数:
+        output_file (str): 输出文件的路径。
+        fmt (str): 输出格式（见 OUTPUT_FORMATS）；为 None 时按扩展名推断。
 
-    unique_col_labels = sorted(list(set(col_key for row_data in pivot_data.values() for col_key in row_data.keys())))
+    用法:
+        with PivotWriter("pivot.tsv.gz") as writer:
+            writer.write_lines(pivot_lines(result))
+    """
 
-    # 打印列标签
-    for i in range(len(col_keys)):
-        # 在第二行导入行标签
-        row_labels = "/".join(row_keys)
-        col_labels_line = [row_labels] + [""] * (len(row_keys) - 1) + [str(col[i]) for col in unique_col_labels for _ in
-                                                                       aggregation_funcs] + [""]
-        print(",".join(col_labels_line))
-    func_labels_line = [""] * len(row_keys) + [func for _ in unique_col_labels for func in aggregation_funcs] + [""]
-    print(",".join(func_labels_line))
+    def __init__(self, output_file, fmt=None):
+        self.output_file = output_file
+        self.format = output_format(output_file, fmt)
+        self.lines = 0
+        self._encode = OUTPUT_FORMATS[self.format]
+        if output_file.lower().endswith(".gz"):
+            raw = gzip.GzipFile(output_file, "wb", compresslevel=GZIP_LEVEL)
+            self._file = io.TextIOWrapper(io.BufferedWriter(raw, WRITE_BUFFER_SIZE), newline="")
+        else:
+            self._file = open(output_file, "w", newline="", buffering=WRITE_BUFFER_SIZE)
 
-    total_per_col = [0] * len(unique_col_labels) * len(aggregation_funcs)
-    total_all = 0
+    def write_batches(self, batches):
+        """写入若干块输出行（见 pivot_batches），每块拼接成一个字符串写入一次。"""
+        encode, write = self._encode, self._file.write
+        for batch in batches:
+            if batch:
+                write("\n".join(map(encode, batch)) + "\n")
+                self.lines += len(batch)
 
-    for row_key, row_data in pivot_data.items():
-        row = [str(item) for item in row_key]
-        row_total = 0
+    def write_lines(self, lines):
+        """写入输出行（可以是生成器），每 WRITE_BATCH_LINES 行写入一次。"""
+        lines = iter(lines)
+        self.write_batches(iter(lambda: list(islice(lines, WRITE_BATCH_LINES)), []))
 
-        for col_key in unique_col_labels:
-            for func in aggregation_funcs:
-                value = row_data.get(col_key, {}).get(func, None)
-                row.append(str(value))
-        print(",".join(row))
+    def close(self):
+        self._file.close()
 
+    def __enter__(self):
+        return self
 
-#Step 11:多维透视表加入统计
+    def __exit__(self, *exc_info):
+        self.close()
 
-def generate_pivot_table_no_csv(data, row_keys, col_keys, value_key, aggregation_funcs, output_file):
+
+def render_pivot_file(result, output_file, fmt=None, totals=True, subtotals=False):
     """
-    生成透视表并将其保存到CSV文件中。
+    文件渲染器：把聚合结果写入 CSV/TSV/JSON Lines 文件，文件名以 .gz 结尾时压缩。
 
     参数：
-        data (list of dict): 数据列表，其中每个条目是一个包含列名和值的字典。
-        row_keys (list of str): 用于行分组的列名的列表。
-        col_keys (list of str): 用于列分组的列名的列表。
-        value_key (str): 用于值字段的列名。
-        aggregation_funcs (list of str): 用于聚合函数的列表。
+        result (PivotResult): 聚合结果。
         output_file (str): 输出文件的路径。
+        fmt (str): 输出格式（见 OUTPUT_FORMATS）；为 None 时按扩展名推断。
+        totals (bool): 是否输出总计。
+        subtotals (bool): 是否输出各层行分组的小计行。
+
+    返回：
+        lines (int): 写入的行数。
     """
-    pivot_data = {}
+    with PivotWriter(output_file, fmt) as writer:
+        stage = _active_stats and _active_stats.begin("write_" + writer.format)
+        writer.write_batches(pivot_batches(result, totals=totals, subtotals=subtotals))
+    if stage:
+        stage.finish(rows=writer.lines, bytes_written=os.path.getsize(output_file))
+    return writer.lines
 
-    for row in data:
-        row_key = tuple(row[k] for k in row_keys)
-        col_key = tuple(row[k] for k in col_keys)
-        value = float(row[value_key])
-
-        if row_key not in pivot_data:
-            pivot_data[row_key] = {}
-        if col_key not in pivot_data[row_key]:
-            pivot_data[row_key][col_key] = {'sum': 0, 'count': 0, 'mean': 0}
-
-        pivot_data[row_key][col_key]['sum'] += value
-        pivot_data[row_key][col_key]['count'] += 1
-        pivot_data[row_key][col_key]['mean'] = pivot_data[row_key][col_key]['sum'] / pivot_data[row_key][col_key][
-            'count']
-
-    unique_col_labels = sorted(list(set(col_key for row_data in pivot_data.values() for col_key in row_data.keys())))
-
-    with open(output_file, 'w', newline='') as file:
-        # 写入列标签
-        for i in range(len(col_keys)):
-            # 在第二行导入行标签
-            row_labels = "/".join(row_keys)
-            col_labels_line = [row_labels] + [""] * (len(row_keys) - 1) + [str(col[i]) for col in unique_col_labels for
-                                                                           _ in aggregation_funcs] + [""]
-            file.write(",".join(col_labels_line) + "\n")
-        func_labels_line = [""] * len(row_keys) + [func for _ in unique_col_labels for func in aggregation_funcs] + [""]
-        file.write(",".join(func_labels_line) + "\n")
-
-        total_per_col = [0] * len(unique_col_labels) * len(aggregation_funcs)
-        total_all = 0
-
-        for row_key, row_data in pivot_data.items():
-            row = [str(item) for item in row_key]
-            row_total = 0
-
-            for col_key in unique_col_labels:
-                for func in aggregation_funcs:
-                    value = row_data.get(col_key, {}).get(func, None)
-                    row.append(" " if value is None else str(value))  # Update here
-                    if value is not None:
-                        col_index = unique_col_labels.index(col_key) * len(aggregation_funcs) + aggregation_funcs.index(
-                            func)
-                        total_per_col[col_index] += value
-                        row_total += value
-                        total_all += value
-
-            row.append(str(row_total))
-            file.write(",".join(row) + "\n")
-
-        total_per_col_str = [str(val) for val in total_per_col]
-        file.write("Total," + ",".join(total_per_col_str) + f",{total_all}\n")
 
+def _display_width(text):
+    """文本在终端上占的列数（全角字符占两列）。"""
+    if text.isascii():
+        return len(text)
+    return sum(2 if unicodedata.east_asian_width(ch) in "WF" else 1 for ch in text)
 
-def generate_pivot_table_console(data, row_keys, col_keys, value_key, aggregation_funcs):
-    """
-    生成透视表并在控制台上打印它。
 
-    参数：
-        data (list of dict): 数据列表，其中每个条目是一个包含列名和值的字典。
-        row_keys (list of str): 用于行分组的列名的列表。
-        col_keys (list of str): 用于列分组的列名的列表。
-        value_key (str): 用于值字段的列名。
-        aggregation_funcs (list of str): 用于聚合函数的列表。
-    """
-    pivot_data = {}
+def _grow_widths(widths, lines):
+    """按 lines 中最宽的单元格放宽每一列的显示宽度（原地修改 widths）；列宽只增不减。"""
+    for i, column in enumerate(zip_longest(*lines, fillvalue="")):
+        column_width = max(map(_display_width, column))
+        if i == len(widths):
+            widths.append(column_width)
+        elif column_width > widths[i]:
+            widths[i] = column_width
+    return widths
 
-    for row in data:
-        row_key = tuple(row[k] for k in row_keys)
-        col_key = tuple(row[k] for k in col_keys)
-        value = float(row[value_key])
 
-        if row_key not in pivot_data:
-            pivot_data[row_key] = {}
-        if col_key not in pivot_data[row_key]:
-            pivot_data[row_key][col_key] = {'sum': 0, 'count': 0, 'mean': 0}
+def _align_page(lines, widths, fixed, first, width):
+    """
+    把一页输出行按列对齐：前 fixed 列（行标签）总是显示，值列从第 first 列开始，放不下的列不显示。
 
-        pivot_data[row_key][col_key]['sum'] += value
-        pivot_data[row_key][col_key]['count'] += 1
-        pivot_data[row_key][col_key]['mean'] = pivot_data[row_key][col_key]['sum'] / pivot_data[row_key][col_key][
-            'count']
+    参数：
+        widths (list of int): 每一列的宽度（见 _grow_widths）。
 
-    unique_col_labels = sorted(list(set(col_key for row_data in pivot_data.values() for col_key in row_data.keys())))
+    返回：
+        text (list of str): 对齐后的各行文本。
+        last (int): 显示的最后一列的序号。
+    """
+    n_columns = len(widths)
+    shown = list(range(min(fixed, n_columns)))
+    used = sum(widths[i] + 2 for i in shown)
+    for i in range(max(first, fixed), n_columns):
+        if used + widths[i] > width and len(shown) > fixed:
+            break
+        shown.append(i)
+        used += widths[i] + 2
 
-    # 打印列标签
-    for i in range(len(col_keys)):
-        # 在第二行导入行标签
-        row_labels = "/".join(row_keys)
-        col_labels_line = [row_labels] + [""] * (len(row_keys) - 1) + [str(col[i]) for col in unique_col_labels for _ in
-                                                                       aggregation_funcs] + [""]
-        print(",".join(col_labels_line))
-    func_labels_line = [""] * len(row_keys) + [func for _ in unique_col_labels for func in aggregation_funcs] + [""]
-    print(",".join(func_labels_line))
+    text = []
+    for line in lines:
+        cells = []
+        for i in shown:
+            cell = line[i] if i < len(line) else ""
+            fill = " " * (widths[i] - _display_width(cell))
+            # 行标签左对齐，数值右对齐
+            cells.append(cell + fill if i < fixed else fill + cell)
+        text.append("  ".join(cells).rstrip())
+    return text, shown[-1] if shown else -1
 
-    total_per_col = [0] * len(unique_col_labels) * len(aggregation_funcs)
-    total_all = 0
 
-    for row_key, row_data in pivot_data.items():
-        row = [str(item) for item in row_key]
-        row_total = 0
-
-        for col_key in unique_col_labels:
-            for func in aggregation_funcs:
-                # 此处填充数值
-                value = row_data.get(col_key, {}).get(func, None)
-                row.append(str(value))
-                # 此处引入列总计，行总计
-                if value is not None:
-                    col_index = unique_col_labels.index(col_key) * len(aggregation_funcs) + aggregation_funcs.index(
-                        func)
-                    total_per_col[col_index] += value
-                    row_total += value
-                    total_all += value
-
-        row.append(str(row_total))
-        print(",".join(row))
-
-    total_per_col_str = [str(val) for val in total_per_col]
-    print("Total," + ",".join(total_per_col_str) + f",{total_all}")
+def page_pivot_console(result, totals=True, subtotals=False, page_rows=None, width=None):
+    """
+    分页、按列对齐地在控制台上显示聚合结果。
 
-#%%
-# 定义测试数据
-primary_data = [
-    {"S/N": 1, "Name": "Albert", "Gender": "Male", "Age": 21, "Employment": "Employee", "Salary": 4800},
-    {"S/N": 2, "Name": "Bob", "Gender": "Male", "Age": 21, "Employment": "Employee", "Salary": 5000},
-    {"S/N": 3, "Name": "Charles", "Gender": "Male", "Age": 22, "Employment": "Employee", "Salary": 6000},
-    {"S/N": 4, "Name": "Derrick", "Gender": "Male", "Age": 23, "Employment": "Self-Employed", "Salary": 10000},
-    {"S/N": 5, "Name": "Fred", "Gender": "Male", "Age": 23, "Employment": "Unemployed", "Salary": 1200},
-    {"S/N": 6, "Name": "George", "Gender": "Male", "Age": 25, "Employment": "Self-Employed", "Salary": 12000},
-    {"S/N": 7, "Name": "Hubert", "Gender": "Male", "Age": 26, "Employment": "Unemployed", "Salary": 1000},
-    {"S/N": 8, "Name": "Issac", "Gender": "Male", "Age": 28, "Employment": "Employee", "Salary": 3000},
-    {"S/N": 9, "Name": "John", "Gender": "Male", "Age": 30, "Employment": "Employee", "Salary": 2500},
-    {"S/N": 10, "Name": "Kerry", "Gender": "Male", "Age": 30, "Employment": "Self-Employed", "Salary": 8500},
-    {"S/N": 11, "Name": "Linda", "Gender": "Female", "Age": 21, "Employment": "Self-Employed", "Salary": 9000},
-    {"S/N": 12, "Name": "Mindy", "Gender": "Female", "Age": 21, "Employment": "Self-Employed", "Salary": 8500},
-    {"S/N": 13, "Name": "Nicole", "Gender": "Female", "Age": 22, "Employment": "Unemployed", "Salary": 2000},
-    {"S/N": 14, "Name": "Oprah", "Gender": "Female", "Age": 22, "Employment": "Employee", "Salary": 6500},
-    {"S/N": 15, "Name": "Penny", "Gender": "Female", "Age": 23, "Employment": "Employee", "Salary": 7500},
-    {"S/N": 16, "Name": "Queenie", "Gender": "Female", "Age": 25, "Employment": "Employee", "Salary": 7000},
-    {"S/N": 17, "Name": "Ruby", "Gender": "Female", "Age": 25, "Employment": "Employee", "Salary": 4000},
-    {"S/N": 18, "Name": "Stacy", "Gender": "Female", "Age": 27, "Employment": "Employee", "Salary": 3500},
-    {"S/N": 19, "Name": "Tiffany", "Gender": "Female", "Age": 27, "Employment": "Self-Employed", "Salary": 5000},
-    {"S/N": 20, "Name": "Ursula", "Gender": "Female", "Age": 27, "Employment": "Unemployed", "Salary": 1500},
-]
+    每页只从 pivot_lines 取出当前可见的行（和预读的下一页），不保留整张表，也不预先扫描整张表。
+    列宽由表头和已经取出的行（包括预读的下一页）决定，只增不减，所以翻页后已有的列不会变窄。表头固定在每页顶部，行标签列固定在左侧，
+    值列太多时只显示终端宽度放得下的部分。按 Enter 显示下一页，输入 > 或 < 左右滚动，输入 q 结束。
 
-test_csv = 'Data/test_data_1.csv'  # 你可以指定你想要的文件名
+    参数：
+        result (PivotResult): 聚合结果。
+        totals (bool): 是否显示总计。
+        subtotals (bool): 是否显示各层行分组的小计行。
+        page_rows (int): 每页的数据行数；为 None 时按终端高度决定。
+        width (int): 显示宽度；为 None 时使用终端宽度。
+    """
+    stage = _active_stats and _active_stats.begin("console")
+    size = shutil.get_terminal_size()
+    lines = pivot_lines(result, totals=totals, missing="None", subtotals=subtotals)
+    header = list(islice(lines, len(result.col_keys) + 1))
+    page_rows = page_rows or max(1, size.lines - len(header) - 2)
+    width = width or size.columns
+    fixed = len(result.row_keys)
 
-# 打开文件以写入数据
-with open(test_csv, "w") as file:
-    # 写入头部信息
-    file.write("S/N,Name,Gender,Age,Employment,Salary\n")
+    shown = 0
+    page = list(islice(lines, page_rows))
+    widths = _grow_widths([], header + page)
+    offsets = [fixed]  # 左右滚动经过的每一屏的第一个值列
+    while page:
+        upcoming = list(islice(lines, page_rows))
+        # 按预读的下一页放宽列宽，翻到下一页时各列仍然对齐
+        _grow_widths(widths, upcoming)
+        text, last = _align_page(header + page, widths, fixed, offsets[-1], width)
+        print("\n".join(text))
+        more_columns = last + 1 < len(widths)
+        if not upcoming and not more_columns and len(offsets) == 1:
+            shown += len(page)
+            break
+        hint = "，输入 > / < 左右滚动" if more_columns or len(offsets) > 1 else ""
+        answer = input(f"-- 第 {shown + 1}-{shown + len(page)} 行，按Enter下一页{hint}，输入 q 结束 --").strip()
+        if answer == "q":
+            shown += len(page)
+            break
+        if answer == ">" and more_columns:
+            offsets.append(last + 1)
+        elif answer == "<" and len(offsets) > 1:
+            offsets.pop()
+        else:
+            shown += len(page)
+            page = upcoming
+            continue
+        # 左右滚动：重新显示当前页，已取出的下一页留到之后使用
+        lines = chain(upcoming, lines)
+    if stage:
+        stage.finish(rows=shown)
 
-    # 遍历 primary_data 并将每一行数据写入文件
-    for data in primary_data:
-        file.write(f"{data['S/N']},{data['Name']},{data['Gender']},{data['Age']},{data['Employment']},{data['Salary']}\n")
 
 #%%
 
@@ -448,6 +4810,9 @@ def main_menu():
     """
     主菜单：展示功能列表，获取用户输入，并调用相应的功能。
     """
+    if not os.path.exists(test_csv):
+        write_test_data()
+
     # 推荐的执行顺序
     recommended_order = [1,2,3,4,5]
     current_step = 0  # 跟踪当前步骤
@@ -479,7 +4844,8 @@ def main_menu():
         # 根据用户输入执行相应功能
         if choice == "1":
             print("功能1: 加载数据")
-            test_data, test_columns = load_data(test_csv)
+            test_data = load_table_snapshot(test_csv)
+            test_columns = test_data.columns
             input("按Enter键返回主菜单")
         elif choice == "2":
             print("功能2: 添加/删除 列/行")
@@ -510,8 +4876,7 @@ def main_menu():
             pivot_fields = {
                 "rows": [],
                 "columns": [],
-                "values": [],
-                "funcs":[]
+                "values": []
             }
 
             # 一个子菜单，允许用户多次添加或删除字段，直到他们选择完成
@@ -524,6 +4889,7 @@ def main_menu():
                 print("1: 添加字段")
                 print("2: 删除字段")
                 print("3: 完成定义")
+                print("4: 预览透视表（抽样估计，逐级细化）")
 
                 sub_choice = input("输入数字选择功能：")
 
@@ -532,6 +4898,8 @@ def main_menu():
                     print("\n添加字段：")
                     try:
                         add_pivot_field(pivot_fields)
+                        # 每次调整字段后马上显示一个小样本上的预览
+                        preview_pivot_fields(test_data, pivot_fields)
                     except Exception as e:
                         print(str(e))
 
@@ -540,6 +4908,7 @@ def main_menu():
                     print("\n删除字段：")
                     try:
                         remove_pivot_field(pivot_fields)
+                        preview_pivot_fields(test_data, pivot_fields)
                     except Exception as e:
                         print(str(e))
 
@@ -548,9 +4917,16 @@ def main_menu():
                     print("\n完成定义，返回主菜单。")
                     break
 
+                # 逐级细化的抽样预览
+                elif sub_choice == "4":
+                    try:
+                        preview_pivot_fields(test_data, pivot_fields, refine=True)
+                    except Exception as e:
+                        print(str(e))
+
                 # 无效输入
                 else:
-                    print("\n无效输入，请输入1-3的数字选择功能。")
+                    print("\n无效输入，请输入1-4的数字选择功能。")
 
             input("按Enter键返回主菜单")
 
@@ -561,41 +4937,35 @@ def main_menu():
             print(row_keys_test)
             col_keys_test = pivot_fields["columns"]
             print(col_keys_test)
-            value_key_test = pivot_fields["values"][0]
+            # 多个值字段在同一次扫描中聚合
+            value_key_test, aggregation_funcs_test = pivot_measures(pivot_fields)
             print(value_key_test)
-            aggregation_funcs_test = [func for func in pivot_fields["funcs"] if func is not None]
             print(aggregation_funcs_test)
             output_file_test = "output_test8.csv"  #若导出文件，需修改路径名
 
+            # 只扫描一次数据，CSV 文件和控制台显示共用同一个聚合结果
+            pivot_result = pivot_cache.pivot(test_data, row_keys_test, col_keys_test, value_key_test,
+                                             aggregation_funcs_test)
+
             # 如果不导出文件，可以不使用这一函数，如果导出文件，需要取消注释，生成到对应目录下；
-            # 再次测试函数
-            generate_pivot_table_no_csv(test_data,row_keys_test, col_keys_test, value_key_test, aggregation_funcs_test, output_file_test)
+            render_pivot_csv(pivot_result, output_file_test)
 
             # 验证生成的CSV文件
             with open(output_file_test, "r") as file:
                 print(file.read())
 
-            # 使用先前定义的测试数据和参数调用函数,这里直接在控制台动态显示
-            generate_pivot_table(
-                test_data,
-                row_keys_test,
-                col_keys_test,
-                value_key_test,
-                aggregation_funcs_test
-            )
-
-            generate_pivot_table_console(
-                test_data,
-                row_keys_test,
-                col_keys_test,
-                value_key_test,
-                aggregation_funcs_test
-            )
+            # 使用同一个聚合结果,这里直接在控制台动态显示
+            render_pivot_console(pivot_result, totals=False)
+
+            render_pivot_console(pivot_result)
 
             input("按Enter键返回主菜单")
         elif choice == "5":
             print("退出程序")
             break
 
-# 运行主菜单
-main_menu()
\ No newline at end of file
+if __name__ == "__main__":
+    if len(sys.argv) > 1:
+        sys.exit(main())
+    # 运行主菜单
+    main_menu()
\ No newline at end of file
@@ -0,0 +1,298 @@
+"""
+Pypivot 的性能基准测试。
+
+用与 primary_data 相同的结构（S/N, Name, Gender, Age, Employment, Salary）生成任意规模的合成数据，
+分别计时各个阶段（load_data、load_table、透视聚合、写 CSV），报告每秒处理的行数、各阶段的峰值常驻内存
+（在新的子进程中只运行这个阶段及其输入，取子进程的峰值 RSS）和 Python 对象的峰值内存（tracemalloc），
+并与保存的基准结果比较：任何阶段明显变慢，或者输出内容发生变化，都以非零退出码失败。
+
+用法示例：
+    python Pypivot_bench.py --rows 10K 1M --save-baseline bench_baseline.json
+    python Pypivot_bench.py --rows 10K 1M --baseline bench_baseline.json
+"""
+import argparse
+import hashlib
+import json
+import multiprocessing
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import accumulate
+
+import Pypivot
+
+try:
+    import resource
+except ImportError:  # Windows 没有 resource 模块，不报告峰值常驻内存
+    resource = None
+
+# 行数的简写
+SIZES = {"10K": 10_000, "100K": 100_000, "1M": 1_000_000, "10M": 10_000_000}
+
+# 每批生成/写出的行数
+GENERATE_BATCH = 100_000
+
+# 基准中运行的透视规格：低基数维度，以及以 Name 为行的高基数维度
+PIVOT_SPECS = {
+    "gender_age_x_employment": (["Gender", "Age"], ["Employment"], "Salary", ["sum", "average", "count"]),
+    "name_x_gender": (["Name"], ["Gender"], "Salary", ["sum", "maximum"]),
+}
+
+STAGES = ("load_data", "load_table", "pivot", "write_csv")
+
+# 比较耗时时额外允许的绝对误差（秒），避免毫秒级的阶段因计时抖动而误报
+TIMING_SLACK = 0.01
+
+
+def _zipf_weights(n, skew):
+    """第 k 个取值的权重为 1 / k**skew；skew 为 0 时是均匀分布。"""
+    return list(accumulate(1.0 / (k ** skew) for k in range(1, n + 1)))
+
+
+def generate_dataset(file_path, rows, names=1000, ages=(18, 65), skew=1.0, seed=0):
+    """
+    生成与 primary_data 结构相同的合成 CSV 数据。
+
+    参数:
+        file_path (str): 输出文件的路径。
+        rows (int): 行数。
+        names (int): 不同 Name 的个数（行维度的基数）。
+        ages (tuple of int): Age 的取值范围（含两端）。
+        skew (float): 维度取值的 Zipf 偏斜程度，0 表示均匀分布。
+        seed (int): 随机种子，相同参数总是生成相同的文件。
+    """
+    rng = random.Random(seed)
+    first = [row["Name"] for row in Pypivot.primary_data]
+    name_values = [first[i % len(first)] + (str(i // len(first)) if i >= len(first) else "") for i in range(names)]
+    age_values = list(range(ages[0], ages[1] + 1))
+    genders = ["Male", "Female"]
+    employments = ["Employee", "Self-Employed", "Unemployed"]
+    name_weights = _zipf_weights(len(name_values), skew)
+    age_weights = _zipf_weights(len(age_values), skew)
+    employment_weights = _zipf_weights(len(employments), skew)
+
+    os.makedirs(os.path.dirname(file_path) or ".", exist_ok=True)
+    with open(file_path, "w", newline="") as file:
+        file.write("S/N,Name,Gender,Age,Employment,Salary\n")
+        for start in range(0, rows, GENERATE_BATCH):
+            n = min(GENERATE_BATCH, rows - start)
+            batch = zip(range(start + 1, start + n + 1),
+                        rng.choices(name_values, cum_weights=name_weights, k=n),
+                        rng.choices(genders, k=n),
+                        rng.choices(age_values, cum_weights=age_weights, k=n),
+                        rng.choices(employments, cum_weights=employment_weights, k=n),
+                        (rng.randrange(1000, 20000, 100) for _ in range(n)))
+            file.write("".join(f"{sn},{name},{gender},{age},{employment},{salary}\n"
+                               for sn, name, gender, age, employment, salary in batch))
+
+
+def _timed(func, repeat):
+    """运行 repeat 次，返回 (最短耗时, 最后一次的返回值)。"""
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        value = func()
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, value
+
+
+def _peak_memory(func):
+    """
+    在 Pypivot.collect_stats(trace_memory=True) 中再运行一次，返回这次运行中 Python 对象的峰值内存（字节）。
+
+    tracemalloc 会明显拖慢运行，所以计时的运行中不开启。
+    """
+    with Pypivot.collect_stats(trace_memory=True) as stats:
+        func()
+    return max((stage.peak_python for stage in stats.stages if stage.peak_python is not None), default=None)
+
+
+def _self_peak_rss():
+    """
+    本进程的峰值常驻内存（字节）。Linux 上读 /proc/self/status 的 VmHWM：子进程的 ru_maxrss
+    包含 fork 时父进程的常驻内存，exec 之后也不会清零，而 VmHWM 只统计本进程的地址空间。
+    """
+    try:
+        with open("/proc/self/status", encoding="ascii") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # 其它平台：macOS 上 ru_maxrss 的单位是字节，其余是 KB
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * (1 if sys.platform == "darwin" else 1024)
+
+
+def _run_stage(file_path, stage, spec_name, backend, output_file):
+    """（在子进程中）运行一个阶段和它需要的输入，返回本进程的峰值常驻内存（字节）。"""
+    if stage == "load_data":
+        Pypivot.load_data(file_path)
+    else:
+        table = Pypivot.load_table(file_path)
+        if stage != "load_table":
+            result = Pypivot.build_pivot(table, *PIVOT_SPECS[spec_name], backend=backend)
+            if stage == "write_csv":
+                Pypivot.render_pivot_csv(result, output_file)
+    return _self_peak_rss()
+
+
+def _peak_rss(file_path, stage, spec_name=None, backend="auto", output_file=None):
+    """
+    在一个新启动（spawn）的子进程中运行一个阶段，返回子进程的峰值常驻内存（字节）。
+
+    子进程只运行这个阶段和它需要的输入（如透视之前加载表），所以结果不受之前的阶段
+    在本进程中留下的内存影响；不支持 resource 模块的平台返回 None。
+    """
+    if resource is None:
+        return None
+    with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(_run_stage, file_path, stage, spec_name, backend, output_file).result()
+
+
+def run_benchmark(file_path, rows, stages=STAGES, repeat=1, backend="auto", output_dir=None, memory=True):
+    """
+    对一个数据文件运行所有阶段的计时。
+
+    参数:
+        file_path (str): 数据文件的路径。
+        rows (int): 数据行数（用于计算每秒行数）。
+        stages (iterable of str): 要运行的阶段。
+        repeat (int): 每个阶段重复的次数，取最短耗时。
+        backend (str): 透视聚合的后端（见 Pypivot.build_pivot）。
+        output_dir (str): 写 CSV 阶段的输出目录。
+        memory (bool): 是否额外运行各阶段，记录峰值常驻内存（见 _peak_rss）和 Python 对象的峰值内存
+            （见 _peak_memory）。
+
+    返回:
+        results (dict): {阶段名: {"seconds", "rows_per_sec", "peak_rss", "peak_python", ["sha256"]}}。
+    """
+    results = {}
+
+    def record(name, func, output_file=None):
+        seconds, value = _timed(func, repeat)
+        stage, _, spec_name = name.partition(":")
+        results[name] = dict(seconds=round(seconds, 6), rows_per_sec=round(rows / seconds) if seconds else None,
+                             peak_rss=_peak_rss(file_path, stage, spec_name, backend, output_file) if memory else None,
+                             peak_python=_peak_memory(func) if memory else None)
+        return value
+
+    if "load_data" in stages:
+        record("load_data", lambda: Pypivot.load_data(file_path))
+
+    if not set(stages) & {"load_table", "pivot", "write_csv"}:
+        return results
+    if "load_table" in stages:
+        table = record("load_table", lambda: Pypivot.load_table(file_path))
+    else:
+        table = Pypivot.load_table(file_path)
+
+    for spec_name, spec in PIVOT_SPECS.items():
+        def pivot(spec=spec):
+            return Pypivot.build_pivot(table, *spec, backend=backend)
+
+        if "pivot" in stages:
+            result = record(f"pivot:{spec_name}", pivot)
+            results[f"pivot:{spec_name}"]["cells"] = len(result.row_labels) * len(result.col_labels)
+        elif "write_csv" in stages:
+            result = pivot()
+        if "write_csv" in stages:
+            output_file = os.path.join(output_dir or tempfile.gettempdir(), f"bench_{spec_name}.csv")
+            record(f"write_csv:{spec_name}", lambda: Pypivot.render_pivot_csv(result, output_file), output_file)
+            with open(output_file, "rb") as file:
+                results[f"write_csv:{spec_name}"]["sha256"] = hashlib.sha256(file.read()).hexdigest()
+    return results
+
+
+def compare_to_baseline(results, baseline, tolerance):
+    """
+    与基准结果比较。
+
+    参数:
+        results (dict): {数据集名: run_benchmark 的结果}。
+        baseline (dict): 之前保存的同样结构的结果。
+        tolerance (float): 允许的变慢比例，如 0.5 表示耗时最多是基准的 1.5 倍。
+
+    返回:
+        failures (list of str): 退化的描述；为空表示通过。
+    """
+    failures = []
+    for dataset, stages in results.items():
+        for stage, current in stages.items():
+            expected = baseline.get("results", {}).get(dataset, {}).get(stage)
+            if expected is None:
+                continue
+            if expected.get("sha256") and current.get("sha256") != expected["sha256"]:
+                failures.append(f"{dataset} {stage}: 输出内容与基准不同")
+            if current["seconds"] > expected["seconds"] * (1 + tolerance) + TIMING_SLACK:
+                failures.append(f"{dataset} {stage}: {current['seconds']:.3f}s，基准为 {expected['seconds']:.3f}s "
+                                f"（慢了 {current['seconds'] / expected['seconds']:.2f} 倍）")
+    return failures
+
+
+def _format_bytes(size):
+    return "-" if size is None else f"{size / (1 << 20):.0f} MB"
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pypivot 性能基准测试")
+    parser.add_argument("--rows", nargs="+", default=["10K", "1M"],
+                        help="数据规模，如 10K 1M 10M 或具体行数")
+    parser.add_argument("--names", type=int, default=1000, help="Name 的基数")
+    parser.add_argument("--skew", type=float, default=1.0, help="维度取值的 Zipf 偏斜程度，0 为均匀分布")
+    parser.add_argument("--seed", type=int, default=0, help="随机种子")
+    parser.add_argument("--stages", nargs="+", choices=STAGES, default=list(STAGES), help="要运行的阶段")
+    parser.add_argument("--repeat", type=int, default=1, help="每个阶段重复的次数，取最短耗时")
+    parser.add_argument("--backend", choices=("auto", "python", "numpy"), default="auto", help="聚合后端")
+    parser.add_argument("--data-dir", default=os.path.join(tempfile.gettempdir(), "pypivot_bench"),
+                        help="生成的数据文件的目录（已存在时直接复用）")
+    parser.add_argument("--baseline", help="与这个基准结果文件比较，退化时以退出码 1 失败")
+    parser.add_argument("--save-baseline", help="把本次结果保存为基准文件")
+    parser.add_argument("--tolerance", type=float, default=0.5, help="允许的变慢比例（默认 0.5，即 1.5 倍）")
+    parser.add_argument("--no-memory", action="store_true",
+                        help="不额外运行各阶段来记录峰值内存（子进程中的运行和开启 tracemalloc 的运行都较慢）")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for size in args.rows:
+        rows = SIZES[size.upper()] if size.upper() in SIZES else int(size)
+        dataset = f"rows{rows}_names{args.names}_skew{args.skew}_seed{args.seed}"
+        file_path = os.path.join(args.data_dir, dataset + ".csv")
+        if not os.path.exists(file_path):
+            print(f"生成数据: {file_path}")
+            generate_dataset(file_path, rows, names=args.names, skew=args.skew, seed=args.seed)
+
+        results[dataset] = run_benchmark(file_path, rows, args.stages, args.repeat, args.backend, args.data_dir,
+                                         memory=not args.no_memory)
+        print(f"\n{dataset}")
+        print(f"{'阶段':<40}{'耗时(s)':>10}{'行/秒':>14}{'峰值RSS':>12}{'Python峰值':>12}")
+        for stage, stats in results[dataset].items():
+            print(f"{stage:<40}{stats['seconds']:>10.3f}{stats['rows_per_sec'] or 0:>14,}"
+                  f"{_format_bytes(stats['peak_rss']):>12}{_format_bytes(stats['peak_python']):>12}")
+
+    report = {"python": platform.python_version(), "platform": platform.platform(),
+              "numpy": Pypivot.numpy is not None, "results": results}
+    if args.save_baseline:
+        with open(args.save_baseline, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=2, ensure_ascii=False)
+        print(f"\n基准已保存到 {args.save_baseline}")
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as file:
+            baseline = json.load(file)
+        failures = compare_to_baseline(results, baseline, args.tolerance)
+        if failures:
+            print("\n性能退化：", file=sys.stderr)
+            for failure in failures:
+                print("  " + failure, file=sys.stderr)
+            return 1
+        print("\n与基准相比没有退化")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,385 @@
+"""
+Pypivot 的常驻透视服务。
+
+启动时把命名的数据集加载为内存中的 Table，之后每个查询只需要聚合，不再重新读取和解析 CSV。
+服务基于 asyncio，监听本地 HTTP 端口或 Unix 套接字；查询在线程池中执行，结果分块流式返回。
+
+接口:
+    GET  /datasets                 列出已加载的数据集。
+    POST /datasets/<名称>/reload    重新加载数据集；请求体可以是 {"path": ..., "schema": {...}, "indexes": [...]}，
+                                   用于修改数据源、索引列或注册新的数据集。
+    POST /pivot                    请求体是 JSON 透视规格：dataset、rows、columns、values、funcs（必需），
+                                   以及 filters、subtotals、backend、format（"csv"、"tsv"、"jsonl" 或 "json"）
+                                   和排序字段（见 Pypivot.ORDER_KEYS）。
+
+每个查询的排队时间和聚合时间在响应头 Server-Timing 中返回，并记录到标准错误输出。
+等待中和执行中的查询超过 --max-pending 时，新的查询立即以 503 拒绝，而不是无限排队。
+结果的第一块渲染成功后才发送 200 响应头；之后的渲染出错时不发送结束块而直接断开连接，
+客户端得到不完整的分块响应，不会把截断的结果当作完整的结果。
+
+用法示例:
+    python Pypivot_server.py --dataset people=Data/test_data_1.csv --port 8765
+    curl -d '{"dataset": "people", "rows": ["Gender"], "columns": ["Age"], "values": "Salary", "funcs": ["sum"]}' \\
+        http://127.0.0.1:8765/pivot
+"""
+import argparse
+import asyncio
+import json
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
+import Pypivot
+
+# 请求体的最大字节数
+MAX_BODY_BYTES = 1 << 20
+
+# 每次从渲染器取出并发送的行数
+STREAM_LINES = 1000
+
+# 透视规格中允许的字段
+SPEC_KEYS = {"dataset", "rows", "columns", "values", "funcs", "filters", "subtotals", "backend", "format",
+             *Pypivot.ORDER_KEYS}
+
+# 支持的输出格式及其 Content-Type；json 是整个结果一个 JSON 数组，其余格式见 Pypivot.OUTPUT_FORMATS
+CONTENT_TYPES = {"csv": "text/csv", "tsv": "text/tab-separated-values", "jsonl": "application/x-ndjson",
+                 "json": "application/json"}
+
+REASONS = {200: "OK", 400: "Bad Request", 404: "Not Found", 405: "Method Not Allowed", 413: "Payload Too Large",
+           500: "Internal Server Error", 503: "Service Unavailable"}
+
+
+class HTTPError(Exception):
+    """以指定状态码返回给客户端的错误。"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+
+
+class Dataset:
+    """
+    一个常驻内存的数据集。
+
+    属性:
+        name (str): 数据集名称。
+        path (str 或 list of str): 数据源（文件路径、glob 模式或文件列表）。
+        schema (dict): 显式指定的列类型。
+        indexes (list of str): 加载后建立位图索引的列（见 Pypivot.Table.create_index），用于带过滤条件的查询。
+        table (Pypivot.Table): 加载的数据；重新加载时整体替换，进行中的查询继续使用旧的表。
+        loaded_at (float): 加载完成的时间戳。
+        load_seconds (float): 加载耗时。
+    """
+
+    def __init__(self, name, path, schema=None, indexes=()):
+        self.name = name
+        self.path = path
+        self.schema = schema or {}
+        self.indexes = list(indexes)
+        self.table = None
+        self.loaded_at = None
+        self.load_seconds = None
+
+    def load(self):
+        """（在工作线程中）加载数据。单个文件使用二进制快照，重启服务时不需要重新解析。"""
+        start = time.perf_counter()
+        paths = Pypivot.expand_paths(self.path)
+        if len(paths) == 1:
+            table = Pypivot.load_table_snapshot(paths[0], schema=self.schema)
+        else:
+            table = Pypivot.load_table(paths, schema=self.schema)
+        for column in self.indexes:
+            table.create_index(column)
+        self.table = table
+        self.load_seconds = time.perf_counter() - start
+        self.loaded_at = time.time()
+        return self
+
+    def describe(self):
+        table = self.table
+        return {"name": self.name, "path": self.path, "rows": len(table) if table is not None else None,
+                "columns": table.columns if table is not None else None, "indexes": self.indexes,
+                "loaded_at": self.loaded_at,
+                "load_seconds": None if self.load_seconds is None else round(self.load_seconds, 6)}
+
+
+def run_query(table, spec):
+    """
+    （在工作线程中）对常驻的表执行一个透视规格。
+
+    返回:
+        result (Pypivot.PivotResult): 排序后的聚合结果。
+    """
+    # 过滤条件在有位图索引的列上直接由位图求出匹配的行（见 Pypivot.Table.select）
+    result = Pypivot.build_pivot(table, spec.get("rows", []), spec.get("columns", []), spec["values"], spec["funcs"],
+                                 backend=spec.get("backend", "auto"), filters=spec.get("filters", ()))
+    return Pypivot.order_by_spec(result, spec)
+
+
+def _encode_lines(lines, fmt, first):
+    """把一批输出行编码为 CSV/TSV/JSON Lines（见 Pypivot.OUTPUT_FORMATS），或 JSON 数组的一部分。"""
+    if fmt != "json":
+        return ("\n".join(map(Pypivot.OUTPUT_FORMATS[fmt], lines)) + "\n").encode()
+    return "".join(("" if first and i == 0 else ",\n") + json.dumps(line, ensure_ascii=False)
+                   for i, line in enumerate(lines)).encode()
+
+
+class PivotServer:
+    """
+    透视服务。
+
+    参数:
+        datasets (dict): {名称: Dataset}。
+        workers (int): 执行查询的线程数。
+        max_pending (int): 最多同时等待和执行的查询数，超过时以 503 拒绝。
+        log (file): 每个查询的计时日志，为 None 时不记录。
+        default_indexes (list of str): 通过 reload 注册的新数据集默认建立索引的列。
+    """
+
+    def __init__(self, datasets, workers=4, max_pending=64, log=sys.stderr, default_indexes=()):
+        self.datasets = dict(datasets)
+        self.default_indexes = list(default_indexes)
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="pivot")
+        self.max_pending = max_pending
+        self.pending = 0
+        self.log = log
+        self._reloading = {}
+
+    async def load_all(self):
+        loop = asyncio.get_running_loop()
+        await asyncio.gather(*(loop.run_in_executor(self.executor, dataset.load)
+                               for dataset in self.datasets.values()))
+
+    async def _run(self, func, *args):
+        """在线程池中执行；超出排队上限时拒绝。返回 (结果, 排队秒数, 执行秒数)。"""
+        if self.pending >= self.max_pending:
+            raise HTTPError(503, f"排队的查询已达上限 ({self.max_pending})")
+        self.pending += 1
+        queued = time.perf_counter()
+        started = []
+
+        def timed():
+            started.append(time.perf_counter())
+            return func(*args)
+
+        try:
+            value = await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+        finally:
+            self.pending -= 1
+        finished = time.perf_counter()
+        return value, started[0] - queued, finished - started[0]
+
+    async def handle(self, reader, writer):
+        """处理一个连接上的请求（支持 HTTP/1.1 keep-alive）。"""
+        try:
+            while True:
+                request = await self._read_request(reader, writer)
+                if request is None:
+                    break
+                method, path, headers, body = request
+                keep_alive = headers.get("connection", "").lower() != "close"
+                try:
+                    await self._dispatch(method, path, body, writer, keep_alive)
+                except ConnectionError:
+                    raise  # 连接已断开（或响应已发出一部分后中止），不能再发送错误响应
+                except HTTPError as e:
+                    await self._send_json(writer, e.status, {"error": str(e)}, keep_alive)
+                except (ValueError, KeyError, TypeError) as e:
+                    await self._send_json(writer, 400, {"error": f"{type(e).__name__}: {e}"}, keep_alive)
+                except Exception as e:
+                    await self._send_json(writer, 500, {"error": f"{type(e).__name__}: {e}"}, keep_alive)
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def _read_request(self, reader, writer):
+        line = await reader.readline()
+        if not line.strip():
+            return None
+        try:
+            method, path, _ = line.decode("latin-1").split()
+        except ValueError:
+            await self._send_json(writer, 400, {"error": "无效的请求行"}, False)
+            return None
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if not line.strip():
+                break
+            name, _, value = line.decode("latin-1").partition(":")
+            headers[name.strip().lower()] = value.strip()
+        try:
+            length = int(headers.get("content-length") or 0)
+            if length < 0:
+                raise ValueError(length)
+        except ValueError:
+            await self._send_json(writer, 400, {"error": "无效的 Content-Length"}, False)
+            return None
+        if length > MAX_BODY_BYTES:
+            await self._send_json(writer, 413, {"error": f"请求体超过 {MAX_BODY_BYTES} 字节"}, False)
+            return None
+        body = await reader.readexactly(length) if length else b""
+        return method, path.split("?", 1)[0], headers, body
+
+    async def _dispatch(self, method, path, body, writer, keep_alive):
+        parts = [part for part in path.split("/") if part]
+        if parts == ["datasets"]:
+            if method != "GET":
+                raise HTTPError(405, "只支持 GET")
+            await self._send_json(writer, 200, [d.describe() for d in self.datasets.values()], keep_alive)
+        elif len(parts) == 3 and parts[0] == "datasets" and parts[2] == "reload":
+            if method != "POST":
+                raise HTTPError(405, "只支持 POST")
+            await self._reload(parts[1], json.loads(body or b"{}"), writer, keep_alive)
+        elif parts == ["pivot"]:
+            if method != "POST":
+                raise HTTPError(405, "只支持 POST")
+            await self._pivot(json.loads(body or b"{}"), writer, keep_alive)
+        else:
+            raise HTTPError(404, f"未知的路径: {path}")
+
+    async def _reload(self, name, options, writer, keep_alive):
+        dataset = self.datasets.get(name)
+        if dataset is None and not options.get("path"):
+            raise HTTPError(404, f"未知的数据集: {name}（注册新的数据集需要 path）")
+        if name in self._reloading:
+            # 同一个数据集同时只重新加载一次，其它请求等待同一个结果
+            await self._reloading[name]
+        else:
+            candidate = Dataset(name, options.get("path") or dataset.path,
+                                options.get("schema", dataset.schema if dataset else None),
+                                options.get("indexes", dataset.indexes if dataset else self.default_indexes))
+            task = self._reloading[name] = asyncio.ensure_future(self._run(candidate.load))
+            try:
+                await task
+            finally:
+                del self._reloading[name]
+            # 加载成功后才替换，进行中的查询继续使用旧的表
+            self.datasets[name] = candidate
+        await self._send_json(writer, 200, self.datasets[name].describe(), keep_alive)
+
+    async def _pivot(self, spec, writer, keep_alive):
+        if not isinstance(spec, dict):
+            raise HTTPError(400, "透视规格必须是 JSON 对象")
+        missing = [key for key in ("dataset", "values", "funcs") if not spec.get(key)]
+        if missing:
+            raise HTTPError(400, f"透视规格缺少字段: {', '.join(missing)}")
+        unknown = set(spec) - SPEC_KEYS
+        if unknown:
+            raise HTTPError(400, f"未知的透视规格字段: {', '.join(sorted(unknown))}")
+        fmt = spec.get("format", "csv")
+        if fmt not in CONTENT_TYPES:
+            raise HTTPError(400, f"未知的输出格式: {fmt}（可选 {'、'.join(CONTENT_TYPES)}）")
+        dataset = self.datasets.get(spec["dataset"])
+        if dataset is None or dataset.table is None:
+            raise HTTPError(404, f"未知的数据集: {spec['dataset']}")
+
+        result, queue_seconds, pivot_seconds = await self._run(run_query, dataset.table, spec)
+
+        # 分块渲染和发送，大结果不需要整体放在内存中，也不会长时间占用事件循环
+        lines = Pypivot.pivot_lines(result, subtotals=spec.get("subtotals", False))
+        loop = asyncio.get_running_loop()
+
+        def next_batch():
+            return list(islice(lines, STREAM_LINES))
+
+        # 第一块渲染成功后才发送响应头，渲染出错时仍然可以返回错误状态码
+        batch = await loop.run_in_executor(self.executor, next_batch)
+        headers = {"Content-Type": CONTENT_TYPES[fmt] + "; charset=utf-8", "Transfer-Encoding": "chunked",
+                   "Server-Timing": f"queue;dur={queue_seconds * 1000:.3f}, pivot;dur={pivot_seconds * 1000:.3f}"}
+        self._write_head(writer, 200, headers, keep_alive)
+        if fmt == "json":
+            self._write_chunk(writer, b"[\n")
+        first, sent = True, 0
+        try:
+            while batch:
+                self._write_chunk(writer, _encode_lines(batch, fmt, first))
+                first = False
+                sent += len(batch)
+                await writer.drain()
+                batch = await loop.run_in_executor(self.executor, next_batch)
+        except Exception as e:
+            # 响应头已经发出：不发送结束块，直接断开连接
+            if self.log:
+                print(f"pivot dataset={dataset.name} aborted after {sent} lines: {type(e).__name__}: {e}",
+                      file=self.log)
+            writer.transport.abort()
+            raise ConnectionAbortedError(str(e)) from e
+        if fmt == "json":
+            self._write_chunk(writer, b"\n]\n")
+        writer.write(b"0\r\n\r\n")
+        await writer.drain()
+        if self.log:
+            print(f"pivot dataset={dataset.name} rows={len(result.row_labels)} lines={sent} "
+                  f"queue={queue_seconds * 1000:.1f}ms pivot={pivot_seconds * 1000:.1f}ms", file=self.log)
+
+    @staticmethod
+    def _write_head(writer, status, headers, keep_alive):
+        head = [f"HTTP/1.1 {status} {REASONS.get(status, '')}"]
+        head += [f"{name}: {value}" for name, value in headers.items()]
+        head.append("Connection: " + ("keep-alive" if keep_alive else "close"))
+        if status == 503:
+            head.append("Retry-After: 1")
+        writer.write(("\r\n".join(head) + "\r\n\r\n").encode("latin-1"))
+
+    @staticmethod
+    def _write_chunk(writer, data):
+        if data:
+            writer.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+
+    async def _send_json(self, writer, status, payload, keep_alive):
+        data = json.dumps(payload, ensure_ascii=False, default=str).encode()
+        self._write_head(writer, status, {"Content-Type": "application/json; charset=utf-8",
+                                          "Content-Length": len(data)}, keep_alive)
+        writer.write(data)
+        await writer.drain()
+
+
+def _parse_dataset(text):
+    name, sep, path = text.partition("=")
+    if not sep or not name or not path:
+        raise argparse.ArgumentTypeError("格式是 名称=路径")
+    return name, path
+
+
+async def serve(args):
+    server = PivotServer({name: Dataset(name, path, indexes=args.index) for name, path in args.dataset},
+                         workers=args.workers, max_pending=args.max_pending, default_indexes=args.index)
+    await server.load_all()
+    for dataset in server.datasets.values():
+        print(f"已加载 {dataset.name}: {len(dataset.table)} 行，{dataset.load_seconds:.2f}s", file=sys.stderr)
+    if args.unix:
+        listener = await asyncio.start_unix_server(server.handle, path=args.unix)
+        print(f"监听 {args.unix}", file=sys.stderr)
+    else:
+        listener = await asyncio.start_server(server.handle, args.host, args.port)
+        print(f"监听 http://{args.host}:{args.port}", file=sys.stderr)
+    async with listener:
+        await listener.serve_forever()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Pypivot 常驻透视服务")
+    parser.add_argument("--dataset", type=_parse_dataset, action="append", default=[], metavar="NAME=PATH",
+                        help="启动时加载的数据集，可重复使用；PATH 可以是 glob 模式")
+    parser.add_argument("--index", action="append", default=[], metavar="COLUMN",
+                        help="为各数据集的这一列建立位图索引（如 Gender、Employment），可重复使用")
+    parser.add_argument("--host", default="127.0.0.1", help="监听的地址")
+    parser.add_argument("--port", type=int, default=8765, help="监听的端口")
+    parser.add_argument("--unix", help="改为监听这个 Unix 套接字")
+    parser.add_argument("--workers", type=int, default=4, help="执行查询的线程数")
+    parser.add_argument("--max-pending", type=int, default=64, help="最多同时等待和执行的查询数")
+    args = parser.parse_args(argv)
+    try:
+        asyncio.run(serve(args))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
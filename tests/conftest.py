@@ -0,0 +1,51 @@
+import os
+import random
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import Pypivot  # noqa: E402
+import Pypivot_bench  # noqa: E402
+
+
+def result_cells(result):
+    """把 PivotResult 转换成 {(行键, 列键): 单元格的值}，与行的排列顺序无关。"""
+    cells = {}
+    for r, row_label in enumerate(result.row_labels):
+        for c, col_label in enumerate(result.col_labels):
+            values = result.cell(r, c)
+            if values is not None:
+                cells[row_label, col_label] = values
+    return cells
+
+
+@pytest.fixture
+def primary_csv(tmp_path):
+    """写入 primary_data 的 CSV 文件。"""
+    path = str(tmp_path / "primary.csv")
+    Pypivot.write_test_data(path)
+    return path
+
+
+@pytest.fixture(scope="session")
+def generated_csv(tmp_path_factory):
+    """由基准测试的生成器产生的 20000 行合成数据。"""
+    path = str(tmp_path_factory.mktemp("data") / "generated.csv")
+    Pypivot_bench.generate_dataset(path, 20000, names=200, seed=1)
+    return path
+
+
+@pytest.fixture(scope="session")
+def float_csv(tmp_path_factory):
+    """值字段是跨越多个数量级的非整数的数据：逐个相加的浮点和依赖相加的顺序。"""
+    path = str(tmp_path_factory.mktemp("data") / "float.csv")
+    rng = random.Random(5)
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("Name,Gender,Employment,Rate\n")
+        for _ in range(20000):
+            file.write(f"N{rng.randrange(100)},{rng.choice(['Female', 'Male'])},"
+                       f"{rng.choice(['Employee', 'Employer', 'Unemployed'])},"
+                       f"{rng.random() * 10 ** rng.randrange(-3, 8)!r}\n")
+    return path
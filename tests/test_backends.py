@@ -0,0 +1,31 @@
+import pytest
+
+import Pypivot
+
+SPECS = [
+    (["Gender", "Age"], ["Employment"], "Salary", ["sum", "average", "count"]),
+    (["Name"], ["Gender"], "Salary", ["sum", "minimum", "maximum"]),
+    (["Employment"], [], ["Salary", "Age"], [["sum", "median"], ["average", "distinct"]]),
+    ([], ["Gender"], "Salary", ["count"]),
+]
+
+
+@pytest.mark.parametrize("spec", SPECS)
+def test_python_and_numpy_output_identical(generated_csv, primary_csv, spec):
+    pytest.importorskip("numpy")
+    for path in (primary_csv, generated_csv):
+        table = Pypivot.load_table(path)
+        python = Pypivot.build_pivot(table, *spec, backend="python")
+        vectorized = Pypivot.build_pivot(table, *spec, backend="numpy")
+        assert python.row_labels == vectorized.row_labels
+        for subtotals in (False, True):
+            assert (list(Pypivot.pivot_lines(python, subtotals=subtotals))
+                    == list(Pypivot.pivot_lines(vectorized, subtotals=subtotals)))
+
+
+def test_rows_and_table_output_identical(primary_csv):
+    data, _ = Pypivot.load_data(primary_csv)
+    table = Pypivot.load_table(primary_csv)
+    for spec in SPECS:
+        assert (list(Pypivot.pivot_lines(Pypivot.build_pivot(data, *spec)))
+                == list(Pypivot.pivot_lines(Pypivot.build_pivot(table, *spec))))
@@ -0,0 +1,47 @@
+import random
+
+import pytest
+
+import Pypivot
+
+FILTERS = [
+    ["Gender == Female"],
+    ["Employment != Unemployed", "Age >= 40"],
+    ["Age in 18,19,20 or Employment == Self-Employed"],
+    [("Gender", "==", "Male"), ("Age", "<", 25), "Salary > 10000"],
+    ["Name == Albert or Name == Bob1"],
+    ["Age not in 30,31", "Gender != Male"],
+]
+
+
+@pytest.fixture(scope="module")
+def indexed(generated_csv):
+    table = Pypivot.load_table(generated_csv)
+    for column in ("Gender", "Employment", "Age"):
+        table.create_index(column)
+    return table
+
+
+@pytest.mark.parametrize("filters", FILTERS)
+def test_select_matches_loader_filters(generated_csv, indexed, filters):
+    loaded = Pypivot.load_table(generated_csv, filters=filters)
+    assert len(loaded) > 0
+    assert list(indexed.take(indexed.select(filters))) == list(loaded)
+    spec = (["Employment"], ["Gender"], "Salary", ["sum", "count"])
+    assert (list(Pypivot.pivot_lines(Pypivot.build_pivot(indexed, *spec, filters=filters)))
+            == list(Pypivot.pivot_lines(Pypivot.build_pivot(loaded, *spec))))
+
+
+def test_indexes_follow_mutations(primary_csv):
+    table = Pypivot.load_table(primary_csv)
+    table.create_index("Gender")
+    table.create_index("Age")
+    rng = random.Random(3)
+    for _ in range(100):
+        if rng.random() < 0.4:
+            table.delete_row(rng.randrange(len(table)))
+        else:
+            table.add_row(dict(rng.choice(Pypivot.primary_data), Age=rng.randrange(18, 30)))
+        filters = ["Gender == Female", "Age >= 23"]
+        expected = [i for i, row in enumerate(table) if row["Gender"] == "Female" and row["Age"] >= 23]
+        assert table.select(filters) == expected
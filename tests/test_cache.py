@@ -0,0 +1,39 @@
+import Pypivot
+from conftest import result_cells
+
+
+def test_file_and_table_pivots_agree(primary_csv):
+    cache = Pypivot.PivotCache()
+    spec = (["Employment"], ["Age"], "Salary", ["sum", "average", "maximum"])
+    from_file = cache.pivot(primary_csv, *spec)
+    from_table = Pypivot.build_pivot(Pypivot.load_table(primary_csv), *spec)
+    assert from_file.col_labels == from_table.col_labels == sorted({(row["Age"],) for row in Pypivot.primary_data})
+    assert result_cells(from_file) == result_cells(from_table)
+    assert list(Pypivot.pivot_lines(from_file)) == list(Pypivot.pivot_lines(from_table))
+    assert cache.pivot(primary_csv, *spec) is from_file and cache.hits == 1
+
+
+def test_table_change_invalidates(primary_csv):
+    cache = Pypivot.PivotCache()
+    table = Pypivot.load_table(primary_csv)
+    first = cache.pivot(table, ["Gender"], [], "Salary", ["sum"])
+    table.delete_row(0)
+    second = cache.pivot(table, ["Gender"], [], "Salary", ["sum"])
+    assert second is not first and cache.invalidations == 1
+
+
+def test_glob_and_path_list_inputs(tmp_path):
+    first, second = str(tmp_path / "part-1.csv"), str(tmp_path / "part-2.csv")
+    Pypivot.write_test_data(first)
+    Pypivot.write_test_data(second)
+    cache = Pypivot.PivotCache()
+    spec = (["Employment"], ["Gender"], "Salary", ["sum", "count"])
+    from_glob = cache.pivot(str(tmp_path / "part-*.csv"), *spec)
+    assert result_cells(from_glob) == result_cells(Pypivot.build_pivot(Pypivot.load_table([first, second]), *spec))
+    assert cache.pivot([first, second], *spec) is from_glob and cache.hits == 1
+
+    third = str(tmp_path / "part-3.csv")
+    Pypivot.write_test_data(third)
+    grown = cache.pivot(str(tmp_path / "part-*.csv"), *spec)
+    assert grown is not from_glob
+    assert sum(cells[0]["count"] for cells in result_cells(grown).values()) == 3 * len(Pypivot.primary_data)
@@ -0,0 +1,62 @@
+import csv
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+import Pypivot
+
+SCRIPT = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "Pypivot.py")
+
+
+def _args(path, output):
+    return [path, "--rows", "Gender", "--columns", "Employment", "--values", "Salary", "--funcs", "sum",
+            "--output", output, "--no-snapshot"]
+
+
+def test_import_has_no_side_effects(tmp_path):
+    # 不读标准输入（没有菜单），不写任何文件，不打印任何内容
+    completed = subprocess.run([sys.executable, "-c", "import sys; sys.path.insert(0, sys.argv[1]); import Pypivot",
+                                os.path.dirname(SCRIPT)], cwd=tmp_path, stdin=subprocess.DEVNULL,
+                               capture_output=True, text=True, timeout=60)
+    assert completed.returncode == 0 and completed.stdout == "" and completed.stderr == ""
+    assert os.listdir(tmp_path) == []
+
+
+def test_main_returns_exit_codes(primary_csv, tmp_path, capsys):
+    output = str(tmp_path / "out.csv")
+    assert Pypivot.main(_args(primary_csv, output)) == 0
+    with open(output, newline="", encoding="utf-8") as file:
+        expected = Pypivot.build_pivot(Pypivot.load_table(primary_csv), ["Gender"], ["Employment"], "Salary", ["sum"])
+        assert list(csv.reader(file)) == Pypivot.pivot_to_rows(expected)
+
+    assert Pypivot.main(_args(str(tmp_path / "missing.csv"), output)) == 1
+    assert "missing.csv" in capsys.readouterr().err
+    with pytest.raises(SystemExit) as exc:
+        Pypivot.main([primary_csv, "--rows", "Gender"])
+    assert exc.value.code == 2
+
+
+def test_spec_list_runs_every_spec(primary_csv, tmp_path, capsys):
+    good = {"input": primary_csv, "rows": ["Gender"], "values": "Salary", "funcs": ["count"],
+            "output": str(tmp_path / "good.csv"), "snapshot": False}
+    specs = [dict(good, values="Nope"), good, dict(good, funcs=["no-such-func"])]
+    spec_path = tmp_path / "specs.json"
+    spec_path.write_text(json.dumps(specs), encoding="utf-8")
+    # 失败的规格不影响其它规格，但退出码非零
+    assert Pypivot.main(["--spec", str(spec_path)]) == 1
+    assert os.path.exists(good["output"])
+    assert capsys.readouterr().err.count("透视失败") == 2
+    spec_path.write_text(json.dumps(good), encoding="utf-8")
+    assert Pypivot.main(["--spec", str(spec_path)]) == 0
+
+
+def test_script_exit_status(primary_csv, tmp_path):
+    def run(args):
+        return subprocess.run([sys.executable, SCRIPT] + args, cwd=tmp_path, stdin=subprocess.DEVNULL,
+                              capture_output=True, text=True, timeout=60).returncode
+
+    assert run(_args(primary_csv, str(tmp_path / "out.csv"))) == 0
+    assert run(_args(str(tmp_path / "missing.csv"), str(tmp_path / "out.csv"))) == 1
@@ -0,0 +1,68 @@
+import builtins
+
+import Pypivot
+
+
+def _pages(result, monkeypatch, capsys, answers, **kwargs):
+    answers = iter(answers)
+
+    def answer(prompt=""):
+        print(prompt)
+        return next(answers, "q")
+
+    monkeypatch.setattr(builtins, "input", answer)
+    Pypivot.page_pivot_console(result, **kwargs)
+    return capsys.readouterr().out.splitlines()
+
+
+def _split_pages(lines):
+    pages, current = [], []
+    for line in lines:
+        if line.startswith("-- "):
+            pages.append(current)
+            current = []
+        else:
+            current.append(line)
+    pages.append(current)
+    return [page for page in pages if page]
+
+
+def test_pages_align_with_growing_widths(generated_csv, monkeypatch, capsys):
+    table = Pypivot.load_table(generated_csv)
+    result = Pypivot.build_pivot(table, ["Name"], ["Gender", "Employment"], "Salary", ["sum", "count", "maximum"])
+    # 第一页只有短的行，之后的页上有更长的值；列宽随取出的行放宽，每页内各列仍然对齐
+    result = Pypivot.sort_rows(result, by="sum")
+    pages = _split_pages(_pages(result, monkeypatch, capsys, ["", ">", "", "<", "", "q"], page_rows=5, width=80))
+    header_lines = len(result.col_keys) + 1
+    # 依次是：第 1、2 页，向右滚动后的第 2、3 页，向左滚动后的第 3、4 页
+    assert len(pages) == 6
+    for page in pages:
+        body_width = len(page[header_lines - 1])
+        assert all(len(line) == body_width for line in page[header_lines:])
+        assert all(len(line) <= 80 for line in page)
+    # 列宽只增不减：同一个列窗口中，后显示的页的表头不比先显示的窄
+    label_width = [page[header_lines - 1].index("  ") for page in pages]
+    assert label_width == sorted(label_width)
+
+
+def test_pager_measures_only_the_visible_rows(generated_csv, monkeypatch, capsys):
+    table = Pypivot.load_table(generated_csv)
+    result = Pypivot.build_pivot(table, ["Name"], ["Gender"], "Salary", ["sum"])
+    measured = []
+    display_width = Pypivot._display_width
+
+    def counting_width(text):
+        measured.append(text)
+        return display_width(text)
+
+    # 只测量、对齐表头、当前页和预读的下一页的单元格，而不是整张表
+    monkeypatch.setattr(Pypivot, "_display_width", counting_width)
+    _pages(result, monkeypatch, capsys, ["q"], page_rows=5, width=80)
+    n_columns = len(result.row_keys) + len(result.col_labels) + 1
+    assert len(measured) <= 2 * (len(result.col_keys) + 1 + 2 * 5) * n_columns < len(result.row_labels)
+
+
+def test_single_page_prints_everything(primary_csv, monkeypatch, capsys):
+    result = Pypivot.build_pivot(Pypivot.load_table(primary_csv), ["Gender"], ["Employment"], "Salary", ["sum"])
+    lines = _pages(result, monkeypatch, capsys, [], page_rows=50, width=200)
+    assert len(lines) == len(list(Pypivot.pivot_lines(result)))
@@ -0,0 +1,50 @@
+import csv
+import gzip
+
+import pytest
+
+import Pypivot
+
+HEADER = ["Name", "Note", "Salary"]
+ROWS = [
+    ["Smith, John", "plain", "100"],
+    ['Ann "Nan" Lee', "says \"hi\", twice", "200"],
+    ["Bob", "first line\nsecond line", "300"],
+    ["Eve", "windows\r\nbreak", "400"],
+    ["", "", "500"],
+    ["Zed", ",\n\"", "600"],
+    ["Max", "last", "700"],
+]
+
+
+def _write(path, opener=open):
+    with opener(path, "wt", newline="", encoding="utf-8") as file:
+        writer = csv.writer(file, lineterminator="\r\n")
+        writer.writerow(HEADER)
+        writer.writerows(ROWS[:3])
+        file.write("\r\n")  # 空行被跳过
+        writer.writerows(ROWS[3:])
+
+
+@pytest.mark.parametrize("suffix", [".csv", ".csv.gz"])
+def test_quoted_fields_survive_batch_boundaries(tmp_path, suffix):
+    path = str(tmp_path / ("quoted" + suffix))
+    _write(path, gzip.open if suffix.endswith(".gz") else open)
+    for batch_size in (1, 2, 3, 4, len(ROWS), 100):
+        batches = list(Pypivot.iter_csv_batches(path, batch_size=batch_size, as_dict=False))
+        assert [len(batch) for batch in batches[:-1]] == [batch_size] * (len(batches) - 1)
+        assert [row for batch in batches for row in batch] == ROWS, batch_size
+        assert (list(Pypivot.iter_csv_rows(path, batch_size=batch_size))
+                == [dict(zip(HEADER, row)) for row in ROWS])
+
+    data, columns = Pypivot.load_data(path)
+    assert columns == HEADER and [row["Note"] for row in data] == [row[1] for row in ROWS]
+    assert [row["Salary"] for row in data] == [int(row[2]) for row in ROWS]
+    assert list(Pypivot.load_table(path, batch_size=2).column("Name")) == [row[0] for row in ROWS]
+
+
+def test_batch_size_must_be_positive(tmp_path):
+    path = str(tmp_path / "quoted.csv")
+    _write(path)
+    with pytest.raises(ValueError):
+        next(Pypivot.iter_csv_batches(path, batch_size=0))
@@ -0,0 +1,49 @@
+import pytest
+
+import Pypivot
+
+SPECS = [
+    (["Gender"], ["Employment"], "Salary", ["sum", "count", "minimum"]),
+    (["Name", "Gender"], ["Employment", "Age"], "Salary", ["sum", "average"]),
+    ([], ["Age"], ["Salary", "Age"], [["sum"], ["maximum", "distinct"]]),
+]
+
+
+def test_dict_column_codes_follow_first_appearance():
+    column = Pypivot.DictColumn(["b", "a", "b", "c"])
+    assert list(column.codes) == [0, 1, 0, 2] and column.labels == ["b", "a", "c"]
+    column.append("a")
+    column.append("d")
+    assert list(column.codes)[-2:] == [1, 3] and column.labels == ["b", "a", "c", "d"]
+    assert list(column) == ["b", "a", "b", "c", "a", "d"] and column[3] == "c"
+
+
+def test_numeric_dimensions_are_encoded_once(primary_csv):
+    table = Pypivot.load_table(primary_csv)
+    codes, labels = table.encoding("Age")
+    assert [labels[code] for code in codes] == list(table.column("Age"))
+    assert table.encoding("Age")[0] is codes
+    # 修改表后缓存失效，重新编码
+    table.add_row(dict(table.row(0), Age=99))
+    assert table.encoding("Age")[0] is not codes and 99 in table.encoding("Age")[1]
+    # dimensions 参数在加载时预先编码
+    assert "Age" in Pypivot.load_table(primary_csv, dimensions=["Age"])._encodings
+
+
+@pytest.mark.parametrize("spec", SPECS)
+def test_encoded_grouping_matches_row_path(generated_csv, spec):
+    table = Pypivot.load_table(generated_csv)
+    encoded = Pypivot._build_pivot_encoded(table, *spec[:2], Pypivot.normalize_measures(*spec[2:]))
+    assert encoded is not None
+    rows = Pypivot.build_pivot(list(table), *spec)
+    assert encoded.row_labels == rows.row_labels and encoded.col_labels == rows.col_labels
+    assert list(Pypivot.pivot_lines(encoded)) == list(Pypivot.pivot_lines(rows))
+
+
+def test_sparse_dimensions_fall_back_to_row_path(generated_csv, monkeypatch):
+    table = Pypivot.load_table(generated_csv)
+    spec = SPECS[1]
+    expected = list(Pypivot.pivot_lines(Pypivot.build_pivot(list(table), *spec)))
+    monkeypatch.setattr(Pypivot, "DENSE_CELL_FACTOR", 0)
+    assert Pypivot._build_pivot_encoded(table, *spec[:2], Pypivot.normalize_measures(*spec[2:])) is None
+    assert list(Pypivot.pivot_lines(Pypivot.build_pivot(table, *spec, backend="python"))) == expected
@@ -0,0 +1,51 @@
+import Pypivot
+
+SPEC = (["Name"], ["Gender", "Employment"], "Salary", ["sum", "count", "average", "maximum"])
+
+
+def _in_memory(path, tmp_path):
+    expected = str(tmp_path / "memory.csv")
+    Pypivot.render_pivot_csv(Pypivot.build_pivot(Pypivot.load_table(path), *SPEC), expected)
+    with open(expected) as file:
+        return file.read()
+
+
+def test_without_spill_matches_in_memory(generated_csv, tmp_path):
+    output = str(tmp_path / "external.csv")
+    assert Pypivot.external_pivot_csv(generated_csv, *SPEC, output) == 0
+    with open(output) as file:
+        assert file.read() == _in_memory(generated_csv, tmp_path)
+
+
+def test_spilled_matches_in_memory(generated_csv, tmp_path, monkeypatch):
+    # 每个段都很小、归并的扇入为 4，强制多遍归并
+    monkeypatch.setattr(Pypivot, "_MERGE_FAN_IN", 4)
+    opened = []
+    open_runs = [0]
+    read_records = Pypivot._read_records
+
+    def counting_read(path):
+        open_runs[0] += 1
+        opened.append(open_runs[0])
+        try:
+            yield from read_records(path)
+        finally:
+            open_runs[0] -= 1
+
+    monkeypatch.setattr(Pypivot, "_read_records", counting_read)
+    output = str(tmp_path / "external.csv")
+    spills = Pypivot.external_pivot_csv(generated_csv, *SPEC, output, memory_budget=20000, temp_dir=str(tmp_path))
+    assert spills > 1
+    assert max(opened) <= 4
+    with open(output) as file:
+        assert file.read() == _in_memory(generated_csv, tmp_path)
+
+
+def test_spilled_float_sums_match_in_memory(float_csv, tmp_path):
+    spec = (["Name"], ["Gender", "Employment"], "Rate", ["sum", "average"])
+    expected = str(tmp_path / "memory.csv")
+    Pypivot.render_pivot_csv(Pypivot.build_pivot(Pypivot.load_table(float_csv), *spec), expected)
+    output = str(tmp_path / "external.csv")
+    assert Pypivot.external_pivot_csv(float_csv, *spec, output, memory_budget=20000, temp_dir=str(tmp_path)) > 1
+    with open(output) as file, open(expected) as memory:
+        assert file.read() == memory.read()
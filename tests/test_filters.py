@@ -0,0 +1,76 @@
+import csv
+
+import pytest
+
+import Pypivot
+
+# (过滤条件, 对原始文本行的参考判断)
+CASES = [
+    (["Gender == Female"], lambda row: row["Gender"] == "Female"),
+    (["Age >= 25", "Employment != Unemployed"], lambda row: int(row["Age"]) >= 25 and row["Employment"] != "Unemployed"),
+    (["Employment == Self-Employed or Age < 22"],
+     lambda row: row["Employment"] == "Self-Employed" or int(row["Age"]) < 22),
+    ([[("Age", "in", (21, 30)), ("Name", "==", "Bob")]], lambda row: row["Age"] in ("21", "30") or row["Name"] == "Bob"),
+    (["Age not in 21,22,23"], lambda row: row["Age"] not in ("21", "22", "23")),
+    # 数字按数值比较，加引号的值按文本比较：10000 > 5000 按数值成立，按文本不成立
+    ([("Salary", ">", 5000)], lambda row: int(row["Salary"]) > 5000),
+    (['Salary > "5000"'], lambda row: row["Salary"] > "5000"),
+]
+
+
+def _raw_rows(path):
+    with open(path, newline="", encoding="utf-8") as file:
+        return list(csv.DictReader(file))
+
+
+def test_parse_filter():
+    assert Pypivot.parse_filter("Age >= 25") == ("Age", ">=", 25)
+    assert Pypivot.parse_filter("Salary < 1.5") == ("Salary", "<", 1.5)
+    assert Pypivot.parse_filter('Employment == "Employee"') == ("Employment", "==", "Employee")
+    assert Pypivot.parse_filter("Age not in 21, 22") == ("Age", "not in", (21, 22))
+    assert Pypivot.normalize_filter("Age < 3 or Name == Bob") == [("Age", "<", 3), ("Name", "==", "Bob")]
+    with pytest.raises(ValueError):
+        Pypivot.parse_filter("Age")
+    with pytest.raises(ValueError):
+        Pypivot.normalize_filter(("Age", "~", 3))
+
+
+@pytest.mark.parametrize("filters, predicate", CASES)
+def test_loader_filters_match_reference(primary_csv, filters, predicate):
+    expected = [row for row in _raw_rows(primary_csv) if predicate(row)]
+    assert expected  # 每个条件都至少选中一行
+    assert list(Pypivot.iter_csv_rows(primary_csv, batch_size=3, filters=filters)) == expected
+    data, _ = Pypivot.load_data(primary_csv, filters=filters, infer_types=False)
+    assert data == expected
+    table = Pypivot.load_table(primary_csv, filters=filters)
+    assert [row["S/N"] for row in table] == [int(row["S/N"]) for row in expected]
+    # 加载后用同样的条件过滤，结果相同
+    full = Pypivot.load_table(primary_csv)
+    assert list(full.take(full.select(filters))) == list(table)
+
+
+def test_projection_keeps_requested_columns_in_order(primary_csv):
+    raw = _raw_rows(primary_csv)
+    columns = ["Salary", "Gender"]
+    batches = list(Pypivot.iter_csv_batches(primary_csv, batch_size=7, as_dict=False, columns=columns,
+                                            filters=["Age >= 25"]))
+    assert [len(batch) for batch in batches] == [7, 3]
+    assert [values for batch in batches for values in batch] == [
+        [row["Salary"], row["Gender"]] for row in raw if int(row["Age"]) >= 25]
+    data, loaded_columns = Pypivot.load_data(primary_csv, columns=columns)
+    assert loaded_columns == columns and list(data[0]) == columns
+    assert Pypivot.load_table(primary_csv, columns=columns).columns == columns
+
+
+def test_short_rows_and_unknown_columns(tmp_path):
+    path = str(tmp_path / "short.csv")
+    with open(path, "w", encoding="utf-8") as file:
+        file.write("A,B,C\n1,x,5\n2,y\n\n3,z,7\n")
+    assert list(Pypivot.iter_csv_batches(path, as_dict=False, columns=["C", "A"])) == [[["5", "1"], ["", "2"], ["7", "3"]]]
+    # 缺失的值按空字符串比较
+    assert [row["A"] for row in Pypivot.iter_csv_rows(path, filters=["C == ''"])] == ["2"]
+    assert [row["A"] for row in Pypivot.iter_csv_rows(path, filters=["C > 6"])] == ["3"]
+    with pytest.raises(KeyError):
+        list(Pypivot.iter_csv_rows(path, columns=["A", "D"]))
+    with pytest.raises(KeyError):
+        Pypivot.load_data(path, filters=["D == 1"])
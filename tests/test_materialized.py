@@ -0,0 +1,86 @@
+import random
+
+import pytest
+
+import Pypivot
+from conftest import result_cells
+
+FUNCS = ["sum", "count", "average", "minimum", "maximum", "distinct"]
+
+
+def _table(path):
+    return Pypivot.load_table(path)
+
+
+def _rebuild(table):
+    return Pypivot.build_pivot(table, ["Employment"], ["Gender", "Age"], "Salary", FUNCS)
+
+
+def test_random_add_delete_matches_rebuild(primary_csv):
+    table = _table(primary_csv)
+    pivot = Pypivot.MaterializedPivot(table, ["Employment"], ["Gender", "Age"], "Salary", FUNCS)
+    rng = random.Random(7)
+    rows = list(Pypivot.primary_data)
+    for step in range(200):
+        if len(table) > 1 and rng.random() < 0.45:
+            table.delete_row(rng.randrange(len(table)))
+        else:
+            row = dict(rng.choice(rows))
+            row["Salary"] = rng.randrange(500, 15000)
+            table.add_row(row)
+        if step % 20 == 0:
+            assert result_cells(pivot.result()) == result_cells(_rebuild(table))
+    assert result_cells(pivot.result()) == result_cells(_rebuild(table))
+    assert pivot.total() == Pypivot.MaterializedPivot(table, ["Employment"], ["Gender", "Age"], "Salary",
+                                                      FUNCS).total()
+
+
+def test_retyped_dimension_triggers_rebuild(primary_csv):
+    table = _table(primary_csv)
+    pivot = Pypivot.MaterializedPivot(table, ["Employment"], ["Age"], "Salary", FUNCS)
+    events = []
+    table.subscribe(lambda event, *args: events.append((event, args)))
+    table.add_row({"S/N": 21, "Name": "Vera", "Gender": "Female", "Age": "", "Employment": "Employee",
+                   "Salary": 3000})
+    assert events[-1][0] == "add_row" and events[-1][1][2] == ("Age",)
+    result = pivot.result()
+    assert all(isinstance(label[0], str) for label in result.col_labels)
+    assert result_cells(result) == result_cells(
+        Pypivot.build_pivot(table, ["Employment"], ["Age"], "Salary", FUNCS))
+
+
+def test_stale_cells_recomputed_without_rescanning(primary_csv, monkeypatch):
+    table = _table(primary_csv)
+    pivot = Pypivot.MaterializedPivot(table, ["Employment"], ["Gender"], "Salary", FUNCS)
+
+    def no_scan(*args):
+        raise AssertionError("stale cells should not rescan the table")
+
+    monkeypatch.setattr(Pypivot, "_iter_pivot_inputs", no_scan)
+    for _ in range(5):
+        table.delete_row(0)
+    result = pivot.result()
+    monkeypatch.undo()
+    assert result_cells(result) == result_cells(
+        Pypivot.build_pivot(table, ["Employment"], ["Gender"], "Salary", FUNCS))
+
+
+def test_deleted_field_stops_tracking_and_other_listeners_run(primary_csv):
+    table = _table(primary_csv)
+    pivot = Pypivot.MaterializedPivot(table, ["Employment"], ["Gender"], "Salary", FUNCS)
+    cache = Pypivot.PivotCache()
+    cache.pivot(table, ["Employment"], ["Gender"], "Age", ["sum"])
+    table.delete_column("Salary")
+    assert not pivot.valid
+    table.add_row(dict(Pypivot.primary_data[0]))
+    assert len(cache) == 0
+
+    def failing(event, *args):
+        raise RuntimeError("listener failed")
+
+    calls = []
+    table.subscribe(failing)
+    table.subscribe(lambda event, *args: calls.append(event))
+    with pytest.raises(RuntimeError):
+        table.delete_row(0)
+    assert calls == ["delete_row"]
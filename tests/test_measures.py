@@ -0,0 +1,54 @@
+import pytest
+
+import Pypivot
+from conftest import result_cells
+
+ROWS, COLS = ["Gender"], ["Employment", "Age"]
+HEADER = len(COLS)  # 每个列分组字段一行表头，之后一行是值列的标题
+VALUES = ["Salary", "Age", "Name"]
+FUNCS = [["sum", "count", "minimum"], "average", ["distinct"]]
+
+
+def _builders(path):
+    table = Pypivot.load_table(path)
+    builders = {
+        "rows": lambda *spec: Pypivot.build_pivot(list(table), *spec),
+        "python": lambda *spec: Pypivot.build_pivot(table, *spec, backend="python"),
+        "parallel": lambda *spec: Pypivot.parallel_build_pivot(path, *spec, workers=2),
+        "materialized": lambda *spec: Pypivot.MaterializedPivot(table, *spec).result(),
+    }
+    if Pypivot.numpy is not None:
+        builders["numpy"] = lambda *spec: Pypivot.build_pivot(table, *spec, backend="numpy")
+    return builders
+
+
+def test_multi_measure_matches_single_measure_pivots(generated_csv):
+    for name, build in _builders(generated_csv).items():
+        combined = build(ROWS, COLS, VALUES, FUNCS)
+        lines = list(Pypivot.pivot_lines(combined))
+        value_columns = combined.value_columns
+        assert [header for _, _, header in value_columns] == lines[HEADER][1:len(value_columns) + 1]
+        for k, (m, func, header) in enumerate(value_columns):
+            single = build(ROWS, COLS, VALUES[m], [func])
+            assert single.row_labels == combined.row_labels and single.col_labels == combined.col_labels, name
+            # 合并结果中每个列标签后面依次是每个 (值字段, 聚合函数) 的列，总计列也一样
+            single_lines = list(Pypivot.pivot_lines(single))[HEADER + 1:]
+            assert len(single_lines) == len(lines) - HEADER - 1
+            for line, single_line in zip(lines[HEADER + 1:], single_lines):
+                assert line[0] == single_line[0]
+                assert line[1 + k::len(value_columns)] == single_line[1:], (name, header)
+            cells = result_cells(single)
+            assert ({key: values[m][func] for key, values in result_cells(combined).items()}
+                    == {key: values[0][func] for key, values in cells.items()}), (name, header)
+
+
+def test_single_measure_headers_unchanged(primary_csv):
+    result = Pypivot.build_pivot(Pypivot.load_table(primary_csv), ROWS, COLS, "Salary", ["sum", "count"])
+    assert list(Pypivot.pivot_lines(result))[HEADER][1:3] == ["sum", "count"]
+
+
+def test_measures_and_functions_must_pair_up():
+    assert Pypivot.normalize_measures(["Salary", "Age"], [["sum"], "count"]) == [
+        ("Salary", ("sum",)), ("Age", ("count",))]
+    with pytest.raises(ValueError):
+        Pypivot.normalize_measures(["Salary", "Age"], [["sum"]])
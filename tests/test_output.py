@@ -0,0 +1,35 @@
+import csv
+import re
+
+import Pypivot
+
+AWKWARD = ['Smith, John', 'say "hi"', 'two\nlines', 'tab\there', 'back\\slash']
+
+
+def _result():
+    data = [{"Name": name, "Gender": gender, "Salary": salary}
+            for name in AWKWARD for gender, salary in (("Female", 1000), ("Male", 2500))]
+    return Pypivot.build_pivot(data, ["Name"], ["Gender"], "Salary", ["sum"])
+
+
+def test_csv_output_quotes_special_fields(tmp_path):
+    result = _result()
+    path = str(tmp_path / "pivot.csv")
+    lines = Pypivot.render_pivot_file(result, path)
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = list(csv.reader(f))
+    assert rows == [list(line) for line in Pypivot.pivot_lines(result)] and len(rows) == lines
+
+
+def test_tsv_output_escapes_tabs_and_newlines(tmp_path):
+    result = _result()
+    path = str(tmp_path / "pivot.tsv")
+    Pypivot.render_pivot_file(result, path)
+    with open(path, newline="", encoding="utf-8") as f:
+        rows = f.read().split("\n")[:-1]
+    expected = list(Pypivot.pivot_lines(result))
+    assert len(rows) == len(expected)
+    unescape = {"t": "\t", "n": "\n", "r": "\r", "\\": "\\"}
+    for row, line in zip(rows, expected):
+        fields = row.split("\t")
+        assert [re.sub(r"\\(.)", lambda m: unescape[m.group(1)], field) for field in fields] == line
@@ -0,0 +1,67 @@
+import bz2
+import gzip
+import lzma
+from fractions import Fraction
+
+import Pypivot
+from conftest import result_cells
+
+SPEC = (["Name"], ["Gender", "Employment"], "Salary", ["sum", "count", "average", "maximum"])
+OPENERS = [open, gzip.open, bz2.open, lzma.open]
+SUFFIXES = ["", ".gz", ".bz2", ".xz"]
+
+
+def _lines(result):
+    return list(Pypivot.pivot_lines(result))
+
+
+def _split(path, directory):
+    """把文件按行切成四个分片（未压缩、gz、bz2、xz），每个分片都带表头。"""
+    with open(path, "rb") as file:
+        header, *rows = file.readlines()
+    size = -(-len(rows) // len(OPENERS))
+    for i, (opener, suffix) in enumerate(zip(OPENERS, SUFFIXES)):
+        with opener(str(directory / f"part-{i}.csv{suffix}"), "wb") as file:
+            file.write(header)
+            file.writelines(rows[i * size:(i + 1) * size])
+    return str(directory / "part-*.csv*")
+
+
+def test_serial_parallel_and_multi_file_identical(generated_csv, tmp_path):
+    serial = _lines(Pypivot.build_pivot(Pypivot.load_table(generated_csv), *SPEC))
+    assert _lines(Pypivot.parallel_build_pivot(generated_csv, *SPEC, workers=1)) == serial
+    assert _lines(Pypivot.parallel_build_pivot(generated_csv, *SPEC, workers=3)) == serial
+
+    pattern = _split(generated_csv, tmp_path)
+    assert len(Pypivot.expand_paths(pattern)) == 4
+    assert _lines(Pypivot.build_pivot(Pypivot.load_table(pattern), *SPEC)) == serial
+    assert _lines(Pypivot.parallel_build_pivot(pattern, *SPEC, workers=3)) == serial
+
+
+def test_parallel_filters_match_loader(generated_csv):
+    filters = ["Age >= 30", ("Employment", "!=", "Unemployed")]
+    loaded = Pypivot.load_table(generated_csv, filters=filters)
+    assert len(loaded) < 20000
+    assert (_lines(Pypivot.parallel_build_pivot(generated_csv, *SPEC, workers=2, filters=filters))
+            == _lines(Pypivot.build_pivot(loaded, *SPEC)))
+
+
+def test_float_sums_exact_and_partition_independent(float_csv):
+    spec = (["Name"], ["Gender", "Employment"], "Rate", ["sum", "average"])
+    table = Pypivot.load_table(float_csv)
+    serial = Pypivot.build_pivot(table, *spec, backend="python")
+    assert _lines(Pypivot.build_pivot(table, *spec, backend="auto")) == _lines(serial)
+    assert _lines(Pypivot.build_pivot(Pypivot.load_data(float_csv)[0], *spec)) == _lines(serial)
+    for workers in (2, 3):
+        assert _lines(Pypivot.parallel_build_pivot(float_csv, *spec, workers=workers)) == _lines(serial)
+
+    # 每个单元格的和是精确和的正确舍入，总计是单元格的和的精确和的正确舍入
+    exact = {}
+    for row in Pypivot.load_data(float_csv, infer_types=False)[0]:
+        key = ((row["Name"],), (row["Gender"], row["Employment"]))
+        exact[key] = exact.get(key, 0) + Fraction(float(row["Rate"]))
+    cells = result_cells(serial)
+    assert {key: values[0]["sum"] for key, values in cells.items()} == {
+        key: float(total) for key, total in exact.items()}
+    grand_total = Pypivot._column_totals(serial)[1][0][0]
+    assert grand_total == float(sum(map(Fraction, (values[0]["sum"] for values in cells.values()))))
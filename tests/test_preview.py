@@ -0,0 +1,40 @@
+import Pypivot
+from conftest import result_cells
+
+SPEC = (["Gender"], ["Employment"], "Salary", ["count", "sum", "average"])
+
+
+def _grand_total(preview, func):
+    state, squares = preview._group((), ())[(), ()]
+    return preview.estimate(0, func, state[0], squares[0])
+
+
+def test_last_level_is_exact(generated_csv):
+    table = Pypivot.load_table(generated_csv)
+    previews = list(Pypivot.preview_pivot(table, *SPEC, fractions=(0.05, 0.5, 1.0), seed=3))
+    assert previews[-1].exact and not previews[0].exact
+    assert result_cells(previews[-1].result) == result_cells(Pypivot.build_pivot(table, *SPEC))
+
+
+def test_file_intervals_cover_exact_totals(generated_csv):
+    table = Pypivot.load_table(generated_csv)
+    exact = Pypivot._grouping_states(Pypivot.build_pivot(table, *SPEC), (), ())[(), ()][0]
+    hits = {"count": 0, "sum": 0, "average": 0}
+    runs = 40
+    for seed in range(runs):
+        preview = next(Pypivot.preview_pivot(generated_csv, *SPEC, seed=seed))
+        assert not preview.exact
+        truth = {"count": len(table), "sum": exact[0], "average": exact[0] / exact[1]}
+        for func in hits:
+            value, half_width = _grand_total(preview, func)
+            # 文件的总行数是估计值，总计不能显示成宽度为 0 的区间
+            assert half_width > 0
+            hits[func] += abs(value - truth[func]) <= half_width
+    assert all(hit >= 0.8 * runs for hit in hits.values()), hits
+
+
+def test_table_grand_count_is_known(generated_csv):
+    table = Pypivot.load_table(generated_csv)
+    preview = next(Pypivot.preview_pivot(table, *SPEC, seed=0))
+    assert not preview.exact
+    assert _grand_total(preview, "count") == (len(table), 0.0)
@@ -0,0 +1,38 @@
+import csv
+
+import Pypivot
+
+SPEC = (["Employment"], ["Gender", "Age"], "Salary", ["sum", "average"])
+
+
+def test_file_console_and_rows_render_the_same_result(primary_csv, tmp_path, capsys):
+    result = Pypivot.build_pivot(Pypivot.load_table(primary_csv), *SPEC)
+    rows = Pypivot.pivot_to_rows(result)
+    # 不是每个 (Employment, Gender, Age) 组合都有数据，空单元格也要一致
+    assert any(cell == " " for row in rows for cell in row)
+
+    path = str(tmp_path / "pivot.csv")
+    Pypivot.render_pivot_csv(result, path)
+    with open(path, newline="", encoding="utf-8") as file:
+        assert list(csv.reader(file)) == rows
+
+    # 控制台渲染器把空单元格显示为 None
+    Pypivot.render_pivot_console(result, pager=False)
+    printed = [line.split(",") for line in capsys.readouterr().out.splitlines()]
+    assert printed == [["None" if cell == " " else cell for cell in row] for row in rows]
+
+
+def test_legacy_entry_points_share_the_engine(primary_csv, tmp_path, capsys, monkeypatch):
+    data, _ = Pypivot.load_data(primary_csv)
+    calls = []
+    build_pivot = Pypivot.build_pivot
+    monkeypatch.setattr(Pypivot, "build_pivot", lambda *args, **kwargs: calls.append(args) or build_pivot(*args))
+
+    path = str(tmp_path / "pivot.csv")
+    Pypivot.generate_pivot_table_no_csv(data, *SPEC, path)
+    Pypivot.generate_pivot_table_console(data, *SPEC)
+    assert len(calls) == 2
+    with open(path, newline="", encoding="utf-8") as file:
+        written = list(csv.reader(file))
+    printed = [line.split(",") for line in capsys.readouterr().out.splitlines()]
+    assert printed == [["None" if cell == " " else cell for cell in row] for row in written]
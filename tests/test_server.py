@@ -0,0 +1,146 @@
+import asyncio
+import json
+import threading
+
+import Pypivot
+import Pypivot_server
+
+SPEC = {"dataset": "people", "rows": ["Gender"], "columns": ["Employment"], "values": "Salary", "funcs": ["sum"]}
+
+
+def _serve(datasets, client, **kwargs):
+    """在本进程中启动服务，在同一个事件循环中运行 client(server, port)。"""
+    async def main():
+        server = Pypivot_server.PivotServer(datasets, log=None, **kwargs)
+        await server.load_all()
+        listener = await asyncio.start_server(server.handle, "127.0.0.1", 0)
+        async with listener:
+            try:
+                return await client(server, listener.sockets[0].getsockname()[1])
+            finally:
+                server.executor.shutdown(wait=False)
+
+    return asyncio.run(main())
+
+
+async def _request(port, method, path, body=b"", headers=None):
+    """发送一个请求，读到连接关闭为止。返回 (状态码, 响应头, 响应体, 分块响应是否完整)。"""
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    if headers is None:
+        headers = {"Content-Length": str(len(body))}
+    head = [f"{method} {path} HTTP/1.1", "Host: localhost", "Connection: close"]
+    head += [f"{name}: {value}" for name, value in headers.items()]
+    writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + body)
+    data = await reader.read()
+    writer.close()
+
+    head, _, rest = data.partition(b"\r\n\r\n")
+    status_line, *header_lines = head.decode("latin-1").split("\r\n")
+    response_headers = {name.lower(): value.strip() for name, _, value in
+                        (line.partition(":") for line in header_lines)}
+    if response_headers.get("transfer-encoding") != "chunked":
+        return int(status_line.split()[1]), response_headers, rest, True
+    body, complete = b"", False
+    while rest:
+        size, _, rest = rest.partition(b"\r\n")
+        size = int(size, 16)
+        if size == 0:
+            complete = True
+            break
+        body, rest = body + rest[:size], rest[size + 2:]
+    return int(status_line.split()[1]), response_headers, body, complete
+
+
+def _datasets(path):
+    return {"people": Pypivot_server.Dataset("people", path)}
+
+
+def test_pivot_streams_the_rendered_lines(primary_csv):
+    async def client(server, port):
+        return await _request(port, "POST", "/pivot", json.dumps(dict(SPEC, format="tsv")).encode())
+
+    status, headers, body, complete = _serve(_datasets(primary_csv), client)
+    expected = Pypivot.build_pivot(Pypivot.load_table(primary_csv), ["Gender"], ["Employment"], "Salary", ["sum"])
+    assert status == 200 and complete and "server-timing" in headers
+    assert body.decode().splitlines() == ["\t".join(line) for line in Pypivot.pivot_lines(expected)]
+
+
+def test_full_queue_is_rejected_with_503(primary_csv, monkeypatch):
+    release = threading.Event()
+    run_query = Pypivot_server.run_query
+
+    def blocking_query(table, spec):
+        release.wait(10)
+        return run_query(table, spec)
+
+    monkeypatch.setattr(Pypivot_server, "run_query", blocking_query)
+
+    async def client(server, port):
+        first = asyncio.ensure_future(_request(port, "POST", "/pivot", json.dumps(SPEC).encode()))
+        while server.pending < 1:
+            await asyncio.sleep(0.01)
+        rejected = await _request(port, "POST", "/pivot", json.dumps(SPEC).encode())
+        release.set()
+        return rejected, await first
+
+    rejected, first = _serve(_datasets(primary_csv), client, max_pending=1)
+    assert rejected[0] == 503 and rejected[1]["retry-after"] == "1"
+    assert first[0] == 200 and first[3]
+
+
+def test_reload_registers_and_replaces_datasets(primary_csv, tmp_path):
+    other = str(tmp_path / "other.csv")
+    with open(other, "w", encoding="utf-8") as file:
+        file.write("Gender,Employment,Salary\nFemale,Employee,100\n")
+
+    async def client(server, port):
+        added = await _request(port, "POST", "/datasets/other/reload", json.dumps({"path": other}).encode())
+        listed = await _request(port, "GET", "/datasets")
+        pivot = await _request(port, "POST", "/pivot", json.dumps(dict(SPEC, dataset="other")).encode())
+        unknown = await _request(port, "POST", "/datasets/missing/reload", b"{}")
+        return added, listed, pivot, unknown
+
+    added, listed, pivot, unknown = _serve(_datasets(primary_csv), client)
+    assert added[0] == 200 and json.loads(added[2])["rows"] == 1
+    assert [dataset["name"] for dataset in json.loads(listed[2])] == ["people", "other"]
+    assert pivot[0] == 200 and pivot[2].decode().splitlines()[2] == "Female,100.0,100.0"
+    assert unknown[0] == 404
+
+
+def test_bad_requests_get_error_status(primary_csv):
+    async def client(server, port):
+        return [
+            await _request(port, "POST", "/pivot", b"{}", {"Content-Length": "abc"}),
+            await _request(port, "POST", "/pivot", b"{not json"),
+            await _request(port, "POST", "/pivot", json.dumps(dict(SPEC, colour="red")).encode()),
+            await _request(port, "POST", "/pivot", json.dumps(dict(SPEC, dataset="nobody")).encode()),
+            await _request(port, "POST", "/pivot", json.dumps(dict(SPEC, funcs=["no-such-func"])).encode()),
+            await _request(port, "GET", "/pivot"),
+        ]
+
+    statuses = [response[0] for response in _serve(_datasets(primary_csv), client)]
+    assert statuses == [400, 400, 400, 404, 400, 405]
+
+
+def test_render_errors_are_not_sent_as_complete_results(primary_csv, monkeypatch):
+    pivot_lines = Pypivot.pivot_lines
+
+    def failing_lines(result, subtotals, fail_after):
+        for i, line in enumerate(pivot_lines(result, subtotals=subtotals)):
+            if i == fail_after:
+                raise RuntimeError("render failed")
+            yield line
+
+    async def client(server, port):
+        return await _request(port, "POST", "/pivot", json.dumps(SPEC).encode())
+
+    # 第一块就出错：还没有发送响应头，返回错误状态码
+    monkeypatch.setattr(Pypivot, "pivot_lines", lambda result, subtotals=False: failing_lines(result, subtotals, 0))
+    status, _, body, _ = _serve(_datasets(primary_csv), client)
+    assert status == 500 and "render failed" in json.loads(body)["error"]
+
+    # 之后的块出错：响应头已经发出，分块响应没有结束块
+    monkeypatch.setattr(Pypivot_server, "STREAM_LINES", 1)
+    monkeypatch.setattr(Pypivot, "pivot_lines", lambda result, subtotals=False: failing_lines(result, subtotals, 2))
+    status, _, body, complete = _serve(_datasets(primary_csv), client)
+    assert status == 200 and not complete and body.count(b"\n") == 2
@@ -0,0 +1,58 @@
+import bisect
+import random
+import statistics
+
+import Pypivot
+
+
+def _merged(sketch_type, values, parts=8):
+    sketches = [sketch_type() for _ in range(parts)]
+    for i, value in enumerate(values):
+        sketches[i % parts].add(value)
+    merged = sketches[0]
+    for sketch in sketches[1:]:
+        merged.merge(sketch)
+    return merged
+
+
+def test_tdigest_small_inputs_are_exact():
+    values = [7, 1, 9, 3, 5, 2, 8]
+    digest = Pypivot.TDigest()
+    for value in values:
+        digest.add(value)
+    assert digest.quantile(0.5) == statistics.median(values)
+
+
+def test_tdigest_rank_error():
+    rng = random.Random(5)
+    values = [rng.lognormvariate(8, 1) for _ in range(50000)]
+    ordered = sorted(values)
+    for digest in (_merged(Pypivot.TDigest, values, 1), _merged(Pypivot.TDigest, values)):
+        for q in (0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99):
+            rank = bisect.bisect_left(ordered, digest.quantile(q)) / len(ordered)
+            assert abs(rank - q) < 0.01, (q, rank)
+
+
+def test_hyperloglog_error():
+    hll = _merged(Pypivot.HyperLogLog, range(20))
+    assert hll.cardinality() == 20
+    # precision=10 的标准误差约为 1.04 / sqrt(1024) ≈ 3.3%，允许 3 倍
+    for n in (1000, 100000):
+        values = [f"name{i}" for i in range(n)] * 2
+        single = _merged(Pypivot.HyperLogLog, values, 1)
+        merged = _merged(Pypivot.HyperLogLog, values)
+        assert merged.registers == single.registers
+        assert abs(merged.cardinality() - n) / n < 0.1
+
+
+def test_pivot_median_and_distinct(generated_csv):
+    table = Pypivot.load_table(generated_csv)
+    result = Pypivot.build_pivot(table, ["Gender"], [], ["Salary", "Name"], [["median"], ["distinct"]])
+    for r, (gender,) in enumerate(result.row_labels):
+        rows = [row for row in table if row["Gender"] == gender]
+        salaries = sorted(row["Salary"] for row in rows)
+        median, distinct = result.cell(r, 0)
+        rank = bisect.bisect_left(salaries, median["median"]) / len(salaries)
+        assert abs(rank - 0.5) < 0.02
+        names = len({row["Name"] for row in rows})
+        assert abs(distinct["distinct"] - names) / names < 0.1
@@ -0,0 +1,50 @@
+import os
+
+import pytest
+
+import Pypivot
+from conftest import result_cells
+
+SPEC = (["Employment"], ["Gender", "Age"], "Salary", ["sum", "count"])
+
+
+def _expected(path):
+    return result_cells(Pypivot.build_pivot(Pypivot.load_table(path), *SPEC))
+
+
+def test_snapshot_roundtrip(primary_csv, tmp_path):
+    snapshot = str(tmp_path / "data.pvsnap")
+    Pypivot.load_table_snapshot(primary_csv, snapshot)
+    table = Pypivot.load_table_snapshot(primary_csv, snapshot)
+    assert isinstance(table.column("Salary"), memoryview)
+    assert result_cells(Pypivot.build_pivot(table, *SPEC)) == _expected(primary_csv)
+
+
+@pytest.mark.parametrize("damage", ["truncate_data", "truncate_header", "garble_header", "empty"])
+def test_corrupt_snapshot_is_rebuilt(primary_csv, tmp_path, damage):
+    snapshot = str(tmp_path / "data.pvsnap")
+    Pypivot.load_table_snapshot(primary_csv, snapshot)
+    with open(snapshot, "rb") as file:
+        content = file.read()
+    header_end = len(Pypivot.SNAPSHOT_MAGIC) + 8
+    damaged = {
+        "truncate_data": content[:len(content) - 64],
+        "truncate_header": content[:header_end + 10],
+        "garble_header": content[:header_end] + b"{\xff" + content[header_end + 2:],
+        "empty": b"",
+    }[damage]
+    with open(snapshot, "wb") as file:
+        file.write(damaged)
+    table = Pypivot.load_table_snapshot(primary_csv, snapshot)
+    assert result_cells(Pypivot.build_pivot(table, *SPEC)) == _expected(primary_csv)
+    # 损坏的快照已被新的快照覆盖
+    assert os.path.getsize(snapshot) == len(content)
+    assert isinstance(Pypivot.load_table_snapshot(primary_csv, snapshot).column("Salary"), memoryview)
+
+
+def test_foreign_file_is_not_overwritten(primary_csv, tmp_path):
+    other = tmp_path / "notes.txt"
+    other.write_text("not a snapshot")
+    with pytest.raises(ValueError):
+        Pypivot.load_table_snapshot(primary_csv, str(other))
+    assert other.read_text() == "not a snapshot"
@@ -0,0 +1,53 @@
+import pytest
+
+import Pypivot
+
+ROWS = [("A", "x", 10), ("B", "x", 5), ("B", "y", 15), ("C", "y", 10), ("D", "x", 30), ("E", "y", 20), ("F", "y", 1)]
+
+
+@pytest.fixture
+def result():
+    data = [{"Name": name, "Kind": kind, "Amount": amount} for name, kind, amount in ROWS]
+    return Pypivot.build_pivot(data, ["Name"], ["Kind"], "Amount", ["sum", "count"])
+
+
+def _names(result):
+    return [label[0] for label in result.row_labels]
+
+
+def test_sort_by_row_total_is_stable(result):
+    # B 与 E、A 与 C 的总计相同，保持原来的顺序
+    assert _names(Pypivot.sort_rows(result, by="sum", descending=True)) == list("DBEACF")
+    assert _names(Pypivot.sort_rows(result, by="sum")) == list("FACBED")
+    assert _names(Pypivot.sort_rows(result, by="count", descending=True)) == list("BACDEF")
+    assert _names(Pypivot.sort_rows(result, by="label", descending=True)) == list("FEDCBA")
+
+
+def test_sort_by_column_puts_missing_values_last(result):
+    assert _names(Pypivot.sort_rows(result, by="sum", column="x", descending=True)) == list("DABCEF")
+    assert _names(Pypivot.sort_rows(result, by="sum", column=["x"])) == list("BADCEF")
+
+
+def test_top_and_bottom_match_full_sort(result):
+    for descending in (False, True):
+        ordered = _names(Pypivot.sort_rows(result, by="sum", descending=descending))
+        for limit in range(len(ordered) + 2):
+            assert _names(Pypivot.sort_rows(result, by="sum", descending=descending, limit=limit)) == ordered[:limit]
+
+
+def test_total_line_uses_kept_rows(result):
+    lines = list(Pypivot.pivot_lines(Pypivot.order_by_spec(result, {"top": 3})))
+    assert [line[0] for line in lines[2:]] == ["D", "B", "E", "Total"]
+    assert lines[-1] == ["Total", "35.0", "2", "35.0", "2", "70.0", "4"]
+    bottom = Pypivot.order_by_spec(result, {"bottom": 2})
+    assert _names(bottom) == ["F", "A"]
+
+
+def test_invalid_orderings_are_rejected(result):
+    with pytest.raises(ValueError):
+        Pypivot.sort_rows(result, by="median")
+    with pytest.raises(ValueError):
+        Pypivot.sort_rows(result, by="sum", column="z")
+    with pytest.raises(ValueError):
+        Pypivot.order_by_spec(result, {"top": 2, "bottom": 2})
+    assert Pypivot.order_by_spec(result, {}) is result
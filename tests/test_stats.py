@@ -0,0 +1,32 @@
+import Pypivot
+import Pypivot_bench
+
+
+def test_nested_stage_keeps_outer_python_peak():
+    with Pypivot.collect_stats(trace_memory=True) as stats:
+        outer = Pypivot._active_stats.begin("outer")
+        block = [0] * 1_000_000
+        del block
+        inner = Pypivot._active_stats.begin("inner")
+        small = [0] * 1000
+        inner.finish()
+        del small
+        outer.finish()
+    assert outer.peak_python >= 8_000_000 > inner.peak_python
+    assert [stage.name for stage in stats.stages] == ["outer", "inner"]
+
+
+def test_stages_record_counts(primary_csv):
+    with Pypivot.collect_stats(trace_memory=True) as stats:
+        Pypivot.load_table(primary_csv)
+    stage, = stats.stages
+    assert stage.name == "load_table" and stage.rows == len(Pypivot.primary_data)
+    assert stage.peak_python > 0
+
+
+def test_bench_measures_stage_rss_in_a_fresh_process(primary_csv):
+    results = Pypivot_bench.run_benchmark(primary_csv, len(Pypivot.primary_data), stages=("load_table",))
+    stats = results["load_table"]
+    if Pypivot_bench.resource is not None:
+        # 子进程的峰值 RSS 包括解释器本身，总是大于这一阶段的 Python 对象峰值
+        assert stats["peak_rss"] > stats["peak_python"] > 0
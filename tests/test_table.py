@@ -0,0 +1,52 @@
+import pytest
+
+import Pypivot
+
+
+def test_table_matches_loaded_rows(primary_csv):
+    table = Pypivot.load_table(primary_csv)
+    data, columns = Pypivot.load_data(primary_csv)
+    assert table.columns == columns and len(table) == len(data)
+    assert list(table) == data and table.row(3) == data[3]
+    # 数值列是类型化的 array，文本列是字典编码的 DictColumn
+    assert Pypivot._typecode(table.column("Age")) == "q"
+    assert isinstance(table.column("Name"), Pypivot.DictColumn)
+    assert len(table.column("Gender").labels) == 2
+
+
+def test_column_and_row_mutations(primary_csv):
+    table = Pypivot.load_table(primary_csv)
+    n = len(table)
+    table.add_column("Index")
+    table.add_column("Country", "NZ")
+    assert list(table.column("Index")) == list(range(1, n + 1))
+    assert set(table.column("Country")) == {"NZ"}
+    with pytest.raises(ValueError):
+        table.add_column("Country")
+
+    table.delete_column("S/N")
+    assert "S/N" not in table.columns and table.columns[-2:] == ["Index", "Country"]
+    with pytest.raises(KeyError):
+        table.delete_column("S/N")
+
+    row = dict(table.row(0), Name="Zed", Age=40)
+    table.add_row(row)
+    assert len(table) == n + 1 and table.row(n) == row
+    table.delete_row(0)
+    assert len(table) == n and table.row(n - 1) == row
+    with pytest.raises(IndexError):
+        table.delete_row(n)
+    with pytest.raises(ValueError):
+        table.add_row([1, 2])
+
+
+def test_pivot_sees_mutations(primary_csv):
+    table = Pypivot.load_table(primary_csv)
+    spec = (["Gender"], ["Age"], "Salary", ["sum", "count"])
+    Pypivot.build_pivot(table, *spec)  # 建立 Age 的编码缓存
+    table.add_row(dict(table.row(0), Age=99, Salary=1))
+    table.delete_row(1)
+    rows = list(table)
+    assert (list(Pypivot.pivot_lines(Pypivot.build_pivot(table, *spec)))
+            == list(Pypivot.pivot_lines(Pypivot.build_pivot(rows, *spec))))
+    assert table.version == 2
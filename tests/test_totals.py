@@ -0,0 +1,54 @@
+import pytest
+
+import Pypivot
+from conftest import result_cells
+
+ROWS, COLS = ["Gender", "Employment"], ["Age"]
+FUNCS = ["sum", "count", "average", "minimum", "maximum", "distinct", "median"]
+
+
+@pytest.mark.parametrize("cube", [False, True])
+def test_grouping_sets_match_direct_pivots(primary_csv, cube):
+    data, _ = Pypivot.load_data(primary_csv)
+    sets = Pypivot.grouping_sets(Pypivot.build_pivot(data, ROWS, COLS, "Salary", FUNCS), cube=cube)
+    if cube:
+        assert len(sets) == 4 * 2 and (("Employment",), ()) in sets
+    else:
+        assert list(sets) == [(("Gender", "Employment"), ("Age",)), (("Gender", "Employment"), ()),
+                              (("Gender",), ("Age",)), (("Gender",), ()), ((), ("Age",)), ((), ())]
+    for (row_keys, col_keys), cells in sets.items():
+        direct = Pypivot.build_pivot(data, list(row_keys), list(col_keys), "Salary", FUNCS)
+        assert cells == result_cells(direct), (row_keys, col_keys)
+
+
+def test_subtotals_merge_states_instead_of_adding_values(primary_csv):
+    data, _ = Pypivot.load_data(primary_csv)
+    result = Pypivot.build_pivot(data, ROWS, [], "Salary", ["average", "count"])
+    lines = Pypivot.pivot_lines(result, subtotals=True)
+    totals = {line[0]: line[-2:] for line in lines if line[0].endswith("Total")}
+
+    def expected(rows):
+        salaries = [row["Salary"] for row in rows]
+        return [str(sum(salaries) / len(salaries)), str(len(salaries))]
+
+    for gender in ("Male", "Female"):
+        assert totals[f"{gender} Total"] == expected([row for row in data if row["Gender"] == gender])
+    assert totals["Total"] == expected(data)
+    # 平均值的总计不是各行平均值之和
+    row_averages = [float(line[2]) for line in Pypivot.pivot_lines(result) if line[0] == "Male"]
+    assert float(totals["Male Total"][0]) != sum(row_averages)
+
+
+def test_subtotal_rows_follow_each_group(primary_csv):
+    result = Pypivot.build_pivot(Pypivot.load_table(primary_csv), ROWS, COLS, "Salary", ["sum"])
+    lines = list(Pypivot.pivot_lines(result, subtotals=True))
+    body = lines[2:]
+    labels = [line[0] for line in body]
+    assert labels.index("Male Total") == 1 + max(i for i, label in enumerate(labels) if label == "Male")
+    assert labels[-2:] == ["Female Total", "Total"]
+    # 不带小计时的行和总计不变
+    plain = list(Pypivot.pivot_lines(result))
+    assert [line for line in body if not line[0].endswith(" Total")] == plain[2:]
+    # 不输出总计时也不输出小计
+    assert (list(Pypivot.pivot_lines(result, totals=False, subtotals=True))
+            == list(Pypivot.pivot_lines(result, totals=False)))
@@ -0,0 +1,52 @@
+import pytest
+
+import Pypivot
+
+
+def test_add_row_rejects_value_for_declared_type(primary_csv):
+    table = Pypivot.load_table(primary_csv, schema={"Age": "int"})
+    version = table.version
+    with pytest.raises(ValueError, match="Age"):
+        table.add_row({"S/N": 21, "Name": "Vera", "Gender": "Female", "Age": "", "Employment": "Employee",
+                       "Salary": 3000})
+    assert len(table) == len(Pypivot.primary_data) and table.version == version
+    assert all(isinstance(age, int) for age in table.column("Age"))
+
+
+def test_add_row_reports_widened_column(primary_csv):
+    table = Pypivot.load_table(primary_csv)
+    table.create_index("Age")
+    events = []
+    table.subscribe(lambda event, *args: events.append(args))
+    table.add_row({"S/N": 21, "Name": "Vera", "Gender": "Female", "Age": 30.5, "Employment": "Employee",
+                   "Salary": 3000})
+    assert events[-1][2] == ("Age",)
+    assert table.select(["Age == 30.5"]) == [len(table) - 1]
+    table.add_row({"S/N": 22, "Name": "Wendy", "Gender": "Female", "Age": 31, "Employment": "Employee",
+                   "Salary": 3000})
+    assert events[-1][2] == ()
+
+
+def test_snapshot_keeps_declared_types(primary_csv, tmp_path):
+    snapshot = str(tmp_path / "primary.pvsnap")
+    Pypivot.load_table_snapshot(primary_csv, snapshot, schema={"Age": "int"})
+    table = Pypivot.load_table_snapshot(primary_csv, snapshot, schema={"Age": "int"})
+    assert table.schema == {"Age": "int"}
+    with pytest.raises(ValueError):
+        table.add_row(dict(Pypivot.primary_data[0], Age="unknown"))
+
+
+def test_interactive_add_row_parses_list_values(primary_csv, monkeypatch):
+    data, columns = Pypivot.load_data(primary_csv)
+    answers = iter(["21", "Vera", "Female", "30", "Employee", "3000"])
+    monkeypatch.setattr("builtins.input", lambda prompt="": next(answers))
+    Pypivot.add_row(data)
+    assert data[-1]["Age"] == 30 and data[-1]["Salary"] == 3000
+    result = Pypivot.build_pivot(data, ["Name"], ["Age"], "Salary", ["sum"])
+    assert (30,) in result.col_labels
+
+    answers = iter(["22", "Wendy", "Female", "unknown", "Employee", "3000"])
+    Pypivot.add_row(data)
+    assert {type(row["Age"]) for row in data} == {str}
+    result = Pypivot.build_pivot(data, ["Name"], ["Age"], "Salary", ["sum"])
+    assert ("unknown",) in result.col_labels